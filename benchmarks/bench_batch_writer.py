@@ -0,0 +1,97 @@
+"""
+Бенчмарк сохранения всплеска постов: отдельная транзакция на каждый пост
+(как save_post раньше) против общей транзакции через db.writer.BatchWriter.
+
+Воркеры доставки одновременно сохраняют посты и отмечают доставку
+(UPDATE file_id), как при всплеске сообщений из каналов.
+
+Запуск из корня проекта:
+    python -m benchmarks.bench_batch_writer [воркеров] [постов на воркера]
+"""
+import asyncio
+import os
+import sys
+import tempfile
+import time
+from datetime import datetime
+
+from sqlalchemy import event, update
+from sqlalchemy.exc import OperationalError
+from sqlalchemy.ext.asyncio import create_async_engine, async_sessionmaker
+
+from db.models import Base, Post, apply_pragmas
+from db.posts import upsert_post_stmt
+from db.writer import BatchWriter
+
+
+def _post(worker: int, index: int):
+    return upsert_post_stmt(
+        chat_id=worker,
+        message_id=index,
+        content_type="photo",
+        text="Текст поста " * 40,
+        original_date=datetime.now()
+    )
+
+
+async def _direct(Session, worker: int, posts: int, errors: list):
+    for index in range(posts):
+        try:
+            async with Session() as session:
+                post = (await session.scalars(_post(worker, index))).one()
+                await session.commit()
+            async with Session() as session:
+                await session.execute(update(Post).where(Post.id == post.id).values(file_id="file"))
+                await session.commit()
+        except OperationalError as e:
+            errors.append(e)
+
+
+async def _batched(writer: BatchWriter, worker: int, posts: int):
+    for index in range(posts):
+        async def save(session):
+            return (await session.scalars(_post(worker, index))).one()
+
+        post = await writer.submit(save)
+
+        async def mark(session):
+            await session.execute(update(Post).where(Post.id == post.id).values(file_id="file"))
+
+        await writer.submit(mark)
+
+
+async def bench(title: str, batched: bool, workers: int, posts: int):
+    with tempfile.TemporaryDirectory() as directory:
+        engine = create_async_engine(f"sqlite+aiosqlite:///{os.path.join(directory, 'bench.db')}",
+                                     pool_size=workers)
+        event.listen(engine.sync_engine, "connect", apply_pragmas)
+        Session = async_sessionmaker(expire_on_commit=False, bind=engine)
+        async with engine.begin() as conn:
+            await conn.run_sync(Base.metadata.create_all)
+
+        writer = BatchWriter(Session)
+        errors = []
+        started = time.perf_counter()
+        if batched:
+            await asyncio.gather(*(_batched(writer, worker, posts) for worker in range(workers)))
+            await writer.close()
+            commits = writer.metrics["commits"]
+        else:
+            await asyncio.gather(*(_direct(Session, worker, posts, errors) for worker in range(workers)))
+            commits = workers * posts * 2
+        elapsed = time.perf_counter() - started
+        await engine.dispose()
+
+    print(f"{title:<12} {workers * posts / elapsed:6.0f} постов/с, транзакций: {commits}, "
+          f"ошибок блокировки: {len(errors)}")
+
+
+async def main():
+    workers, posts = ([int(arg) for arg in sys.argv[1:3]] + [8, 200][len(sys.argv[1:3]):])
+    print(f"{workers} воркеров по {posts} постов")
+    await bench("по одной", False, workers, posts)
+    await bench("пачками", True, workers, posts)
+
+
+if __name__ == '__main__':
+    asyncio.run(main())
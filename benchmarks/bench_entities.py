@@ -0,0 +1,210 @@
+"""
+Микро-бенчмарк рендера entities в HTML.
+
+Сравнивает userbot.entities.entities_to_html с прежней реализацией
+_apply_entities_to_html (UTF-16 перекодирование на каждую сущность
+и исправление вложенности через BeautifulSoup) на длинных постах
+с большим количеством сущностей. Совпадение результатов обеих реализаций
+на этом же корпусе проверяет tests/test_entities.py.
+
+Запуск из корня проекта:
+    python -m benchmarks.bench_entities
+"""
+import random
+import timeit
+from html import escape
+from typing import List, Optional, Tuple
+
+from bs4 import BeautifulSoup
+from telethon.tl.types import (
+    MessageEntityBold, MessageEntityItalic, MessageEntityCode, MessageEntityPre,
+    MessageEntityTextUrl, MessageEntityUrl, MessageEntityMention,
+    MessageEntityStrike, MessageEntityBlockquote
+)
+
+from logger import logger
+from userbot.entities import entities_to_html
+
+
+# Прежняя реализация из userbot/TGClient.py без изменений
+def _utf16_offset_to_unicode(text: str, utf16_offset: int) -> int:
+    """
+    Преобразует UTF-16 offset в позицию в Unicode строке Python
+    """
+    if utf16_offset == 0:
+        return 0
+
+    utf16_bytes = text.encode('utf-16-le')
+
+    # Если offset выходит за пределы
+    if utf16_offset * 2 > len(utf16_bytes):
+        return len(text)
+
+    # Декодируем байты до указанного offset
+    decoded = utf16_bytes[:utf16_offset * 2].decode('utf-16-le')
+    return len(decoded)
+
+
+def _apply_entities_to_html(text: str, entities) -> str:
+    """
+    Применяет HTML разметку к тексту на основе entities от Telegram
+    с корректной обработкой вложенных сущностей
+    """
+    if not text:
+        return ""
+
+    # Если нет сущностей, просто экранируем текст
+    if not entities:
+        return escape(text)
+
+    # Создаем список для хранения тегов
+    tags: List[Tuple[int, str, Optional[dict]]] = []
+
+    # Преобразуем сущности в теги
+    for entity in entities:
+        start = _utf16_offset_to_unicode(text, entity.offset)
+        end = _utf16_offset_to_unicode(text, entity.offset + entity.length)
+
+        # Проверяем корректность позиций
+        if start >= len(text) or end > len(text) or start < 0 or end <= start:
+            continue
+
+        entity_text = text[start:end]
+
+        # Определяем HTML тег в зависимости от типа сущности
+        if isinstance(entity, MessageEntityBold):
+            tags.append((start, 'open', {'tag': 'b'}))
+            tags.append((end, 'close', {'tag': 'b'}))
+        elif isinstance(entity, MessageEntityItalic):
+            tags.append((start, 'open', {'tag': 'i'}))
+            tags.append((end, 'close', {'tag': 'i'}))
+        elif isinstance(entity, MessageEntityCode):
+            tags.append((start, 'open', {'tag': 'code'}))
+            tags.append((end, 'close', {'tag': 'code'}))
+        elif isinstance(entity, MessageEntityPre):
+            language = getattr(entity, 'language', '')
+            if language:
+                tags.append((start, 'open', {'tag': 'pre', 'attrs': f' language="{escape(language)}"'}))
+            else:
+                tags.append((start, 'open', {'tag': 'pre'}))
+            tags.append((end, 'close', {'tag': 'pre'}))
+        elif isinstance(entity, MessageEntityTextUrl):
+            url = entity.url
+            if url:
+                url_escaped = escape(url)
+                tags.append((start, 'open', {'tag': 'a', 'attrs': f' href="{url_escaped}"'}))
+                tags.append((end, 'close', {'tag': 'a'}))
+        elif isinstance(entity, MessageEntityUrl):
+            url_escaped = escape(entity_text)
+            tags.append((start, 'open', {'tag': 'a', 'attrs': f' href="{url_escaped}"'}))
+            tags.append((end, 'close', {'tag': 'a'}))
+        elif isinstance(entity, MessageEntityMention):
+            if entity_text.startswith('@'):
+                username = entity_text[1:] if len(entity_text) > 1 else ''
+                if username:
+                    tags.append((start, 'open', {'tag': 'a', 'attrs': f' href="https://t.me/{username}"'}))
+                    tags.append((end, 'close', {'tag': 'a'}))
+        elif isinstance(entity, MessageEntityStrike):
+            tags.append((start, 'open', {'tag': 's'}))
+            tags.append((end, 'close', {'tag': 's'}))
+        elif isinstance(entity, MessageEntityBlockquote):
+            tags.append((start, 'open', {'tag': 'blockquote'}))
+            tags.append((end, 'close', {'tag': 'blockquote'}))
+
+    # Сортируем теги по позиции, закрывающие теги перед открывающими на той же позиции
+    tags.sort(key=lambda x: (x[0], 0 if x[1] == 'close' else 1))
+
+    # Собираем результат с тегами
+    result_parts = []
+    last_pos = 0
+
+    for pos, tag_type, tag_info in tags:
+        # Добавляем текст между тегами
+        if pos > last_pos:
+            result_parts.append(escape(text[last_pos:pos]))
+
+        # Добавляем тег
+        if tag_type == 'open':
+            attrs = tag_info.get('attrs', '')
+            result_parts.append(f'<{tag_info["tag"]}{attrs}>')
+        else:  # 'close'
+            result_parts.append(f'</{tag_info["tag"]}>')
+
+        last_pos = pos
+
+    # Добавляем оставшийся текст после последнего тега
+    if last_pos < len(text):
+        result_parts.append(escape(text[last_pos:]))
+
+    # Преобразуем в строку
+    html_with_tags = ''.join(result_parts)
+
+    # Используем BeautifulSoup для исправления порядка закрывающих тегов
+    try:
+        soup = BeautifulSoup(html_with_tags, 'html.parser')
+        # Получаем отформатированный HTML
+        fixed_html = str(soup)
+
+        # Убираем лишние теги, которые добавляет BeautifulSoup (html, body)
+        if fixed_html.startswith('<html><body>') and fixed_html.endswith('</body></html>'):
+            fixed_html = fixed_html[12:-14]
+        elif fixed_html.startswith('<body>') and fixed_html.endswith('</body>'):
+            fixed_html = fixed_html[6:-7]
+
+        return fixed_html
+    except Exception as e:
+        logger.error(f"Ошибка при исправлении HTML с помощью BeautifulSoup: {e}")
+        # В случае ошибки возвращаем исходный вариант
+        return html_with_tags
+
+
+
+def _make_post(paragraphs: int, seed: int = 0) -> Tuple[str, list]:
+    """Генерирует пост с эмодзи, ссылками и пересекающимися сущностями по границам слов"""
+    rnd = random.Random(seed)
+    words = ["новости", "заявление", "министр", "🔥", "срочно", "@channel", "https://t.me/x", "📢", "данные"]
+
+    # Собираем текст и запоминаем UTF-16 границы слов, как их считает Telegram
+    parts = []
+    bounds = []
+    position = 0
+    for paragraph in range(paragraphs):
+        for index in range(40):
+            word = rnd.choice(words)
+            separator = "\n" if paragraph and index == 0 else (" " if parts else "")
+            parts.append(separator + word)
+            position += len(separator.encode('utf-16-le')) // 2
+            start = position
+            position += len(word.encode('utf-16-le')) // 2
+            bounds.append((start, position))
+    text = "".join(parts)
+
+    kinds = [MessageEntityBold, MessageEntityItalic, MessageEntityStrike, MessageEntityCode]
+    entities = []
+    for _ in range(paragraphs * 6):
+        first = rnd.randrange(0, len(bounds) - 1)
+        last = min(len(bounds) - 1, first + rnd.randrange(0, 8))
+        offset = bounds[first][0]
+        length = bounds[last][1] - offset
+        if rnd.random() < 0.2:
+            entities.append(MessageEntityTextUrl(offset=offset, length=length, url="https://example.com/?a=1&b=2"))
+        else:
+            entities.append(rnd.choice(kinds)(offset=offset, length=length))
+    return text, entities
+
+
+def main():
+    for paragraphs in (5, 20, 60):
+        text, entities = _make_post(paragraphs)
+        number = 20
+        legacy = timeit.timeit(lambda: _apply_entities_to_html(text, entities), number=number) / number
+        current = timeit.timeit(lambda: entities_to_html(text, entities), number=number) / number
+        print(
+            f"{len(text):>6} символов, {len(entities):>4} сущностей: "
+            f"было {legacy * 1000:8.2f} мс, стало {current * 1000:7.2f} мс, "
+            f"ускорение x{legacy / current:.1f}"
+        )
+
+
+if __name__ == '__main__':
+    main()
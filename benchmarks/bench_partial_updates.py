@@ -0,0 +1,85 @@
+"""
+Бенчмарк обновления поля поста: загрузка всей строки ORM, изменение и
+commit (как update_post_digest раньше) против одного UPDATE ... WHERE id = ?
+(db.posts.update_post).
+
+У постов большие text и ai_gen, как у длинных постов с AI-текстом.
+Для каждого способа печатается время на обновление, число запросов к SQLite
+и пик выделенной памяти (tracemalloc).
+
+Запуск из корня проекта:
+    python -m benchmarks.bench_partial_updates [постов] [размер текста]
+"""
+import asyncio
+import os
+import sys
+import tempfile
+import time
+import tracemalloc
+from datetime import datetime
+
+from sqlalchemy import event, insert, select, update
+from sqlalchemy.ext.asyncio import create_async_engine, async_sessionmaker
+from sqlalchemy.orm import undefer_group
+
+from db.models import Base, Post, POST_CONTENT, apply_pragmas
+
+
+async def _load_modify_commit(Session, post_id: int):
+    async with Session() as session:
+        stmt = select(Post).options(undefer_group(POST_CONTENT)).where(Post.id == post_id)
+        post = (await session.execute(stmt)).scalar_one_or_none()
+        if post:
+            post.digest = True
+            post.processed_at = datetime.now()
+            await session.commit()
+
+
+async def _single_update(Session, post_id: int):
+    async with Session() as session:
+        await session.execute(update(Post).where(Post.id == post_id).values(digest=True, processed_at=datetime.now()))
+        await session.commit()
+
+
+async def bench(title: str, method, posts: int, size: int):
+    with tempfile.TemporaryDirectory() as directory:
+        engine = create_async_engine(f"sqlite+aiosqlite:///{os.path.join(directory, 'bench.db')}")
+        event.listen(engine.sync_engine, "connect", apply_pragmas)
+        Session = async_sessionmaker(expire_on_commit=False, bind=engine)
+        async with engine.begin() as conn:
+            await conn.run_sync(Base.metadata.create_all)
+            await conn.execute(insert(Post), [
+                {"chat_id": -1, "message_id": index,
+                 "content_type": "text", "text": "т" * size, "ai_gen": "а" * size, "original_date": datetime.now()}
+                for index in range(posts)
+            ])
+
+        statements = 0
+
+        def count(*args):
+            nonlocal statements
+            statements += 1
+
+        event.listen(engine.sync_engine, "before_cursor_execute", count)
+        tracemalloc.start()
+        started = time.perf_counter()
+        for post_id in range(1, posts + 1):
+            await method(Session, post_id)
+        elapsed = time.perf_counter() - started
+        _, peak = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+        await engine.dispose()
+
+    print(f"{title:<22} {elapsed / posts * 1000:6.2f} мс на пост, запросов на пост: {statements / posts:.0f}, "
+          f"пик памяти {peak / 1024:8.0f} КБ")
+
+
+async def main():
+    posts, size = ([int(arg) for arg in sys.argv[1:3]] + [2000, 20000][len(sys.argv[1:3]):])
+    print(f"{posts} постов, text и ai_gen по {size} символов")
+    await bench("загрузка и commit", _load_modify_commit, posts, size)
+    await bench("один UPDATE", _single_update, posts, size)
+
+
+if __name__ == '__main__':
+    asyncio.run(main())
@@ -0,0 +1,87 @@
+"""
+Бенчмарк чтения постов без больших текстов: select(Post) со всеми колонками
+(как до отложенной загрузки), select(Post) с отложенными text, ai_gen и
+edit_text (группа POST_CONTENT) и выборка только POST_META_COLUMNS
+(db.posts.get_post_meta).
+
+Замеряются страница постов, как в get_posts, и чтение одного поста по id,
+как в проверке статуса дайджеста. Для каждого способа печатается время и
+пик выделенной памяти (tracemalloc).
+
+Запуск из корня проекта:
+    python -m benchmarks.bench_post_deferred [постов] [размер текста]
+"""
+import os
+import statistics
+import sys
+import tempfile
+import time
+import tracemalloc
+from datetime import datetime
+
+from sqlalchemy import create_engine, insert, select
+from sqlalchemy.orm import Session, undefer_group
+
+from db.models import Base, Post, POST_CONTENT
+from db.posts import POST_META_COLUMNS
+
+# Сколько постов на странице и сколько чтений по id
+_PAGE = 100
+_LOOKUPS = 500
+
+
+def _fill(engine, posts: int, size: int):
+    """Создает таблицы и заполняет posts постами с text, ai_gen и edit_text по size символов"""
+    Base.metadata.create_all(engine)
+    with engine.begin() as conn:
+        conn.execute(insert(Post), [
+            {"chat_id": -1, "message_id": index, "content_type": "photo", "file_id": f"file{index}",
+             "text": "т" * size, "ai_gen": "а" * size, "edit_text": "р" * size, "original_date": datetime.now()}
+            for index in range(posts)
+        ])
+
+
+def _measure(engine, method, number: int = 5):
+    """Медиана времени в миллисекундах и пик памяти в КБ"""
+    timings = []
+    tracemalloc.start()
+    for _ in range(number):
+        with Session(engine) as session:
+            started = time.perf_counter()
+            method(session)
+            timings.append(time.perf_counter() - started)
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return statistics.median(timings) * 1000, peak / 1024
+
+
+def _methods(posts: int) -> dict:
+    page = select(Post).order_by(Post.original_date.desc()).limit(_PAGE)
+    ids = [post_id * posts // _LOOKUPS + 1 for post_id in range(_LOOKUPS)]
+    return {
+        f"страница {_PAGE}, все колонки": lambda s: s.scalars(page.options(undefer_group(POST_CONTENT))).all(),
+        f"страница {_PAGE}, отложенные тексты": lambda s: s.scalars(page).all(),
+        f"страница {_PAGE}, POST_META_COLUMNS": lambda s: s.execute(
+            select(*POST_META_COLUMNS).order_by(Post.original_date.desc()).limit(_PAGE)).all(),
+        f"{_LOOKUPS} постов по id, все колонки": lambda s: [
+            s.scalars(select(Post).options(undefer_group(POST_CONTENT)).where(Post.id == post_id)).one()
+            for post_id in ids],
+        f"{_LOOKUPS} постов по id, POST_META_COLUMNS": lambda s: [
+            s.execute(select(*POST_META_COLUMNS).where(Post.id == post_id)).one() for post_id in ids],
+    }
+
+
+def main():
+    posts, size = ([int(arg) for arg in sys.argv[1:3]] + [2000, 20000][len(sys.argv[1:3]):])
+    print(f"{posts} постов, text, ai_gen и edit_text по {size} символов")
+    with tempfile.TemporaryDirectory() as directory:
+        engine = create_engine(f"sqlite:///{os.path.join(directory, 'bench.db')}")
+        _fill(engine, posts, size)
+        for title, method in _methods(posts).items():
+            elapsed, peak = _measure(engine, method)
+            print(f"  {title:<36} {elapsed:8.2f} мс, пик памяти {peak:8.0f} КБ")
+        engine.dispose()
+
+
+if __name__ == '__main__':
+    main()
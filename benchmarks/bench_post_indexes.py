@@ -0,0 +1,127 @@
+"""
+Бенчмарк запросов к таблице posts с индексами и без них.
+
+Заполняет временную базу SQLite синтетическими постами (10k, 100k и 1M
+строк), замеряет запросы дайджеста, ленты get_posts и поиска по
+(chat_id, message_id) на схеме до добавления индексов (только первичный
+ключ и ux_posts_chat_message), затем создает индексы модели Post и
+повторяет замеры.
+
+Запуск из корня проекта:
+    python -m benchmarks.bench_post_indexes [количество строк ...]
+"""
+import os
+import random
+import sqlite3
+import statistics
+import sys
+import tempfile
+import time
+from datetime import datetime, timedelta
+
+from sqlalchemy import create_engine, select
+
+from db.models import Channel, Post
+
+# Индексы, которые были до этого изменения
+_BASELINE_INDEXES = {'ux_posts_chat_message'}
+
+_CHATS = 50
+_NOW = datetime(2025, 1, 1)
+_INSERT = (
+    "INSERT INTO posts (id, chat_id, message_id, content_type, text, digest, original_date, received_at) "
+    "VALUES (?, ?, ?, ?, ?, ?, ?, ?)"
+)
+
+
+def _fill(path: str, rows: int):
+    """Создает таблицы channels и posts и заполняет posts rows постами за последние 90 дней"""
+    engine = create_engine(f"sqlite:///{path}")
+    Channel.__table__.create(engine)
+    Post.__table__.create(engine)
+    for index in Post.__table__.indexes:
+        if index.name not in _BASELINE_INDEXES:
+            index.drop(engine)
+    engine.dispose()
+
+    rnd = random.Random(0)
+    conn = sqlite3.connect(path)
+    conn.executemany(
+        "INSERT INTO channels (chat_id, title, type) VALUES (?, ?, 'channel')",
+        [(chat, f"Канал {chat}") for chat in range(_CHATS)]
+    )
+    batch = []
+    for post_id in range(1, rows + 1):
+        received_at = _NOW - timedelta(seconds=rnd.randrange(90 * 24 * 3600))
+        original_date = received_at - timedelta(seconds=rnd.randrange(600))
+        batch.append((
+            post_id, rnd.randrange(_CHATS), post_id, 'text',
+            "Текст поста " * 8, rnd.random() < 0.02, original_date, received_at
+        ))
+        if len(batch) == 50000:
+            conn.executemany(_INSERT, batch)
+            batch.clear()
+    if batch:
+        conn.executemany(_INSERT, batch)
+    conn.commit()
+    conn.execute("ANALYZE")
+    conn.close()
+
+
+def _queries(rows: int) -> dict:
+    """Те же запросы, что выполняет бот"""
+    return {
+        "дайджест за 24 часа": select(Post).where(
+            Post.digest == True,
+            Post.received_at >= _NOW - timedelta(hours=24)
+        ).order_by(Post.received_at.desc()),
+        "get_posts limit 100": select(Post).order_by(Post.original_date.desc()).limit(100),
+        "get_posts чата limit 100": select(Post).where(Post.chat_id == 7).order_by(
+            Post.original_date.desc()).limit(100),
+        "поиск (chat_id, message_id)": select(Post).where(Post.chat_id == 7, Post.message_id == rows // 2),
+    }
+
+
+def _measure(engine, stmt, number: int = 5) -> float:
+    """Медиана времени выполнения запроса в миллисекундах"""
+    timings = []
+    with engine.connect() as conn:
+        for _ in range(number):
+            started = time.perf_counter()
+            conn.execute(stmt).all()
+            timings.append(time.perf_counter() - started)
+    return statistics.median(timings) * 1000
+
+
+def bench(rows: int):
+    with tempfile.TemporaryDirectory() as directory:
+        path = os.path.join(directory, "bench.db")
+        started = time.perf_counter()
+        _fill(path, rows)
+        print(f"\n{rows} строк (заполнение {time.perf_counter() - started:.1f} с)")
+
+        engine = create_engine(f"sqlite:///{path}")
+        queries = _queries(rows)
+        before = {name: _measure(engine, stmt) for name, stmt in queries.items()}
+
+        for index in Post.__table__.indexes:
+            if index.name not in _BASELINE_INDEXES:
+                index.create(engine)
+        with engine.connect() as conn:
+            conn.exec_driver_sql("ANALYZE")
+
+        for name, stmt in queries.items():
+            after = _measure(engine, stmt)
+            print(f"  {name:<28} без индексов {before[name]:9.2f} мс, с индексами {after:7.2f} мс, "
+                  f"ускорение x{before[name] / after:.0f}")
+        engine.dispose()
+
+
+def main():
+    sizes = [int(arg) for arg in sys.argv[1:]] or [10000, 100000, 1000000]
+    for rows in sizes:
+        bench(rows)
+
+
+if __name__ == '__main__':
+    main()
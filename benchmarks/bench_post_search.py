@@ -0,0 +1,136 @@
+"""
+Бенчмарк полнотекстового поиска /search (db.fts, db.posts.search_posts)
+против поиска LIKE '%слово%' по posts.text.
+
+Заполняет временную базу SQLite синтетическими постами с HTML-разметкой
+(по умолчанию 1M строк), строит индекс posts_fts так же, как миграция
+create_search_index, и замеряет первую и следующую страницу результатов
+для частого, среднего и редкого слова и запроса из двух слов.
+
+Запуск из корня проекта:
+    python -m benchmarks.bench_post_search [количество строк ...]
+"""
+import itertools
+import os
+import random
+import statistics
+import sys
+import tempfile
+import time
+from datetime import datetime, timedelta
+
+from sqlalchemy import create_engine, event, text
+
+from db.fts import build_match, create_search_index, register_functions
+from config import SEARCH_MAX_MATCHES
+from db.models import Channel, Post
+
+_NOW = datetime(2025, 1, 1)
+_INSERT = (
+    "INSERT INTO posts (id, chat_id, message_id, content_type, text, digest, original_date, received_at) "
+    "VALUES (?, ?, ?, ?, ?, ?, ?, ?)"
+)
+
+# Словарь постов из случайных слогов: первые слова встречаются намного чаще
+# последних (закон Ципфа), как в обычном тексте
+_SYLLABLES = ["ка", "ли", "но", "ра", "ты", "ме", "до", "су", "ве", "по", "зи", "ша", "гу", "ре", "мо", "ню"]
+
+
+def _vocabulary(size: int) -> list:
+    rnd = random.Random(1)
+    words = set()
+    while len(words) < size:
+        words.add(''.join(rnd.choices(_SYLLABLES, k=rnd.randint(2, 4))))
+    return sorted(words, key=lambda word: rnd.random())
+
+
+_WORDS = _vocabulary(20000)
+_CUM_WEIGHTS = list(itertools.accumulate(1 / (rank + 1) for rank in range(len(_WORDS))))
+
+# Запросы: частое слово (в ~70% постов), среднее, редкое и два средних слова
+_QUERIES = {
+    "частое слово": _WORDS[2],
+    "среднее слово": _WORDS[300],
+    "редкое слово": _WORDS[15000],
+    "два слова": f"{_WORDS[200]} {_WORDS[400]}",
+}
+
+# Тот же запрос, что в db.posts.search_posts
+_SEARCH = text(
+    "SELECT p.id, c.title AS chat_title, p.text, hit.rank "
+    "FROM (SELECT rowid, rank FROM posts_fts WHERE posts_fts MATCH :match "
+    "AND rowid >= coalesce((SELECT min(rowid) FROM (SELECT rowid FROM posts_fts WHERE posts_fts MATCH :match "
+    "ORDER BY rowid DESC LIMIT :max_matches)), 0) {keyset} "
+    "ORDER BY rank, rowid LIMIT 10) AS hit JOIN posts AS p ON p.id = hit.rowid "
+    "LEFT JOIN channels AS c ON c.chat_id = p.chat_id ORDER BY hit.rank, hit.rowid"
+)
+_KEYSET = "AND (rank > :rank OR (rank = :rank AND rowid > :id))"
+_LIKE = text("SELECT id, chat_id, text FROM posts WHERE text LIKE :pattern ORDER BY original_date DESC LIMIT 10")
+
+
+def _fill(engine, rows: int):
+    """Создает таблицы channels и posts и заполняет posts rows постами по 40 слов"""
+    Channel.__table__.create(engine)
+    Post.__table__.create(engine)
+    rnd = random.Random(0)
+    batch = []
+    with engine.begin() as conn:
+        cursor = conn.connection.cursor()
+        for post_id in range(1, rows + 1):
+            words = rnd.choices(_WORDS, cum_weights=_CUM_WEIGHTS, k=40)
+            words[0] = f"<b>{words[0]}</b>"
+            date = _NOW - timedelta(seconds=rnd.randrange(90 * 24 * 3600))
+            batch.append((post_id, rnd.randrange(50), post_id, 'text', ' '.join(words), False, date, date))
+            if len(batch) == 50000:
+                cursor.executemany(_INSERT, batch)
+                batch.clear()
+        if batch:
+            cursor.executemany(_INSERT, batch)
+
+
+def _measure(engine, stmt, params: dict, number: int = 5):
+    """Медиана времени запроса в миллисекундах и последняя строка результата"""
+    timings = []
+    with engine.connect() as conn:
+        for _ in range(number):
+            started = time.perf_counter()
+            rows = conn.execute(stmt, params).all()
+            timings.append(time.perf_counter() - started)
+    return statistics.median(timings) * 1000, rows[-1] if rows else None
+
+
+def bench(rows: int):
+    with tempfile.TemporaryDirectory() as directory:
+        engine = create_engine(f"sqlite:///{os.path.join(directory, 'bench.db')}")
+        event.listen(engine, "connect", register_functions)
+
+        started = time.perf_counter()
+        _fill(engine, rows)
+        filled = time.perf_counter() - started
+        started = time.perf_counter()
+        with engine.begin() as conn:
+            create_search_index(conn)
+        print(f"\n{rows} строк (заполнение {filled:.1f} с, индекс {time.perf_counter() - started:.1f} с)")
+
+        for title, query in _QUERIES.items():
+            like, _ = _measure(engine, _LIKE, {"pattern": f"%{query.split()[0]}%"}, number=1)
+            match = build_match(query)
+            first, last = _measure(engine, text(_SEARCH.text.format(keyset='')), {"match": match, "max_matches": SEARCH_MAX_MATCHES})
+            following = 0.0
+            if last is not None:
+                following, _ = _measure(engine, text(_SEARCH.text.format(keyset=_KEYSET)),
+                                        {"match": match, "max_matches": SEARCH_MAX_MATCHES,
+                                         "rank": last.rank, "id": last.id})
+            print(f"  {title:<14} LIKE {like:9.2f} мс, FTS5 первая страница {first:8.2f} мс, "
+                  f"следующая {following:8.2f} мс")
+        engine.dispose()
+
+
+def main():
+    sizes = [int(arg) for arg in sys.argv[1:]] or [1000000]
+    for rows in sizes:
+        bench(rows)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,117 @@
+"""
+Бенчмарк /stats: подсчет в Python по всем постам (как раньше), запросы
+GROUP BY по posts и чтение сводок post_counters/post_hourly, которые
+ведут триггеры (db.migrations.create_stats_rollups, db.stats).
+
+Запуск из корня проекта:
+    python -m benchmarks.bench_post_stats [количество строк ...]
+"""
+import os
+import random
+import statistics
+import sys
+import tempfile
+import time
+from datetime import datetime, timedelta
+
+from sqlalchemy import create_engine, func, select
+from sqlalchemy.orm import Session
+
+from db.migrations import create_stats_rollups
+from db.models import Base, Channel, Post, PostCounter, PostHourly
+
+_CHATS = 50
+_TYPES = ('text', 'photo', 'video', 'document', 'media_group')
+_NOW = datetime.now()
+_INSERT = (
+    "INSERT INTO posts (id, chat_id, message_id, content_type, text, digest, original_date, received_at) "
+    "VALUES (?, ?, ?, ?, ?, ?, ?, ?)"
+)
+
+
+def _fill(engine, rows: int):
+    """Создает таблицы и заполняет posts постами за последние 90 дней"""
+    Base.metadata.create_all(engine)
+    rnd = random.Random(0)
+    batch = []
+    with engine.begin() as conn:
+        cursor = conn.connection.cursor()
+        cursor.executemany(
+            "INSERT INTO channels (chat_id, title, type) VALUES (?, ?, 'channel')",
+            [(chat, f"Канал {chat}") for chat in range(_CHATS)]
+        )
+        for post_id in range(1, rows + 1):
+            date = _NOW - timedelta(seconds=rnd.randrange(90 * 24 * 3600))
+            chat = rnd.randrange(_CHATS)
+            batch.append((post_id, chat, post_id, rnd.choice(_TYPES), "Текст поста " * 40,
+                          rnd.random() < 0.02, date, date))
+            if len(batch) == 50000:
+                cursor.executemany(_INSERT, batch)
+                batch.clear()
+        if batch:
+            cursor.executemany(_INSERT, batch)
+
+
+def _python_loop(conn):
+    """Как /stats раньше: все посты в Python и подсчет в цикле"""
+    content_types, chats, in_digest = {}, {}, 0
+    for post in Session(bind=conn).scalars(select(Post)):
+        content_types[post.content_type] = content_types.get(post.content_type, 0) + 1
+        chats[post.chat_id] = chats.get(post.chat_id, 0) + 1
+        in_digest += bool(post.digest)
+
+
+def _group_by(conn):
+    """Те же числа и поступление по часам запросами GROUP BY по posts"""
+    conn.execute(select(func.count(), func.sum(Post.digest))).one()
+    conn.execute(select(Post.content_type, func.count()).group_by(Post.content_type)).all()
+    conn.execute(select(func.max(Channel.title), func.count()).select_from(Post)
+                 .outerjoin(Channel, Channel.chat_id == Post.chat_id).group_by(Post.chat_id)).all()
+    hour = func.strftime('%Y-%m-%d %H', Post.received_at)
+    conn.execute(select(hour, func.count()).where(Post.received_at >= _NOW - timedelta(days=7)).group_by(hour)).all()
+
+
+def _rollups(conn):
+    """Те же запросы, что db.stats.get_post_stats, по сводкам"""
+    posts = func.sum(PostCounter.posts)
+    conn.execute(select(func.sum(PostCounter.posts), func.sum(PostCounter.digest))).one()
+    conn.execute(select(PostCounter.content_type, posts).group_by(PostCounter.content_type)).all()
+    conn.execute(select(func.max(Channel.title), posts).select_from(PostCounter)
+                 .outerjoin(Channel, Channel.chat_id == PostCounter.chat_id).group_by(PostCounter.chat_id)).all()
+    conn.execute(select(PostHourly.hour, PostHourly.posts).where(PostHourly.hour >= _NOW - timedelta(days=7))).all()
+
+
+def _measure(engine, method, number: int = 3) -> float:
+    """Медиана времени в миллисекундах"""
+    timings = []
+    with engine.connect() as conn:
+        for _ in range(number):
+            started = time.perf_counter()
+            method(conn)
+            timings.append(time.perf_counter() - started)
+    return statistics.median(timings) * 1000
+
+
+def bench(rows: int):
+    with tempfile.TemporaryDirectory() as directory:
+        engine = create_engine(f"sqlite:///{os.path.join(directory, 'bench.db')}")
+        _fill(engine, rows)
+        started = time.perf_counter()
+        with engine.begin() as conn:
+            create_stats_rollups(conn)
+        print(f"\n{rows} строк (начальное заполнение сводок {time.perf_counter() - started:.1f} с)")
+
+        print(f"  все посты в Python {_measure(engine, _python_loop, number=1):10.1f} мс")
+        print(f"  GROUP BY по posts  {_measure(engine, _group_by):10.1f} мс")
+        print(f"  сводки             {_measure(engine, _rollups):10.1f} мс")
+        engine.dispose()
+
+
+def main():
+    sizes = [int(arg) for arg in sys.argv[1:]] or [10000, 100000, 1000000]
+    for rows in sizes:
+        bench(rows)
+
+
+if __name__ == '__main__':
+    main()
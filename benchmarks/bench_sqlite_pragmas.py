@@ -0,0 +1,111 @@
+"""
+Бенчмарк одновременной записи и чтения SQLite с настройками по умолчанию
+и с настройками соединения из db.models.apply_pragmas (WAL, busy_timeout,
+synchronous=NORMAL, cache_size, mmap_size).
+
+База заранее заполняется постами. Писатели (как воркеры доставки)
+сохраняют посты так же, как save_post - отдельная транзакция на пост,
+читатели в это время выбирают по 10000 постов, как /export_posts и /stats.
+
+Запуск из корня проекта:
+    python -m benchmarks.bench_sqlite_pragmas [писателей] [постов на писателя] [читателей]
+"""
+import asyncio
+import os
+import statistics
+import sys
+import tempfile
+import time
+from datetime import datetime
+
+from sqlalchemy import event, insert, select
+from sqlalchemy.exc import OperationalError
+from sqlalchemy.ext.asyncio import create_async_engine, async_sessionmaker
+
+from db.models import Base, Post, apply_pragmas
+from db.posts import upsert_post_stmt
+
+# Сколько постов в базе до начала замера
+_PREFILL = 20000
+
+
+async def _writer(Session, writer: int, posts: int, latencies: list, errors: list):
+    for index in range(posts):
+        stmt = upsert_post_stmt(
+            chat_id=writer,
+            message_id=index,
+            content_type="text",
+            text="Текст поста " * 40,
+            original_date=datetime.now()
+        )
+        started = time.perf_counter()
+        try:
+            async with Session() as session:
+                await session.execute(stmt)
+                await session.commit()
+        except OperationalError as e:
+            errors.append(e)
+            continue
+        latencies.append(time.perf_counter() - started)
+
+
+async def _reader(Session, done: asyncio.Event, latencies: list, errors: list):
+    stmt = select(Post.id, Post.text).order_by(Post.original_date.desc()).limit(10000)
+    while not done.is_set():
+        started = time.perf_counter()
+        try:
+            async with Session() as session:
+                (await session.execute(stmt)).all()
+        except OperationalError as e:
+            errors.append(e)
+            continue
+        latencies.append(time.perf_counter() - started)
+
+
+def _p95(latencies: list) -> float:
+    """95-й перцентиль задержки в миллисекундах"""
+    return statistics.quantiles(latencies, n=20)[-1] * 1000 if len(latencies) > 1 else 0.0
+
+
+async def bench(title: str, tune: bool, writers: int, posts: int, readers: int):
+    with tempfile.TemporaryDirectory() as directory:
+        engine = create_async_engine(f"sqlite+aiosqlite:///{os.path.join(directory, 'bench.db')}",
+                                     pool_size=writers + readers)
+        if tune:
+            event.listen(engine.sync_engine, "connect", apply_pragmas)
+        Session = async_sessionmaker(expire_on_commit=False, bind=engine)
+        async with engine.begin() as conn:
+            await conn.run_sync(Base.metadata.create_all)
+            await conn.execute(insert(Post), [
+                {"chat_id": -1, "message_id": index,
+                 "content_type": "text", "text": "Текст поста " * 40, "original_date": datetime.now()}
+                for index in range(_PREFILL)
+            ])
+
+        writes, reads, write_errors, read_errors = [], [], [], []
+        done = asyncio.Event()
+        reader_tasks = [asyncio.create_task(_reader(Session, done, reads, read_errors)) for _ in range(readers)]
+
+        started = time.perf_counter()
+        await asyncio.gather(*(_writer(Session, writer, posts, writes, write_errors) for writer in range(writers)))
+        elapsed = time.perf_counter() - started
+        done.set()
+        await asyncio.gather(*reader_tasks)
+        await engine.dispose()
+
+    print(
+        f"{title:<12} записей {len(writes) / elapsed:5.0f}/с (p95 {_p95(writes):6.1f} мс), "
+        f"чтений {len(reads) / elapsed:5.0f}/с (p95 {_p95(reads):6.1f} мс), "
+        f"ошибок блокировки: {len(write_errors) + len(read_errors)}"
+    )
+
+
+async def main():
+    writers, posts, readers = ([int(arg) for arg in sys.argv[1:4]] + [4, 300, 2][len(sys.argv[1:4]):])
+    print(f"{writers} писателей по {posts} постов, {readers} читателей")
+    await bench("по умолчанию", False, writers, posts, readers)
+    await bench("с настройкой", True, writers, posts, readers)
+
+
+if __name__ == '__main__':
+    asyncio.run(main())
@@ -4,6 +4,7 @@ from aiogram.enums import ParseMode
 from aiogram.types import LinkPreviewOptions
 
 from config import TG_TOKEN
+from rate_limiter import gateway
 from typing import Optional
 
 bot: Optional[Bot] = Bot(
@@ -13,3 +14,6 @@ bot: Optional[Bot] = Bot(
         link_preview_is_disabled=True
     )
 )
+
+# Все запросы к Bot API идут через общий шлюз: лимиты, повторы, метрики
+bot.session.middleware(gateway)
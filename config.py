@@ -14,3 +14,120 @@ API_HASH: Optional[str] = os.environ.get("API_HASH")
 
 # Множество ID администраторов бота
 ADMIN_IDS: List[int] = [int(x) for x in os.environ.get("ADMIN_IDS", "").split()] if os.environ.get("ADMIN_IDS") else []
+
+# Конвейер входящих сообщений: размер очереди, число воркеров доставки
+# и время ожидания свободного места в очереди (backpressure) в секундах
+INGEST_QUEUE_SIZE: int = int(os.environ.get("INGEST_QUEUE_SIZE", 1000))
+DELIVERY_WORKERS: int = int(os.environ.get("DELIVERY_WORKERS", 4))
+INGEST_PUT_TIMEOUT: float = float(os.environ.get("INGEST_PUT_TIMEOUT", 30))
+
+# Ограничения Bot API: общий лимит сообщений в секунду, лимит на один чат,
+# допустимый всплеск для одного чата, число повторов после TelegramRetryAfter,
+# ошибок сети и 5xx и начальная пауза перед повтором после ошибки сети (сек)
+BOT_GLOBAL_RATE: float = float(os.environ.get("BOT_GLOBAL_RATE", 25))
+BOT_CHAT_RATE: float = float(os.environ.get("BOT_CHAT_RATE", 1))
+BOT_CHAT_BURST: int = int(os.environ.get("BOT_CHAT_BURST", 3))
+BOT_SEND_RETRIES: int = int(os.environ.get("BOT_SEND_RETRIES", 3))
+BOT_RETRY_DELAY: float = float(os.environ.get("BOT_RETRY_DELAY", 1))
+
+# Медиа не больше этого размера (в байтах) пересылается через память,
+# более крупные файлы скачиваются во временный файл на диске
+MEDIA_MEMORY_LIMIT: int = int(os.environ.get("MEDIA_MEMORY_LIMIT", 10 * 1024 * 1024))
+
+# Сборка медиагрупп: пауза после последней части перед отправкой (сек),
+# максимальное время сборки одной группы (сек) и число групп в памяти
+ALBUM_QUIET_PERIOD: float = float(os.environ.get("ALBUM_QUIET_PERIOD", 1.5))
+ALBUM_MAX_AGE: float = float(os.environ.get("ALBUM_MAX_AGE", 15))
+ALBUM_MAX_GROUPS: int = int(os.environ.get("ALBUM_MAX_GROUPS", 200))
+
+# Сколько чатов держать в кэше метаданных (название, тип, заголовок)
+CHAT_CACHE_SIZE: int = int(os.environ.get("CHAT_CACHE_SIZE", 5000))
+
+# Догрузка сообщений, пропущенных пока бот был выключен: максимум сообщений
+# на один чат (0 - не догружать), максимум просмотренных сообщений на один
+# чат (включая отсеянные и копии), размер пачки iter_messages, сколько чатов
+# догружать одновременно и сколько сообщений в секунду ставить в очередь
+BACKFILL_LIMIT: int = int(os.environ.get("BACKFILL_LIMIT", 500))
+BACKFILL_SCAN_LIMIT: int = int(os.environ.get("BACKFILL_SCAN_LIMIT", 5000))
+BACKFILL_BATCH_SIZE: int = int(os.environ.get("BACKFILL_BATCH_SIZE", 100))
+BACKFILL_CONCURRENCY: int = int(os.environ.get("BACKFILL_CONCURRENCY", 3))
+BACKFILL_RATE: float = float(os.environ.get("BACKFILL_RATE", 5))
+
+# Фильтры источников: разрешенные и запрещенные чаты (ID через пробел, можно
+# с префиксом -100), ключевые слова (через запятую, без учета регистра) -
+# пост пересылается, если содержит хотя бы одно из FILTER_INCLUDE_WORDS и ни
+# одного из FILTER_EXCLUDE_WORDS, и разрешенные типы контента (через пробел,
+# например "text photo media_group").
+# Пустое значение - фильтр не применяется
+FILTER_ALLOW_CHATS: List[int] = [int(x) for x in os.environ.get("FILTER_ALLOW_CHATS", "").split()]
+FILTER_DENY_CHATS: List[int] = [int(x) for x in os.environ.get("FILTER_DENY_CHATS", "").split()]
+FILTER_INCLUDE_WORDS: List[str] = [x.strip() for x in os.environ.get("FILTER_INCLUDE_WORDS", "").split(",") if x.strip()]
+FILTER_EXCLUDE_WORDS: List[str] = [x.strip() for x in os.environ.get("FILTER_EXCLUDE_WORDS", "").split(",") if x.strip()]
+FILTER_CONTENT_TYPES: List[str] = os.environ.get("FILTER_CONTENT_TYPES", "").split()
+
+# Поиск почти одинаковых постов из разных каналов: сколько секунд помнить
+# посты (0 - не искать копии), сколько постов держать в индексе, допустимое число различающихся бит
+# SimHash (0 - отключить сравнение текста, не больше 7) и минимальное число слов в тексте
+DEDUP_WINDOW: float = float(os.environ.get("DEDUP_WINDOW", 6 * 60 * 60))
+DEDUP_MAX_ENTRIES: int = int(os.environ.get("DEDUP_MAX_ENTRIES", 5000))
+DEDUP_MAX_DISTANCE: int = int(os.environ.get("DEDUP_MAX_DISTANCE", 7))
+DEDUP_MIN_WORDS: int = int(os.environ.get("DEDUP_MIN_WORDS", 8))
+
+# Наблюдение за подключением Telethon: интервал проверки (сек), таймаут
+# проверочного запроса (сек), начальная и максимальная пауза между попытками
+# переподключения (сек, растет экспоненциально со случайным разбросом)
+SUPERVISOR_INTERVAL: float = float(os.environ.get("SUPERVISOR_INTERVAL", 30))
+SUPERVISOR_PROBE_TIMEOUT: float = float(os.environ.get("SUPERVISOR_PROBE_TIMEOUT", 10))
+RECONNECT_BASE_DELAY: float = float(os.environ.get("RECONNECT_BASE_DELAY", 1))
+RECONNECT_MAX_DELAY: float = float(os.environ.get("RECONNECT_MAX_DELAY", 300))
+
+# Outbox доставок админам: сколько доставок забирать за раз, пауза между
+# проверками очереди (сек), максимум попыток и пауза перед повтором
+# (сек, удваивается с каждой попыткой до OUTBOX_MAX_DELAY)
+OUTBOX_BATCH_SIZE: int = int(os.environ.get("OUTBOX_BATCH_SIZE", 50))
+OUTBOX_POLL_INTERVAL: float = float(os.environ.get("OUTBOX_POLL_INTERVAL", 5))
+OUTBOX_MAX_ATTEMPTS: int = int(os.environ.get("OUTBOX_MAX_ATTEMPTS", 8))
+OUTBOX_BASE_DELAY: float = float(os.environ.get("OUTBOX_BASE_DELAY", 30))
+OUTBOX_MAX_DELAY: float = float(os.environ.get("OUTBOX_MAX_DELAY", 3600))
+# Через сколько секунд доставка, зависшая в 'sending' (рассылка не записала
+# результат), снова забирается из outbox. Захват продлевается перед каждой
+# отправкой админу, поэтому значение должно быть больше самой долгой одной
+# отправки: загрузки крупного медиа плюс BOT_SEND_RETRIES повторов шлюза
+# Bot API с паузами RetryAfter
+OUTBOX_CLAIM_TIMEOUT: float = float(os.environ.get("OUTBOX_CLAIM_TIMEOUT", 900))
+
+# Настройки SQLite, применяются к каждому соединению: режим журнала, уровень
+# synchronous, сколько ждать снятия блокировки (мс), размер кэша страниц
+# (отрицательное значение - в КиБ) и размер отображения файла в память (байт)
+SQLITE_JOURNAL_MODE: str = os.environ.get("SQLITE_JOURNAL_MODE", "WAL")
+SQLITE_SYNCHRONOUS: str = os.environ.get("SQLITE_SYNCHRONOUS", "NORMAL")
+SQLITE_BUSY_TIMEOUT: int = int(os.environ.get("SQLITE_BUSY_TIMEOUT", 5000))
+SQLITE_CACHE_SIZE: int = int(os.environ.get("SQLITE_CACHE_SIZE", -64000))
+SQLITE_MMAP_SIZE: int = int(os.environ.get("SQLITE_MMAP_SIZE", 256 * 1024 * 1024))
+
+# Пакетная запись в БД: сколько операций записи объединять в одну транзакцию
+# и сколько секунд добирать пачку, если за первой операцией уже ждут другие
+# (одиночная запись не ждет)
+DB_WRITE_BATCH_SIZE: int = int(os.environ.get("DB_WRITE_BATCH_SIZE", 100))
+DB_WRITE_BATCH_DELAY: float = float(os.environ.get("DB_WRITE_BATCH_DELAY", 0.002))
+
+# Кэш постов для обработчиков кнопок админа: сколько постов держать
+# и сколько секунд снимок поста считается свежим
+POST_CACHE_SIZE: int = int(os.environ.get("POST_CACHE_SIZE", 1000))
+POST_CACHE_TTL: float = float(os.environ.get("POST_CACHE_TTL", 300))
+
+# Сколько постов читать за один запрос при постраничном обходе (db.posts.iter_posts)
+POSTS_PAGE_SIZE: int = int(os.environ.get("POSTS_PAGE_SIZE", 1000))
+
+# Поиск /search: сколько результатов показывать на одной странице
+# и среди скольких самых новых совпадений ранжировать результаты (bm25)
+SEARCH_PAGE_SIZE: int = int(os.environ.get("SEARCH_PAGE_SIZE", 10))
+SEARCH_MAX_MATCHES: int = int(os.environ.get("SEARCH_MAX_MATCHES", 5000))
+
+# Как часто (сек) обновлять last_seen канала в таблице channels: чаще одного
+# раза за интервал запись в channels не делается
+CHANNEL_TOUCH_INTERVAL: float = float(os.environ.get("CHANNEL_TOUCH_INTERVAL", 600))
+
+# Как часто (сек) писать в лог метрики очереди доставки, Telethon, outbox,
+# шлюза Bot API и БД (те же, что показывает /health); 0 - не писать
+METRICS_LOG_INTERVAL: float = float(os.environ.get("METRICS_LOG_INTERVAL", 300))
@@ -0,0 +1,78 @@
+import time
+from datetime import datetime
+from typing import Dict, Tuple
+
+from sqlalchemy import func
+from sqlalchemy.dialects.sqlite import insert
+from sqlalchemy.orm.attributes import set_committed_value
+
+from config import CHANNEL_TOUCH_INTERVAL
+from db.models import Channel, Post
+from db.writer import writer
+
+# Что уже записано в channels: chat_id -> (title, type, time.monotonic() записи)
+_known: Dict[int, Tuple[str, str, float]] = {}
+
+
+def needs_upsert(chat_id: int, title: str, chat_type: str) -> bool:
+    """
+    Нужно ли записывать канал вместе с постом
+
+    Да, если канал еще не записан этим процессом, сменил название или тип,
+    или last_seen не обновлялся дольше CHANNEL_TOUCH_INTERVAL.
+    """
+    known = _known.get(chat_id)
+    return (
+        known is None
+        or known[:2] != (title, chat_type)
+        or time.monotonic() - known[2] >= CHANNEL_TOUCH_INTERVAL
+    )
+
+
+def remember(chat_id: int, title: str, chat_type: str):
+    """Отмечает канал записанным (вызывается после commit)"""
+    _known[chat_id] = (title, chat_type, time.monotonic())
+
+
+def upsert_channel_stmt(chat_id: int, title: str, chat_type: str):
+    """Запрос INSERT ... ON CONFLICT DO UPDATE для канала: название, тип и last_seen"""
+    now = datetime.now()
+    stmt = insert(Channel).values(chat_id=chat_id, title=title, type=chat_type, first_seen=now, last_seen=now)
+    return stmt.on_conflict_do_update(
+        index_elements=[Channel.chat_id],
+        set_={'title': stmt.excluded.title, 'type': stmt.excluded.type, 'last_seen': stmt.excluded.last_seen}
+    )
+
+
+def fill_post(post: Post, title: str, chat_type: str):
+    """
+    Проставляет посту chat_title и chat_type без запроса к channels
+
+    Upsert с RETURNING не возвращает column_property, а читать их после
+    закрытия сессии нельзя; значения и так известны вызывающему коду.
+    """
+    set_committed_value(post, 'chat_title', title)
+    set_committed_value(post, 'chat_type', chat_type)
+
+
+async def mark_skipped(chat_id: int, title: str, chat_type: str, message_id: int):
+    """
+    Запоминает последнее сообщение чата, которое не сохраняется в posts
+    (отсеяно source_filter или повторяет пост другого канала)
+
+    Догрузка начинает чат с максимума из last_message_id и последнего
+    сохраненного поста, поэтому такие сообщения не перечитываются после
+    перезапуска. Если канала еще нет, он создается.
+    """
+    now = datetime.now()
+    stmt = insert(Channel).values(chat_id=chat_id, title=title, type=chat_type, first_seen=now, last_seen=now,
+                                  last_message_id=message_id)
+    stmt = stmt.on_conflict_do_update(
+        index_elements=[Channel.chat_id],
+        set_={'last_message_id': func.max(func.coalesce(Channel.last_message_id, 0), stmt.excluded.last_message_id)}
+    )
+
+    async def op(session):
+        await session.execute(stmt)
+
+    await writer.submit(op)
@@ -1,9 +1,10 @@
 from datetime import datetime
-from sqlalchemy import select
+from sqlalchemy import delete, exists, insert, select, update
+from sqlalchemy.orm import undefer
 import hashlib
-import json
 
-from db.models import Session, Digest
+from db.models import Session, Digest, DigestPost, Post
+from db.writer import writer
 
 
 async def save_digest(
@@ -13,11 +14,13 @@ async def save_digest(
 ) -> Digest:
     """
     Сохраняет дайджест в базу данных
+
+    Запись идет через db.writer и коммитится вместе с другими операциями пачки.
     """
     # Создаем уникальный хэш для идентификации
     digest_hash = hashlib.md5(digest_text.encode()).hexdigest()[:8]
 
-    async with Session() as session:
+    async def op(session) -> Digest:
         # Проверяем, нет ли уже такого дайджеста
         stmt = select(Digest).where(Digest.digest_hash == digest_hash)
         result = await session.execute(stmt)
@@ -28,23 +31,26 @@ async def save_digest(
             existing_digest.text = digest_text
             if edit_text:
                 existing_digest.edit_text = edit_text
-            if post_ids:
-                existing_digest.post_ids = json.dumps(post_ids)
             digest = existing_digest
         else:
             # Создаем новый дайджест
             digest = Digest(
                 digest_hash=digest_hash,
                 text=digest_text,
-                edit_text=edit_text,
-                post_ids=json.dumps(post_ids) if post_ids else None
+                edit_text=edit_text
             )
             session.add(digest)
 
-        await session.commit()
-        await session.refresh(digest)
+        await session.flush()
+        if post_ids:
+            await session.execute(delete(DigestPost).where(DigestPost.digest_id == digest.id))
+            await session.execute(insert(DigestPost), [
+                {'digest_id': digest.id, 'post_id': post_id} for post_id in dict.fromkeys(post_ids)
+            ])
         return digest
 
+    return await writer.submit(op)
+
 
 async def get_digest_by_hash(digest_hash: str) -> Digest:
     """
@@ -56,38 +62,97 @@ async def get_digest_by_hash(digest_hash: str) -> Digest:
         return result.scalar_one_or_none()
 
 
+async def update_digest(digest_hash: str, **values) -> bool:
+    """
+    Обновляет поля дайджеста одним UPDATE ... WHERE digest_hash = ? без загрузки строки
+
+    Возвращает False, если дайджеста с таким хэшем нет.
+    """
+    unknown = set(values) - set(Digest.__table__.columns.keys())
+    if unknown:
+        raise ValueError(f"Неизвестные поля дайджеста: {', '.join(sorted(unknown))}")
+    if not values:
+        return False
+
+    async def op(session) -> bool:
+        result = await session.execute(update(Digest).where(Digest.digest_hash == digest_hash).values(**values))
+        return result.rowcount > 0
+
+    return await writer.submit(op)
+
+
 async def update_digest_edit_text(digest_hash: str, edit_text: str) -> bool:
     """
     Обновляет отредактированный текст дайджеста
     """
+    return await update_digest(digest_hash, edit_text=edit_text)
+
+
+async def mark_digest_published(digest_hash: str) -> bool:
+    """
+    Отмечает дайджест как опубликованный
+    """
+    return await update_digest(digest_hash, published_at=datetime.now())
+
+
+async def get_digest_post_ids(digest_id: int) -> list[int]:
+    """
+    Возвращает ID постов, вошедших в дайджест
+    """
     async with Session() as session:
-        stmt = select(Digest).where(Digest.digest_hash == digest_hash)
+        stmt = select(DigestPost.post_id).where(DigestPost.digest_id == digest_id).order_by(DigestPost.post_id)
         result = await session.execute(stmt)
-        digest = result.scalar_one_or_none()
+        return list(result.scalars())
 
-        if digest:
-            digest.edit_text = edit_text
-            await session.commit()
-            return True
 
-        return False
+async def get_post_digests(post_id: int) -> list[Digest]:
+    """
+    Возвращает дайджесты, в которые вошел пост (по индексу ix_digest_posts_post)
+    """
+    async with Session() as session:
+        stmt = select(Digest).join(DigestPost, DigestPost.digest_id == Digest.id).where(
+            DigestPost.post_id == post_id
+        ).order_by(Digest.created_at.desc())
+        result = await session.execute(stmt)
+        return result.scalars().all()
 
 
-async def mark_digest_published(digest_hash: str) -> bool:
+def published_digest_exists(post_id_column=Post.id):
     """
-    Отмечает дайджест как опубликованный
+    Условие "пост уже вошел в опубликованный дайджест" для WHERE
+
+    Неопубликованные дайджесты не учитываются: их можно сформировать заново
+    из тех же постов.
+    """
+    return exists().where(
+        DigestPost.post_id == post_id_column,
+        DigestPost.digest_id == Digest.id,
+        Digest.published_at.is_not(None)
+    )
+
+
+async def is_post_digested(post_id: int) -> bool:
+    """
+    Проверяет, вошел ли пост в опубликованный дайджест
     """
     async with Session() as session:
-        stmt = select(Digest).where(Digest.digest_hash == digest_hash)
-        result = await session.execute(stmt)
-        digest = result.scalar_one_or_none()
+        result = await session.execute(select(published_digest_exists(post_id)))
+        return bool(result.scalar())
 
-        if digest:
-            digest.published_at = datetime.now()
-            await session.commit()
-            return True
 
-        return False
+async def get_posts_for_digest(since: datetime) -> list[Post]:
+    """
+    Посты, отмеченные для дайджеста с момента since, кроме тех,
+    что уже вошли в опубликованный дайджест (из текстов читается только text)
+    """
+    async with Session() as session:
+        stmt = select(Post).options(undefer(Post.text)).where(
+            Post.digest == True,
+            Post.received_at >= since,
+            ~published_digest_exists()
+        ).order_by(Post.received_at.desc())
+        result = await session.execute(stmt)
+        return result.scalars().all()
 
 
 async def get_recent_digests(limit: int = 10) -> list[Digest]:
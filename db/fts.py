@@ -0,0 +1,102 @@
+import html
+import re
+from typing import Optional
+
+from sqlalchemy import text
+from sqlalchemy.engine import Connection
+
+from logger import logger
+
+_TAG = re.compile(r'<[^>]+>')
+_WORD = re.compile(r'\w+')
+
+# Полнотекстовый индекс по text, ai_gen и edit_text постов. Сами тексты
+# хранятся только в posts (external content), в индекс попадает текст без
+# HTML-разметки. Индекс обновляют триггеры, поэтому любая запись в posts
+# (save_post, update_post, upsert в outbox) сразу видна поиску.
+#
+# Триггеры вызывают Python-функцию strip_html (register_functions), поэтому
+# писать в posts можно только из соединения, где она зарегистрирована.
+# Это жесткая зависимость: см. register_functions.
+_CREATE_TABLE = (
+    "CREATE VIRTUAL TABLE posts_fts USING fts5("
+    "text, ai_gen, edit_text, content='posts', content_rowid='id', "
+    "tokenize='unicode61 remove_diacritics 2')"
+)
+
+_COLUMNS = "rowid, text, ai_gen, edit_text"
+_NEW = "new.id, strip_html(new.text), strip_html(new.ai_gen), strip_html(new.edit_text)"
+_OLD = "'delete', old.id, strip_html(old.text), strip_html(old.ai_gen), strip_html(old.edit_text)"
+
+_TRIGGERS = (
+    f"CREATE TRIGGER IF NOT EXISTS posts_fts_insert AFTER INSERT ON posts BEGIN "
+    f"INSERT INTO posts_fts({_COLUMNS}) VALUES ({_NEW}); END",
+    f"CREATE TRIGGER IF NOT EXISTS posts_fts_delete AFTER DELETE ON posts BEGIN "
+    f"INSERT INTO posts_fts(posts_fts, {_COLUMNS}) VALUES ({_OLD}); END",
+    f"CREATE TRIGGER IF NOT EXISTS posts_fts_update AFTER UPDATE OF text, ai_gen, edit_text ON posts BEGIN "
+    f"INSERT INTO posts_fts(posts_fts, {_COLUMNS}) VALUES ({_OLD}); "
+    f"INSERT INTO posts_fts({_COLUMNS}) VALUES ({_NEW}); END",
+)
+
+
+def strip_html(value: Optional[str]) -> Optional[str]:
+    """Текст поста без HTML-тегов и с раскрытыми сущностями (&amp; и т.п.)"""
+    if not value:
+        return value
+    return html.unescape(_TAG.sub(' ', value))
+
+
+def register_functions(dbapi_connection, connection_record):
+    """
+    Регистрирует strip_html в каждом новом соединении SQLite.
+
+    Функцию вызывают триггеры posts_fts, поэтому любое INSERT, UPDATE
+    текстов или DELETE в posts из соединения без нее падает с ошибкой
+    "no such function: strip_html". Движок db.models регистрирует ее сам.
+    Внешним инструментам (скрипт обслуживания, резервное копирование с
+    записью, миграции вне db.migrations) нужно зарегистрировать ее так же:
+
+        import sqlite3
+        from db.fts import register_functions
+        conn = sqlite3.connect("db/database.db")
+        register_functions(conn, None)
+
+    Из консоли sqlite3 писать в posts нельзя; чтение и поиск работают
+    без функции.
+    """
+    dbapi_connection.create_function("strip_html", 1, strip_html, deterministic=True)
+
+
+def build_match(query: str) -> Optional[str]:
+    """
+    Превращает запрос админа в выражение FTS5 MATCH
+
+    Каждое слово ищется как префикс ("кот" найдет "котов"), все слова
+    должны встретиться в посте. Операторы FTS5 из запроса не
+    интерпретируются. Возвращает None, если в запросе нет слов.
+    """
+    words = _WORD.findall(query)
+    if not words:
+        return None
+    return ' '.join(f'"{word}"*' for word in words)
+
+
+def create_search_index(conn: Connection):
+    """
+    Создает полнотекстовый индекс постов и триггеры, если их еще нет.
+
+    При первом создании индексирует уже сохраненные посты.
+    """
+    exists = conn.execute(text(
+        "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'posts_fts'"
+    )).first()
+    if not exists:
+        conn.execute(text(_CREATE_TABLE))
+        result = conn.execute(text(
+            f"INSERT INTO posts_fts({_COLUMNS}) "
+            f"SELECT id, strip_html(text), strip_html(ai_gen), strip_html(edit_text) FROM posts"
+        ))
+        logger.info(f"Создан полнотекстовый индекс постов, проиндексировано: {result.rowcount}")
+
+    for trigger in _TRIGGERS:
+        conn.execute(text(trigger))
@@ -0,0 +1,235 @@
+import json
+import sqlite3
+
+from sqlalchemy import MetaData, inspect, text
+from sqlalchemy.engine import Connection
+from sqlalchemy.schema import CreateTable
+
+from db.fts import create_search_index
+from logger import logger
+
+
+def add_missing_columns(conn: Connection, metadata: MetaData):
+    """
+    Добавляет в существующие таблицы колонки, которые появились в моделях.
+
+    create_all создает только отсутствующие таблицы, поэтому новые колонки
+    в уже созданной базе нужно добавлять через ALTER TABLE. Подходит только
+    для nullable колонок без серверных значений по умолчанию.
+    """
+    inspector = inspect(conn)
+    for table in metadata.sorted_tables:
+        if not inspector.has_table(table.name):
+            continue
+
+        existing = {column["name"] for column in inspector.get_columns(table.name)}
+        for column in table.columns:
+            if column.name in existing:
+                continue
+
+            column_type = column.type.compile(dialect=conn.dialect)
+            conn.execute(text(f'ALTER TABLE {table.name} ADD COLUMN {column.name} {column_type}'))
+            logger.info(f"В таблицу {table.name} добавлена колонка {column.name}")
+
+
+def deduplicate_posts(conn: Connection):
+    """
+    Удаляет дубли постов с одинаковыми (chat_id, message_id), оставляя самый ранний.
+
+    До появления уникального индекса параллельные save_post могли
+    создать несколько строк для одного сообщения.
+    """
+    result = conn.execute(text(
+        'DELETE FROM posts WHERE id NOT IN '
+        '(SELECT MIN(id) FROM posts GROUP BY chat_id, message_id)'
+    ))
+    if result.rowcount:
+        logger.info(f"Удалено дублей постов: {result.rowcount}")
+
+
+def create_missing_indexes(conn: Connection, metadata: MetaData):
+    """
+    Создает индексы моделей, которых нет в существующих таблицах.
+
+    create_all создает индексы только вместе с новой таблицей.
+    """
+    inspector = inspect(conn)
+    for table in metadata.sorted_tables:
+        existing = {index["name"] for index in inspector.get_indexes(table.name)}
+        for index in table.indexes:
+            if index.name in existing:
+                continue
+
+            if table.name == 'posts' and index.name == 'ux_posts_chat_message':
+                deduplicate_posts(conn)
+            index.create(conn)
+            logger.info(f"Для таблицы {table.name} создан индекс {index.name}")
+
+
+# Начало часа поступления поста в формате, в котором SQLAlchemy хранит DateTime
+_HOUR = "strftime('%Y-%m-%d %H:00:00.000000', coalesce({row}.received_at, datetime('now', 'localtime')))"
+
+# Триггеры сводок /stats (post_counters, post_hourly): счетчики меняются
+# вместе с posts в той же транзакции, поэтому /stats не сканирует posts
+_STATS_TRIGGERS = (
+    "CREATE TRIGGER posts_stats_insert AFTER INSERT ON posts BEGIN "
+    "INSERT INTO post_counters (chat_id, content_type, posts, digest) "
+    "VALUES (new.chat_id, new.content_type, 1, coalesce(new.digest, 0)) "
+    "ON CONFLICT (chat_id, content_type) DO UPDATE SET "
+    "posts = posts + 1, digest = digest + excluded.digest; "
+    f"INSERT INTO post_hourly (hour, posts) VALUES ({_HOUR.format(row='new')}, 1) "
+    "ON CONFLICT (hour) DO UPDATE SET posts = posts + 1; "
+    "END",
+    "CREATE TRIGGER posts_stats_delete AFTER DELETE ON posts BEGIN "
+    "UPDATE post_counters SET posts = posts - 1, digest = digest - coalesce(old.digest, 0) "
+    "WHERE chat_id = old.chat_id AND content_type = old.content_type; "
+    f"UPDATE post_hourly SET posts = posts - 1 WHERE hour = {_HOUR.format(row='old')}; "
+    "END",
+    "CREATE TRIGGER posts_stats_digest AFTER UPDATE OF digest ON posts "
+    "WHEN coalesce(old.digest, 0) != coalesce(new.digest, 0) BEGIN "
+    "UPDATE post_counters SET digest = digest + coalesce(new.digest, 0) - coalesce(old.digest, 0) "
+    "WHERE chat_id = new.chat_id AND content_type = new.content_type; "
+    "END",
+)
+
+
+def create_stats_rollups(conn: Connection):
+    """
+    Заполняет сводки /stats по уже сохраненным постам и создает триггеры.
+
+    Выполняется один раз: пока триггеров нет, сводки пересчитываются
+    из posts через GROUP BY, дальше их ведут триггеры.
+    """
+    exists = conn.execute(text(
+        "SELECT 1 FROM sqlite_master WHERE type = 'trigger' AND name = 'posts_stats_insert'"
+    )).first()
+    if exists:
+        return
+
+    conn.execute(text("DELETE FROM post_counters"))
+    conn.execute(text("DELETE FROM post_hourly"))
+    conn.execute(text(
+        "INSERT INTO post_counters (chat_id, content_type, posts, digest) "
+        "SELECT chat_id, content_type, count(*), coalesce(sum(digest), 0) "
+        "FROM posts GROUP BY chat_id, content_type"
+    ))
+    conn.execute(text(
+        f"INSERT INTO post_hourly (hour, posts) SELECT {_HOUR.format(row='posts')} AS bucket, count(*) "
+        "FROM posts GROUP BY bucket"
+    ))
+    for trigger in _STATS_TRIGGERS:
+        conn.execute(text(trigger))
+    logger.info("Созданы сводки статистики постов")
+
+
+def migrate_channels(conn: Connection, metadata: MetaData):
+    """
+    Переносит название и тип чата из каждой строки posts в таблицу channels.
+
+    Берутся значения из последнего сохраненного поста чата, first_seen и
+    last_seen - по received_at. Затем колонки chat_title и chat_type
+    удаляются из posts (ALTER TABLE DROP COLUMN, SQLite 3.35+), а сводка
+    post_counters пересоздается без chat_title. Триггеры сводок ссылались на
+    new.chat_title, поэтому они удаляются и заново создаются
+    create_stats_rollups. В SQLite старше 3.35 колонки удаляются
+    пересозданием таблицы (rebuild_posts).
+    """
+    columns = {column["name"] for column in inspect(conn).get_columns("posts")}
+    if "chat_title" not in columns:
+        return
+
+    result = conn.execute(text(
+        "INSERT INTO channels (chat_id, title, type, first_seen, last_seen) "
+        "SELECT p.chat_id, p.chat_title, p.chat_type, seen.first_seen, seen.last_seen "
+        "FROM (SELECT chat_id, max(id) AS last_id, min(received_at) AS first_seen, max(received_at) AS last_seen "
+        "FROM posts GROUP BY chat_id) AS seen JOIN posts AS p ON p.id = seen.last_id "
+        "WHERE true ON CONFLICT (chat_id) DO NOTHING"
+    ))
+    logger.info(f"В channels перенесены чаты из posts: {result.rowcount}")
+
+    for trigger in ("posts_stats_insert", "posts_stats_delete", "posts_stats_digest"):
+        conn.execute(text(f"DROP TRIGGER IF EXISTS {trigger}"))
+    conn.execute(text("DROP TABLE IF EXISTS post_counters"))
+    metadata.tables["post_counters"].create(conn)
+
+    if sqlite3.sqlite_version_info >= (3, 35, 0):
+        conn.execute(text("ALTER TABLE posts DROP COLUMN chat_title"))
+        if "chat_type" in columns:
+            conn.execute(text("ALTER TABLE posts DROP COLUMN chat_type"))
+    else:
+        rebuild_posts(conn, metadata)
+    logger.info("Из posts удалены колонки chat_title и chat_type")
+
+
+def rebuild_posts(conn: Connection, metadata: MetaData):
+    """
+    Пересоздает таблицу posts по модели, сохраняя строки и их id.
+
+    Замена ALTER TABLE DROP COLUMN для SQLite старше 3.35: новая таблица
+    создается под временным именем, в нее копируются колонки модели, старая
+    удаляется вместе со своими индексами и триггерами, новая переименовывается.
+    Индексы создаются заново здесь, триггеры полнотекстового поиска и сводок -
+    create_search_index и create_stats_rollups, которые идут следом.
+    """
+    posts = metadata.tables["posts"]
+    # Таблицы, на которые ссылается posts, нужны рядом с копией для FOREIGN KEY
+    scratch = MetaData()
+    for foreign_key in posts.foreign_keys:
+        foreign_key.column.table.to_metadata(scratch)
+    rebuilt = posts.to_metadata(scratch, name="posts_rebuild")
+    columns = ", ".join(column.name for column in posts.columns)
+
+    conn.execute(CreateTable(rebuilt))
+    conn.execute(text(f"INSERT INTO posts_rebuild ({columns}) SELECT {columns} FROM posts"))
+    conn.execute(text("DROP TABLE posts"))
+    conn.execute(text("ALTER TABLE posts_rebuild RENAME TO posts"))
+    for index in posts.indexes:
+        index.create(conn)
+    logger.info(f"Таблица posts пересоздана (SQLite {sqlite3.sqlite_version} не поддерживает DROP COLUMN)")
+
+
+def _parse_post_ids(value) -> list:
+    """ID постов из старой колонки digests.post_ids (json.dumps, сохраненный еще и как JSON)"""
+    while isinstance(value, str):
+        try:
+            value = json.loads(value)
+        except ValueError:
+            return []
+    return [int(post_id) for post_id in value] if isinstance(value, list) else []
+
+
+def migrate_digest_post_ids(conn: Connection):
+    """
+    Переносит ID постов из JSON-колонки digests.post_ids в таблицу digest_posts.
+
+    Перенесенные значения обнуляются, поэтому повторный запуск ничего не делает.
+    Ссылки на посты, которых уже нет, пропускаются.
+    """
+    columns = {column["name"] for column in inspect(conn).get_columns("digests")}
+    if "post_ids" not in columns:
+        return
+
+    rows = conn.execute(text("SELECT id, post_ids FROM digests WHERE post_ids IS NOT NULL")).all()
+    links = [
+        {"digest_id": digest_id, "post_id": post_id}
+        for digest_id, post_ids in rows
+        for post_id in _parse_post_ids(post_ids)
+    ]
+    if links:
+        conn.execute(text(
+            "INSERT OR IGNORE INTO digest_posts (digest_id, post_id) "
+            "SELECT :digest_id, id FROM posts WHERE id = :post_id"
+        ), links)
+    if rows:
+        conn.execute(text("UPDATE digests SET post_ids = NULL WHERE post_ids IS NOT NULL"))
+        logger.info(f"В digest_posts перенесены посты дайджестов: {len(rows)}")
+
+
+def run_migrations(conn: Connection, metadata: MetaData):
+    """Приводит схему существующей базы к моделям"""
+    add_missing_columns(conn, metadata)
+    create_missing_indexes(conn, metadata)
+    migrate_channels(conn, metadata)
+    create_search_index(conn)
+    create_stats_rollups(conn)
+    migrate_digest_post_ids(conn)
@@ -1,49 +1,115 @@
-from sqlalchemy import Column, Integer, String, DateTime, Boolean, BigInteger, ForeignKey, Text, JSON
+from sqlalchemy import Column, Integer, String, DateTime, Boolean, BigInteger, ForeignKey, Text, JSON, Index, event, \
+    select
 from sqlalchemy.ext.asyncio import create_async_engine, async_sessionmaker, AsyncAttrs
-from sqlalchemy.orm import DeclarativeBase, relationship
+from sqlalchemy.orm import DeclarativeBase, relationship, column_property, deferred
 from datetime import datetime
 
+from config import (SQLITE_JOURNAL_MODE, SQLITE_SYNCHRONOUS, SQLITE_BUSY_TIMEOUT, SQLITE_CACHE_SIZE,
+                    SQLITE_MMAP_SIZE)
+from db.fts import register_functions
+from db.migrations import run_migrations
+
 # Настройка асинхронного подключения к SQLite3
 DB_URL = "sqlite+aiosqlite:///db/database.db"
 engine = create_async_engine(DB_URL)  # Асинхронный движок SQLAlchemy
 Session = async_sessionmaker(expire_on_commit=False, bind=engine)  # Фабрика сессий
 
 
+def apply_pragmas(dbapi_connection, connection_record):
+    """
+    Настраивает каждое новое соединение SQLite.
+
+    WAL позволяет читать во время записи, busy_timeout заставляет ждать
+    снятия блокировки вместо ошибки "database is locked", а с
+    synchronous=NORMAL в режиме WAL fsync делается только при checkpoint.
+    """
+    cursor = dbapi_connection.cursor()
+    cursor.execute(f"PRAGMA journal_mode={SQLITE_JOURNAL_MODE}")
+    cursor.execute(f"PRAGMA synchronous={SQLITE_SYNCHRONOUS}")
+    cursor.execute(f"PRAGMA busy_timeout={SQLITE_BUSY_TIMEOUT}")
+    cursor.execute(f"PRAGMA cache_size={SQLITE_CACHE_SIZE}")
+    cursor.execute(f"PRAGMA mmap_size={SQLITE_MMAP_SIZE}")
+    cursor.execute("PRAGMA temp_store=MEMORY")
+    cursor.close()
+
+
+event.listen(engine.sync_engine, "connect", apply_pragmas)
+event.listen(engine.sync_engine, "connect", register_functions)
+
+
 class Base(DeclarativeBase, AsyncAttrs):
     pass
 
 
+# Группа отложенных колонок Post с текстами (text, ai_gen, edit_text)
+POST_CONTENT = "content"
+
+
+class Channel(Base):
+    """Каналы и группы, из которых приходят посты (ведется через db.channels)"""
+    __tablename__ = "channels"
+
+    chat_id = Column(BigInteger, primary_key=True, autoincrement=False)  # ID чата без префикса -100
+    title = Column(String(255), nullable=False)  # Последнее известное название
+    type = Column(String(50), nullable=False)  # 'channel' или 'group'
+    first_seen = Column(DateTime, default=datetime.now)  # Первый пост из чата
+    last_seen = Column(DateTime, default=datetime.now)  # Последний пост (с точностью до CHANNEL_TOUCH_INTERVAL)
+    # Последнее сообщение, отсеянное фильтром или признанное копией (в posts не попадает),
+    # с него начинается догрузка, если оно новее последнего сохраненного поста
+    last_message_id = Column(BigInteger, nullable=True)
+
+
 class Post(Base):
     """Таблица для хранения постов из каналов"""
     __tablename__ = "posts"
 
     id = Column(Integer, primary_key=True, autoincrement=True)
-    chat_id = Column(BigInteger, nullable=False)  # ID чата/канала
-    chat_title = Column(String(255), nullable=False)  # Название чата
-    chat_type = Column(String(50), nullable=False)  # Тип чата: 'channel' или 'group'
+    chat_id = Column(BigInteger, ForeignKey("channels.chat_id"), nullable=False)  # ID чата/канала
+    # Название и тип чата берутся из channels при чтении поста
+    chat_title = column_property(
+        select(Channel.title).where(Channel.chat_id == chat_id).correlate_except(Channel).scalar_subquery()
+    )
+    chat_type = column_property(
+        select(Channel.type).where(Channel.chat_id == chat_id).correlate_except(Channel).scalar_subquery()
+    )
     message_id = Column(BigInteger, nullable=False)  # ID сообщения в чате
-    grouped_id = Column(BigInteger, nullable=True)  # ID медиагруппы (пока пустое поле, медиагруппы не обрабатываем)
+    grouped_id = Column(BigInteger, nullable=True)  # ID медиагруппы
 
     # Тип контента
     content_type = Column(String(50),
-                          nullable=False)  # 'text', 'photo', 'video', 'document', 'audio', 'voice'
+                          nullable=False)  # 'text', 'photo', 'video', 'document', 'audio', 'voice', 'media_group'
 
-    # Текст сообщения
-    text = Column(Text, nullable=True)
+    # Текст сообщения. text, ai_gen и edit_text не ограничены по размеру и
+    # входят в группу POST_CONTENT: select(Post) их не читает, нужны
+    # undefer_group(POST_CONTENT) или undefer(Post.text). Обращение к
+    # незагруженному полю - ошибка, а не скрытый запрос (raiseload).
+    text = deferred(Column(Text, nullable=True), group=POST_CONTENT, raiseload=True)
 
     # Telegram file_id (если есть)
-    file_id = Column(String(255), nullable=True)  # медиа файл
+    file_id = Column(String(255), nullable=True)  # медиа файл (для медиагруппы - первый файл)
+    media = Column(JSON, nullable=True)  # Состав медиагруппы: [{"type": "photo", "file_id": "..."}]
 
     # Статусы
     digest = Column(Boolean, default=False)  # Включен ли в дайджест
-    ai_gen = Column(Text, nullable=True)  # Сгенерированный AI текст
-    edit_text = Column(Text, nullable=True)  # Сгенерированный AI текст
+    ai_gen = deferred(Column(Text, nullable=True), group=POST_CONTENT, raiseload=True)  # Сгенерированный AI текст
+    edit_text = deferred(Column(Text, nullable=True), group=POST_CONTENT, raiseload=True)  # Отредактированный текст
 
     # Временные метки
     original_date = Column(DateTime, nullable=False)  # Оригинальная дата сообщения
     received_at = Column(DateTime, default=datetime.now)  # Когда получено админом
     processed_at = Column(DateTime, nullable=True)  # Когда обработано
 
+    __table_args__ = (
+        # Одно сообщение канала - один пост, по этому ключу работает upsert в save_post
+        Index('ux_posts_chat_message', 'chat_id', 'message_id', unique=True),
+        # Посты для дайджеста: digest = 1 AND received_at >= ...
+        Index('ix_posts_digest_received', 'digest', 'received_at'),
+        # Лента постов get_posts: ORDER BY original_date DESC (id - для стабильного порядка)
+        Index('ix_posts_original_date', 'original_date', 'id'),
+        # Лента постов одного чата: WHERE chat_id = ? ORDER BY original_date DESC
+        Index('ix_posts_chat_original_date', 'chat_id', 'original_date'),
+    )
+
 
 class Digest(Base):
     """Таблица для хранения дайджестов"""
@@ -55,9 +121,64 @@ class Digest(Base):
     edit_text = Column(Text, nullable=True)  # Отредактированный текст
     created_at = Column(DateTime, default=datetime.now)  # Дата создания
     published_at = Column(DateTime, nullable=True)  # Дата публикации
-    post_ids = Column(JSON, nullable=True)  # JSON массив с ID постов, вошедших в дайджест
+    # Посты дайджеста хранятся в digest_posts. Старая колонка post_ids (JSON)
+    # остается в существующих базах, migrate_digest_post_ids переносит ее в digest_posts.
+
+
+class DigestPost(Base):
+    """Посты, вошедшие в дайджест"""
+    __tablename__ = "digest_posts"
+
+    digest_id = Column(Integer, ForeignKey("digests.id"), primary_key=True)
+    post_id = Column(Integer, ForeignKey("posts.id"), primary_key=True)
+
+    __table_args__ = (
+        # В какие дайджесты попал пост (первичный ключ отвечает на обратный вопрос)
+        Index('ix_digest_posts_post', 'post_id', 'digest_id'),
+    )
+
+
+class PostCounter(Base):
+    """Сводка для /stats: число постов по чату и типу контента (ведется триггерами на posts)"""
+    __tablename__ = "post_counters"
+
+    chat_id = Column(BigInteger, primary_key=True)
+    content_type = Column(String(50), primary_key=True)
+    posts = Column(Integer, nullable=False, default=0)  # Всего постов
+    digest = Column(Integer, nullable=False, default=0)  # Из них в дайджесте
+
+
+class PostHourly(Base):
+    """Сводка для /stats: сколько постов поступило за каждый час (по received_at)"""
+    __tablename__ = "post_hourly"
+
+    hour = Column(DateTime, primary_key=True)  # Начало часа
+    posts = Column(Integer, nullable=False, default=0)
+
+
+class Delivery(Base):
+    """Очередь доставки постов администраторам (outbox)"""
+    __tablename__ = "outbox"
+
+    id = Column(Integer, primary_key=True, autoincrement=True)
+    post_id = Column(Integer, ForeignKey("posts.id"), nullable=False)  # Доставляемый пост
+    admin_id = Column(BigInteger, nullable=False)  # Кому доставить
+    status = Column(String(20), nullable=False, default='pending')  # 'pending', 'sending', 'sent', 'failed'
+    attempts = Column(Integer, nullable=False, default=0)  # Число попыток (захватов), метка текущего захвата
+    next_attempt_at = Column(DateTime, nullable=False, default=datetime.now)  # Когда пробовать снова
+    last_error = Column(Text, nullable=True)  # Текст последней ошибки
+    created_at = Column(DateTime, default=datetime.now)
+    sent_at = Column(DateTime, nullable=True)
+
+    __table_args__ = (
+        # Один пост доставляется каждому админу один раз
+        Index('ux_outbox_post_admin', 'post_id', 'admin_id', unique=True),
+        # Выборка доставок, которые пора отправить
+        Index('ix_outbox_status_next', 'status', 'next_attempt_at'),
+    )
 
 
 async def create_tables():
     async with engine.begin() as conn:
         await conn.run_sync(Base.metadata.create_all)
+        await conn.run_sync(run_migrations, Base.metadata)
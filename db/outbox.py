@@ -0,0 +1,159 @@
+from datetime import datetime, timedelta
+from typing import Dict, List, Tuple
+
+from sqlalchemy import func, select, update
+from sqlalchemy.dialects.sqlite import insert
+
+from config import OUTBOX_MAX_ATTEMPTS, OUTBOX_BASE_DELAY, OUTBOX_MAX_DELAY, OUTBOX_CLAIM_TIMEOUT
+from db.models import Session, Post, Delivery
+from db.posts import save_post_with
+from db.writer import writer
+
+
+def _claim_expiry() -> datetime:
+    """До какого момента доставка в 'sending' считается занятой рассылкой"""
+    return datetime.now() + timedelta(seconds=OUTBOX_CLAIM_TIMEOUT)
+
+
+def _claimed(post_id: int, admin_id: int, attempts: int):
+    """
+    Условие "доставка все еще занята этим захватом"
+
+    Каждый захват увеличивает attempts, поэтому если доставку после истечения
+    срока забрал другой обработчик, старый захват с ней больше не совпадает.
+    """
+    return (
+        Delivery.post_id == post_id,
+        Delivery.admin_id == admin_id,
+        Delivery.status == 'sending',
+        Delivery.attempts == attempts,
+    )
+
+
+def _retry_delay(attempts: int) -> timedelta:
+    """Пауза перед следующей попыткой: удваивается с каждой неудачей"""
+    return timedelta(seconds=min(OUTBOX_MAX_DELAY, OUTBOX_BASE_DELAY * 2 ** (attempts - 1)))
+
+
+async def save_post_with_deliveries(admin_ids: List[int], **fields) -> Tuple[Post, Dict[int, int]]:
+    """
+    Сохраняет пост и доставки админам в одной транзакции (db.posts.save_post_with)
+
+    fields - поля поста, как у db.posts.save_post. Новые доставки сразу
+    получают статус 'sending' и первый захват (attempts = 1): их отправляет
+    вызывающий код, а если результат не будет записан, через
+    OUTBOX_CLAIM_TIMEOUT их снова заберет claim_deliveries (после
+    перезапуска - сразу release_claims).
+    Возвращает пост и захваты доставок админам, которым пост еще не
+    доставлялся: admin_id -> attempts (повторное сохранение того же
+    сообщения новых доставок не создает).
+    """
+    async def add_deliveries(session, post: Post) -> Dict[int, int]:
+        if not admin_ids:
+            return {}
+        claimed_until = _claim_expiry()
+        stmt = insert(Delivery).values([
+            {'post_id': post.id, 'admin_id': admin_id, 'status': 'sending', 'attempts': 1,
+             'next_attempt_at': claimed_until}
+            for admin_id in admin_ids
+        ]).on_conflict_do_nothing(index_elements=[Delivery.post_id, Delivery.admin_id])
+        result = await session.execute(stmt.returning(Delivery.admin_id, Delivery.attempts))
+        return dict(result.all())
+
+    return await save_post_with(add_deliveries, **fields)
+
+
+async def claim_deliveries(limit: int) -> list:
+    """
+    Забирает доставки, которые пора отправить: строки (id, post_id, admin_id, attempts)
+
+    Один UPDATE ... RETURNING переводит их в 'sending' и увеличивает attempts,
+    поэтому одна доставка не достанется двум обработчикам, а attempts служит
+    меткой захвата для renew_claim и complete_deliveries. У доставки в
+    'sending' next_attempt_at - срок, до которого ее результат ждут: если он
+    прошел, а результат так и не записан, доставка забирается снова.
+    """
+    due = select(Delivery.id).where(
+        Delivery.status.in_(('pending', 'sending')),
+        Delivery.next_attempt_at <= datetime.now()
+    ).order_by(Delivery.next_attempt_at).limit(limit)
+
+    stmt = update(Delivery).where(Delivery.id.in_(due)).values(
+        status='sending', attempts=Delivery.attempts + 1, next_attempt_at=_claim_expiry()
+    ).returning(
+        Delivery.id, Delivery.post_id, Delivery.admin_id, Delivery.attempts
+    )
+    async with Session() as session:
+        result = await session.execute(stmt)
+        rows = result.all()
+        await session.commit()
+        return rows
+
+
+async def renew_claim(post_id: int, admin_id: int, attempts: int) -> bool:
+    """
+    Продлевает захват доставки перед отправкой админу на OUTBOX_CLAIM_TIMEOUT
+
+    Возвращает False, если доставку уже забрал другой обработчик (захват
+    истек во время долгой рассылки) - тогда отправлять ее нельзя, иначе
+    админ получит пост дважды.
+    """
+    async def op(session) -> bool:
+        result = await session.execute(
+            update(Delivery).where(*_claimed(post_id, admin_id, attempts)).values(next_attempt_at=_claim_expiry())
+        )
+        return result.rowcount == 1
+
+    return await writer.submit(op)
+
+
+async def complete_deliveries(post_id: int, claims: Dict[int, int], errors: Dict[int, str]) -> int:
+    """
+    Отмечает результат отправки поста по захватам claims (admin_id -> attempts)
+
+    Админы без ошибки в errors получают статус 'sent', остальным доставка
+    откладывается с растущей паузой, а после OUTBOX_MAX_ATTEMPTS попыток
+    получает статус 'failed'. Доставки, которые уже забрал другой
+    обработчик, не меняются. Возвращает число окончательно неудачных доставок.
+    """
+    now = datetime.now()
+
+    async def op(session) -> int:
+        failed = 0
+        for admin_id, attempts in claims.items():
+            if admin_id not in errors:
+                values = {'status': 'sent', 'sent_at': now, 'last_error': None}
+            else:
+                values = {
+                    'status': 'failed' if attempts >= OUTBOX_MAX_ATTEMPTS else 'pending',
+                    'next_attempt_at': now + _retry_delay(attempts),
+                    'last_error': errors[admin_id][:1000],
+                }
+            result = await session.execute(
+                update(Delivery).where(*_claimed(post_id, admin_id, attempts)).values(**values)
+            )
+            failed += result.rowcount == 1 and values['status'] == 'failed'
+        return failed
+
+    return await writer.submit(op)
+
+
+async def release_claims() -> int:
+    """
+    Возвращает в очередь доставки, зависшие в 'sending'
+
+    Вызывается при старте: такие доставки остались от упавшего процесса.
+    """
+    async with Session() as session:
+        result = await session.execute(
+            update(Delivery).where(Delivery.status == 'sending').values(status='pending', next_attempt_at=datetime.now())
+        )
+        await session.commit()
+        return result.rowcount
+
+
+async def get_outbox_stats() -> Dict[str, int]:
+    """Возвращает число доставок в каждом статусе"""
+    async with Session() as session:
+        result = await session.execute(select(Delivery.status, func.count()).group_by(Delivery.status))
+        return dict(result.all())
@@ -0,0 +1,70 @@
+import time
+from collections import OrderedDict
+from typing import Dict, Optional, Tuple
+
+from config import POST_CACHE_SIZE, POST_CACHE_TTL
+from db.models import Post
+
+# Снимки постов по id: (время истечения по time.monotonic(), Post), вытеснение по LRU
+_cache: "OrderedDict[int, Tuple[float, Post]]" = OrderedDict()
+
+# Растет при каждой инвалидации. Чтение из БД, начатое до записи,
+# не должно положить в кэш уже устаревший снимок.
+_generation = 0
+
+_metrics: Dict[str, int] = {
+    "hits": 0,
+    "misses": 0,
+    "invalidations": 0,
+}
+
+
+def generation() -> int:
+    """Текущее поколение кэша: запоминается перед чтением поста из БД"""
+    return _generation
+
+
+def peek(post_id: int) -> Optional[Post]:
+    """Возвращает свежий снимок поста из кэша, не трогая счетчики попаданий и промахов"""
+    entry = _cache.get(post_id)
+    if entry is None or entry[0] < time.monotonic():
+        if entry is not None:
+            del _cache[post_id]
+        return None
+    _cache.move_to_end(post_id)
+    return entry[1]
+
+
+def get(post_id: int) -> Optional[Post]:
+    """Возвращает свежий снимок поста из кэша (промах - чтение из БД, которое заполнит кэш)"""
+    post = peek(post_id)
+    _metrics["hits" if post is not None else "misses"] += 1
+    return post
+
+
+def put(post: Post, read_generation: int):
+    """
+    Кладет снимок поста в кэш
+
+    read_generation - значение generation() до чтения из БД. Если с тех пор
+    были записи, снимок мог устареть и в кэш не попадает.
+    """
+    if read_generation != _generation:
+        return
+    _cache[post.id] = (time.monotonic() + POST_CACHE_TTL, post)
+    _cache.move_to_end(post.id)
+    while len(_cache) > POST_CACHE_SIZE:
+        _cache.popitem(last=False)
+
+
+def invalidate(post_id: int):
+    """Удаляет пост из кэша после записи"""
+    global _generation
+    _generation += 1
+    _metrics["invalidations"] += 1
+    _cache.pop(post_id, None)
+
+
+def get_metrics() -> Dict[str, int]:
+    """Возвращает счетчики попаданий и промахов кэша и его размер"""
+    return {**_metrics, "size": len(_cache)}
@@ -1,7 +1,98 @@
+from collections import namedtuple
 from datetime import datetime
-from sqlalchemy import select
+from typing import Any, AsyncIterator, Awaitable, Callable, Optional, Tuple
 
-from db.models import Session, Post
+from sqlalchemy import func, select, text, tuple_, update
+from sqlalchemy.dialects.sqlite import insert
+from sqlalchemy.orm import undefer_group
+
+from config import POSTS_PAGE_SIZE, SEARCH_PAGE_SIZE, SEARCH_MAX_MATCHES
+from db import channels, post_cache
+from db.fts import build_match
+from db.models import Session, Channel, Post, POST_CONTENT
+from db.writer import writer
+
+# Поля поста без text, ai_gen и edit_text: тип контента, медиа, флаги и даты.
+# Хватает для проверок статуса и перестроения клавиатур админа.
+POST_META_COLUMNS = (
+    Post.id, Post.chat_id, Post.message_id, Post.grouped_id, Post.content_type, Post.file_id, Post.media,
+    Post.digest, Post.original_date, Post.received_at, Post.processed_at
+)
+
+# Неизменяемый снимок POST_META_COLUMNS (результат get_post_meta)
+PostMeta = namedtuple("PostMeta", [column.key for column in POST_META_COLUMNS])
+
+
+def with_content(stmt):
+    """Добавляет к select(Post) загрузку отложенных text, ai_gen и edit_text"""
+    return stmt.options(undefer_group(POST_CONTENT))
+
+
+def upsert_post_stmt(
+        chat_id: int,
+        message_id: int,
+        content_type: str,
+        text: str = None,
+        file_id: str = None,
+        original_date: datetime = None,
+        grouped_id: int = None,
+        media: list = None
+):
+    """
+    Запрос INSERT ... ON CONFLICT DO UPDATE ... RETURNING для поста
+
+    Повторное сохранение того же сообщения (уникальный ключ chat_id, message_id)
+    обновляет текст, а уже известные file_id и media не затирает.
+    Название и тип чата хранятся в channels, см. db.channels.upsert_channel_stmt.
+    """
+    stmt = insert(Post).values(
+        chat_id=chat_id,
+        message_id=message_id,
+        grouped_id=grouped_id,
+        content_type=content_type,
+        text=text,  # Сохраняем HTML разметку
+        file_id=file_id,
+        media=media,
+        original_date=original_date or datetime.now()
+    )
+    return stmt.on_conflict_do_update(
+        index_elements=[Post.chat_id, Post.message_id],
+        set_={
+            'text': stmt.excluded.text,
+            'file_id': func.coalesce(stmt.excluded.file_id, Post.file_id),
+            'media': func.coalesce(stmt.excluded.media, Post.media),
+            'received_at': datetime.now(),
+        }
+    ).returning(Post)
+
+
+async def save_post_with(extra: Optional[Callable[[Any, Post], Awaitable[Any]]],
+                         chat_id: int, chat_title: str, chat_type: str, **fields) -> Tuple[Post, Any]:
+    """
+    Сохраняет пост и выполняет extra(session, post) в той же транзакции
+
+    Общая часть save_post и db.outbox.save_post_with_deliveries: upsert
+    канала (только при первом посте, смене названия или раз в
+    CHANNEL_TOUCH_INTERVAL) и поста через db.writer, затем сброс снимка
+    в db.post_cache. fields - остальные аргументы upsert_post_stmt.
+    Возвращает пост и результат extra (None, если extra не задан).
+    """
+    stmt = upsert_post_stmt(chat_id=chat_id, **fields)
+    touch = channels.needs_upsert(chat_id, chat_title, chat_type)
+
+    async def op(session) -> Tuple[Post, Any]:
+        if touch:
+            await session.execute(channels.upsert_channel_stmt(chat_id, chat_title, chat_type))
+        result = await session.scalars(stmt, execution_options={"populate_existing": True})
+        post = result.one()
+        return post, (await extra(session, post) if extra else None)
+
+    post, extra_result = await writer.submit(op)
+    if touch:
+        channels.remember(chat_id, chat_title, chat_type)
+    channels.fill_post(post, chat_title, chat_type)
+    post_cache.invalidate(post.id)
+    return post, extra_result
 
 
 async def save_post(
@@ -12,43 +103,92 @@ async def save_post(
         content_type: str,
         text: str = None,
         file_id: str = None,
-        original_date: datetime = None
+        original_date: datetime = None,
+        grouped_id: int = None,
+        media: list = None
 ) -> Post:
     """
     Сохраняет пост в базу данных
+
+    Один запрос INSERT ... ON CONFLICT DO UPDATE по уникальному ключу
+    (chat_id, message_id), см. upsert_post_stmt. Запись идет через
+    db.writer и коммитится вместе с другими операциями пачки.
     """
+    post, _ = await save_post_with(
+        None,
+        chat_id=chat_id,
+        chat_title=chat_title,
+        chat_type=chat_type,
+        message_id=message_id,
+        content_type=content_type,
+        text=text,
+        file_id=file_id,
+        original_date=original_date,
+        grouped_id=grouped_id,
+        media=media
+    )
+    return post
+
+
+async def update_post(post_id: int, **values) -> bool:
+    """
+    Обновляет поля поста одним UPDATE ... WHERE id = ? без загрузки строки
+
+    values - имена колонок Post и новые значения. Возвращает False,
+    если поста с таким id нет.
+    """
+    unknown = set(values) - set(Post.__table__.columns.keys())
+    if unknown:
+        raise ValueError(f"Неизвестные поля поста: {', '.join(sorted(unknown))}")
+    if not values:
+        return False
+
+    async def op(session) -> bool:
+        result = await session.execute(update(Post).where(Post.id == post_id).values(**values))
+        return result.rowcount > 0
+
+    try:
+        return await writer.submit(op)
+    finally:
+        post_cache.invalidate(post_id)
+
+
+async def update_post_file_id(post_id: int, file_id: str, media: list = None) -> bool:
+    """
+    Записывает file_id загруженного в Telegram медиа (и состав медиагруппы)
+    """
+    values = {'file_id': file_id}
+    if media is not None:
+        values['media'] = media
+    return await update_post(post_id, **values)
+
+
+async def get_last_message_ids() -> list:
+    """
+    Возвращает для каждого чата, с которого начинать догрузку:
+    строки (chat_id, chat_type, message_id, grouped_id)
+
+    message_id - последний сохраненный пост или channels.last_message_id
+    (последнее отсеянное сообщение), смотря что новее. grouped_id - медиагруппа
+    последнего сохраненного поста: SQLite берет его из той же строки,
+    где найден MAX(message_id).
+    """
+    last = select(
+        Post.chat_id,
+        func.max(Post.message_id).label('message_id'),
+        Post.grouped_id
+    ).group_by(Post.chat_id).subquery()
+    message_id = func.max(func.coalesce(last.c.message_id, 0), func.coalesce(Channel.last_message_id, 0))
+
     async with Session() as session:
-        # Проверяем, нет ли уже такого поста
-        stmt = select(Post).where(
-            Post.chat_id == chat_id,
-            Post.message_id == message_id
-        )
+        stmt = select(
+            Channel.chat_id,
+            Channel.type.label('chat_type'),
+            message_id.label('message_id'),
+            last.c.grouped_id
+        ).outerjoin(last, last.c.chat_id == Channel.chat_id).where(message_id > 0)
         result = await session.execute(stmt)
-        existing_post = result.scalar_one_or_none()
-
-        if existing_post:
-            # Обновляем существующий пост
-            existing_post.text = text
-            existing_post.file_id = file_id
-            existing_post.received_at = datetime.now()
-            post = existing_post
-        else:
-            # Создаем новый пост
-            post = Post(
-                chat_id=chat_id,
-                chat_title=chat_title,
-                chat_type=chat_type,
-                message_id=message_id,
-                content_type=content_type,
-                text=text,  # Сохраняем HTML разметку
-                file_id=file_id,
-                original_date=original_date or datetime.now()
-            )
-            session.add(post)
-
-        await session.commit()
-        await session.refresh(post)
-        return post
+        return result.all()
 
 
 async def get_posts(
@@ -56,13 +196,16 @@ async def get_posts(
         content_type: str = None,
         has_digest: bool = None,
         limit: int = 100,
-        offset: int = 0
+        offset: int = 0,
+        content: bool = False
 ) -> list[Post]:
     """
     Получает посты из базы данных с фильтрацией
+
+    text, ai_gen и edit_text читаются только с content=True.
     """
     async with Session() as session:
-        stmt = select(Post)
+        stmt = with_content(select(Post)) if content else select(Post)
 
         if chat_id:
             stmt = stmt.where(Post.chat_id == chat_id)
@@ -80,46 +223,158 @@ async def get_posts(
         return result.scalars().all()
 
 
-async def update_post_digest(post_id: int, digest: bool) -> bool:
+async def iter_posts(
+        *columns,
+        chat_id: int = None,
+        content_type: str = None,
+        has_digest: bool = None,
+        page_size: int = POSTS_PAGE_SIZE,
+        content: bool = False
+) -> AsyncIterator:
     """
-    Обновляет статус дайджеста для поста
+    Обходит все посты от новых к старым, читая их страницами по page_size
+
+    Страницы выбираются по ключу (original_date, id) через индекс
+    ix_posts_original_date, а не через OFFSET, поэтому каждая следующая
+    страница стоит столько же, сколько первая. В памяти держится только
+    текущая страница, на каждую открывается короткая сессия.
+
+    columns - колонки Post, которые нужно прочитать (например, Post.chat_id,
+    Post.digest): тогда вместо Post возвращаются строки с этими полями,
+    а text, ai_gen и прочие большие поля не читаются. Без columns
+    возвращаются объекты Post, тексты в них - только с content=True.
     """
+    if columns:
+        # Ключ страницы нужен всегда, даже если его не просили
+        names = {column.key for column in columns}
+        key = [column for column in (Post.original_date, Post.id) if column.key not in names]
+        stmt = select(*columns, *key)
+    else:
+        stmt = with_content(select(Post)) if content else select(Post)
+
+    if chat_id:
+        stmt = stmt.where(Post.chat_id == chat_id)
+
+    if content_type:
+        stmt = stmt.where(Post.content_type == content_type)
+
+    if has_digest is not None:
+        stmt = stmt.where(Post.digest == has_digest)
+
+    stmt = stmt.order_by(Post.original_date.desc(), Post.id.desc()).limit(page_size)
+
+    last = None
+    while True:
+        page_stmt = stmt if last is None else stmt.where(tuple_(Post.original_date, Post.id) < last)
+        async with Session() as session:
+            result = await session.execute(page_stmt)
+            page = result.all() if columns else result.scalars().all()
+
+        for item in page:
+            yield item
+
+        if len(page) < page_size:
+            return
+        last = (page[-1].original_date, page[-1].id)
+
+
+async def search_posts(query: str, limit: int = SEARCH_PAGE_SIZE, after: Optional[Tuple[float, int]] = None) -> list:
+    """
+    Ищет посты по словам из query в text, ai_gen и edit_text (индекс posts_fts)
+
+    Результаты отсортированы по bm25 (rank, чем меньше, тем лучше) и id.
+    Ранжируются только SEARCH_MAX_MATCHES самых новых совпадений: bm25
+    считается для каждого кандидата, и без этого запрос со словом из
+    большей части постов читал бы весь индекс.
+    Возвращает строки (id, chat_id, chat_title, original_date, text, ai_gen,
+    edit_text, rank). Следующая страница запрашивается с
+    after=(rank, id) последней строки.
+    """
+    match = build_match(query)
+    if match is None:
+        return []
+
+    params = {'match': match, 'limit': limit, 'max_matches': SEARCH_MAX_MATCHES}
+    keyset = ''
+    if after is not None:
+        keyset = 'AND (rank > :rank OR (rank = :rank AND rowid > :id))'
+        params['rank'], params['id'] = after
+
+    # Сначала выбираем страницу из индекса, потом читаем только ее посты
+    stmt = text(
+        'SELECT p.id, p.chat_id, c.title AS chat_title, p.original_date, p.text, p.ai_gen, p.edit_text, hit.rank '
+        'FROM (SELECT rowid, rank FROM posts_fts WHERE posts_fts MATCH :match '
+        'AND rowid >= coalesce((SELECT min(rowid) FROM (SELECT rowid FROM posts_fts WHERE posts_fts MATCH :match '
+        'ORDER BY rowid DESC LIMIT :max_matches)), 0) '
+        f'{keyset} ORDER BY rank, rowid LIMIT :limit) AS hit '
+        'JOIN posts AS p ON p.id = hit.rowid '
+        'LEFT JOIN channels AS c ON c.chat_id = p.chat_id '
+        'ORDER BY hit.rank, hit.rowid'
+    ).columns(original_date=Post.original_date.type)
+
     async with Session() as session:
-        stmt = select(Post).where(Post.id == post_id)
-        result = await session.execute(stmt)
-        post = result.scalar_one_or_none()
+        result = await session.execute(stmt, params)
+        return result.all()
 
-        if post:
-            post.digest = digest
-            post.processed_at = datetime.now() if digest else None
-            await session.commit()
-            return True
 
-        return False
+async def update_post_digest(post_id: int, digest: bool) -> bool:
+    """
+    Обновляет статус дайджеста для поста
+    """
+    return await update_post(post_id, digest=digest, processed_at=datetime.now() if digest else None)
 
 
 async def get_post_by_id(post_id: int) -> Post:
     """
     Получает пост по ID
+
+    Сначала ищет снимок в db.post_cache: обработчики кнопок админа
+    запрашивают один и тот же пост несколько раз подряд. Пост читается
+    вместе с text, ai_gen и edit_text, если они не нужны - get_post_meta.
     """
+    post = post_cache.get(post_id)
+    if post is not None:
+        return post
+
+    read_generation = post_cache.generation()
     async with Session() as session:
-        stmt = select(Post).where(Post.id == post_id)
+        stmt = with_content(select(Post)).where(Post.id == post_id)
         result = await session.execute(stmt)
-        return result.scalar_one_or_none()
+        post = result.scalar_one_or_none()
+
+    if post is not None:
+        post_cache.put(post, read_generation)
+    return post
+
+
+async def get_post_meta(post_id: int) -> Optional[PostMeta]:
+    """
+    Получает поля поста из POST_META_COLUMNS без текстов
+
+    Если пост уже есть в db.post_cache, поля копируются из снимка оттуда
+    (сам общий снимок наружу не отдается). Промах в кэш ничего не кладет
+    (тексты не читаются), поэтому и в счетчики кэша не идет (post_cache.peek).
+    Возвращает None, если поста нет.
+    """
+    post = post_cache.peek(post_id)
+    if post is not None:
+        return PostMeta(*(getattr(post, column.key) for column in POST_META_COLUMNS))
+
+    async with Session() as session:
+        result = await session.execute(select(*POST_META_COLUMNS).where(Post.id == post_id))
+        row = result.one_or_none()
+        return PostMeta(*row) if row is not None else None
 
 
 async def update_post_ai_gen(post_id: int, ai_text: str) -> bool:
     """
     Обновляет AI сгенерированный текст для поста
     """
-    async with Session() as session:
-        stmt = select(Post).where(Post.id == post_id)
-        result = await session.execute(stmt)
-        post = result.scalar_one_or_none()
+    return await update_post(post_id, ai_gen=ai_text)
 
-        if post:
-            post.ai_gen = ai_text
-            await session.commit()
-            return True
 
-        return False
+async def update_post_edit_text(post_id: int, edit_text: str) -> bool:
+    """
+    Сохраняет отредактированный админом текст поста
+    """
+    return await update_post(post_id, edit_text=edit_text)
@@ -0,0 +1,62 @@
+from datetime import datetime, timedelta
+from typing import Any, Dict
+
+from sqlalchemy import String, cast, func, select
+
+from db.models import Session, Channel, PostCounter, PostHourly
+
+
+async def get_post_stats(top: int = 5, days: int = 7) -> Dict[str, Any]:
+    """
+    Статистика постов для /stats по сводкам post_counters и post_hourly
+
+    Сводки ведут триггеры на posts, поэтому время ответа не зависит от
+    размера архива. Возвращает словарь:
+    total, in_digest - всего постов и из них в дайджесте;
+    content_types - [(тип, число)] по убыванию, не больше top;
+    chats - [(название из channels, число)] по убыванию, не больше top;
+    last_hour, last_day - поступило за последний час и 24 часа;
+    hourly - [(начало часа, число)] за последние 24 часа;
+    daily - [(дата, число)] за последние days дней.
+    """
+    now = datetime.now()
+    hour_start = now.replace(minute=0, second=0, microsecond=0)
+    day_ago = hour_start - timedelta(hours=23)
+    days_ago = (now - timedelta(days=days - 1)).replace(hour=0, minute=0, second=0, microsecond=0)
+
+    async with Session() as session:
+        total, in_digest = (await session.execute(
+            select(func.coalesce(func.sum(PostCounter.posts), 0), func.coalesce(func.sum(PostCounter.digest), 0))
+        )).one()
+
+        posts = func.sum(PostCounter.posts).label('posts')
+        content_types = (await session.execute(
+            select(PostCounter.content_type, posts).group_by(PostCounter.content_type)
+            .having(posts > 0).order_by(posts.desc()).limit(top)
+        )).all()
+        chats = (await session.execute(
+            select(func.coalesce(func.max(Channel.title), cast(PostCounter.chat_id, String)), posts)
+            .select_from(PostCounter).outerjoin(Channel, Channel.chat_id == PostCounter.chat_id)
+            .group_by(PostCounter.chat_id)
+            .having(posts > 0).order_by(posts.desc()).limit(top)
+        )).all()
+
+        hours = (await session.execute(
+            select(PostHourly.hour, PostHourly.posts).where(PostHourly.hour >= days_ago).order_by(PostHourly.hour)
+        )).all()
+
+    hourly = [(hour, count) for hour, count in hours if hour >= day_ago]
+    daily: Dict[Any, int] = {}
+    for hour, count in hours:
+        daily[hour.date()] = daily.get(hour.date(), 0) + count
+
+    return {
+        'total': total,
+        'in_digest': in_digest,
+        'content_types': [tuple(row) for row in content_types],
+        'chats': [tuple(row) for row in chats],
+        'last_hour': sum(count for hour, count in hourly if hour == hour_start),
+        'last_day': sum(count for _, count in hourly),
+        'hourly': hourly,
+        'daily': sorted(daily.items()),
+    }
@@ -0,0 +1,117 @@
+import asyncio
+from typing import Any, Awaitable, Callable, List, Optional, Tuple, TypeVar
+
+from sqlalchemy.ext.asyncio import AsyncSession, async_sessionmaker
+
+from config import DB_WRITE_BATCH_SIZE, DB_WRITE_BATCH_DELAY
+from db.models import Session
+from logger import logger
+
+T = TypeVar("T")
+
+# Операция записи: выполняет запросы в переданной сессии, но не делает commit
+WriteOp = Callable[[AsyncSession], Awaitable[T]]
+
+
+class BatchWriter:
+    """
+    Объединяет операции записи в общие транзакции.
+
+    Операции ставятся в очередь, фоновая задача забирает их пачками (не больше
+    max_batch), выполняет в одной сессии и делает один commit. Если за первой
+    операцией в очереди уже ждут другие, пачка еще delay секунд добирает
+    попутчиков; одиночная запись коммитится сразу, без задержки. Вызывающий код ждет future с результатом своей операции,
+    например с сохраненным Post и его id. Если пачка падает, ее операции
+    выполняются повторно по одной, и ошибку получает только виновная.
+    """
+
+    def __init__(self, session_factory: async_sessionmaker, max_batch: int = DB_WRITE_BATCH_SIZE,
+                 delay: float = DB_WRITE_BATCH_DELAY):
+        self.session_factory = session_factory
+        self.max_batch = max_batch
+        self.delay = delay
+        self._queue: Optional[asyncio.Queue] = None
+        self._task: Optional[asyncio.Task] = None
+        self.metrics = {"ops": 0, "commits": 0, "fallbacks": 0}
+
+    def _ensure_started(self) -> asyncio.Queue:
+        # Очередь и задача создаются лениво внутри работающего event loop
+        if self._queue is None:
+            self._queue = asyncio.Queue()
+        if self._task is None or self._task.done():
+            self._task = asyncio.create_task(self._run(), name="db-writer")
+        return self._queue
+
+    async def submit(self, op: WriteOp[T]) -> T:
+        """Ставит операцию в очередь и ждет ее результат после commit"""
+        future = asyncio.get_running_loop().create_future()
+        self._ensure_started().put_nowait((op, future))
+        return await future
+
+    async def _run(self):
+        stopping = False
+        while not stopping:
+            item = await self._queue.get()
+            if item is None:
+                return
+            batch = [item]
+            if self.delay > 0 and not self._queue.empty():
+                await asyncio.sleep(self.delay)
+            while len(batch) < self.max_batch and not self._queue.empty():
+                item = self._queue.get_nowait()
+                if item is None:
+                    stopping = True
+                    break
+                batch.append(item)
+            await self._flush(batch)
+
+    async def _execute(self, ops: List[WriteOp]) -> List[Any]:
+        async with self.session_factory() as session:
+            results = [await op(session) for op in ops]
+            await session.commit()
+        self.metrics["commits"] += 1
+        return results
+
+    async def _flush(self, batch: List[Tuple[WriteOp, asyncio.Future]]):
+        self.metrics["ops"] += len(batch)
+        try:
+            results = await self._execute([op for op, _ in batch])
+        except Exception as e:
+            if len(batch) == 1:
+                self._resolve(batch[0][1], error=e)
+                return
+            logger.warning(f"Ошибка пакетной записи ({len(batch)} операций), выполняем по одной: {e}")
+            self.metrics["fallbacks"] += 1
+            for op, future in batch:
+                try:
+                    result = (await self._execute([op]))[0]
+                except Exception as op_error:
+                    self._resolve(future, error=op_error)
+                else:
+                    self._resolve(future, result)
+            return
+
+        for (_, future), result in zip(batch, results):
+            self._resolve(future, result)
+
+    @staticmethod
+    def _resolve(future: asyncio.Future, result: Any = None, error: Exception = None):
+        # Вызывающий код мог перестать ждать (отмена задачи)
+        if future.done():
+            return
+        if error is not None:
+            future.set_exception(error)
+        else:
+            future.set_result(result)
+
+    async def close(self):
+        """Дописывает операции, уже стоящие в очереди, и останавливает фоновую задачу"""
+        if self._task is not None and not self._task.done():
+            self._queue.put_nowait(None)
+            await self._task
+        self._task = None
+        # Очередь привязана к event loop: следующий submit создаст новую
+        self._queue = None
+
+
+writer = BatchWriter(Session)
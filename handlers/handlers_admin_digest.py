@@ -6,12 +6,11 @@ from aiogram.types import CallbackQuery, InlineKeyboardMarkup, InlineKeyboardBut
     ReplyKeyboardMarkup, Message
 from aiogram.fsm.context import FSMContext
 from aiogram.fsm.state import State, StatesGroup
-from sqlalchemy import select
 
 from ai_gen import post_digest
 from config import ADMIN_IDS, CHANEL_ID
-from db.digests import save_digest, get_digest_by_hash, update_digest_edit_text, mark_digest_published
-from db.models import Session, Post
+from db.digests import save_digest, get_digest_by_hash, update_digest_edit_text, mark_digest_published, \
+    get_posts_for_digest
 from logger import logger
 from bot import bot
 from aiogram.exceptions import TelegramBadRequest
@@ -70,19 +69,12 @@ async def do_digest_callback(callback: CallbackQuery):
         now = datetime.datetime.now()
         time_24h_ago = now - timedelta(hours=24)
 
-        # Получаем посты за последние 24 часа с digest=True
-        async with Session() as session:
-            stmt = select(Post).where(
-                Post.digest == True,
-                Post.received_at >= time_24h_ago
-            ).order_by(Post.received_at.desc())
-
-            result = await session.execute(stmt)
-            digest_posts = result.scalars().all()
+        # Получаем посты за последние 24 часа с digest=True, еще не вошедшие в опубликованный дайджест
+        digest_posts = await get_posts_for_digest(time_24h_ago)
 
         # Проверяем, есть ли посты
         if not digest_posts:
-            await callback.answer("❌ Нет постов за последние 24 часа, добавленных в дайджест", show_alert=True)
+            await callback.answer("❌ Нет новых постов за последние 24 часа, добавленных в дайджест", show_alert=True)
             return
 
         # Отправляем сообщение о начале генерации
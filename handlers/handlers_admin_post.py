@@ -3,21 +3,25 @@ from aiogram.types import CallbackQuery, InlineKeyboardMarkup, InlineKeyboardBut
     ReplyKeyboardMarkup, Message
 from aiogram.fsm.context import FSMContext
 from aiogram.fsm.state import State, StatesGroup
-from sqlalchemy import select
 
 from ai_gen import post_gen
 from config import ADMIN_IDS, CHANEL_ID
-from db.models import Session, Post
+from db.models import Post
 from logger import logger
-from db.posts import get_post_by_id, update_post_digest, update_post_ai_gen
+from db.posts import get_post_by_id, get_post_meta, update_post_digest, update_post_ai_gen, update_post_edit_text
 from bot import bot
 from aiogram.exceptions import TelegramBadRequest
 import html
 
 from userbot.TGClient import _create_post_keyboard
+from userbot.albums import CAPTION_MAX_LENGTH, build_album
 
 post_router = Router()
 
+# Типы постов, у которых кнопки висят на текстовом сообщении
+# (у медиагруппы текст с кнопками отправляется отдельно от альбома)
+TEXT_MESSAGE_TYPES = ('text', 'media_group')
+
 
 class PublishStates(StatesGroup):
     """Состояния для публикации постов"""
@@ -125,7 +129,7 @@ async def ai_generate_callback(callback: CallbackQuery):
 
         # Редактируем сообщение, показывая что идет генерация
         try:
-            if post.content_type == 'text':
+            if post.content_type in TEXT_MESSAGE_TYPES:
                 await bot.edit_message_text(
                     chat_id=callback.from_user.id,
                     message_id=callback.message.message_id,
@@ -170,7 +174,7 @@ async def ai_generate_callback(callback: CallbackQuery):
 
         try:
             # Редактируем сообщение с AI текстом и новой клавиатурой
-            if post.content_type == 'text':
+            if post.content_type in TEXT_MESSAGE_TYPES:
                 await bot.edit_message_text(
                     chat_id=callback.from_user.id,
                     message_id=callback.message.message_id,
@@ -201,7 +205,7 @@ async def ai_generate_callback(callback: CallbackQuery):
             elif "can't parse entities" in str(e).lower():
                 try:
                     # Пробуем отправить без разметки
-                    if post.content_type == 'text':
+                    if post.content_type in TEXT_MESSAGE_TYPES:
                         await bot.edit_message_text(
                             chat_id=callback.from_user.id,
                             message_id=callback.message.message_id,
@@ -294,7 +298,7 @@ async def toggle_parse_callback(callback: CallbackQuery):
             keyboard = _create_edit_keyboard(post.id, new_parse_mode)
 
         try:
-            if post.content_type == 'text':
+            if post.content_type in TEXT_MESSAGE_TYPES:
                 await bot.edit_message_text(
                     chat_id=admin_id,
                     message_id=callback.message.message_id,
@@ -432,27 +436,20 @@ async def process_edited_text(message: Message, state: FSMContext):
             await state.clear()
             return
 
-        # Получаем пост
-        post = await get_post_by_id(post_id)
+        # Получаем пост (тексты не нужны: отправляется новый текст админа)
+        post = await get_post_meta(post_id)
         if not post:
             await message.answer("❌ Пост не найден в базе данных")
             await state.clear()
             return
 
         # Обновляем отредактированный текст в БД
-        async with Session() as session:
-            stmt = select(Post).where(Post.id == post_id)
-            result = await session.execute(stmt)
-            post_db = result.scalar_one_or_none()
-
-            if post_db:
-                post_db.edit_text = message.text
-                await session.commit()
+        await update_post_edit_text(post_id, message.text)
         print(post.content_type)
         print(post.file_id)
         # Отправляем отредактированный текст пользователю с новой клавиатурой
         keyboard = _create_edit_keyboard(post_id, 'net')
-        if post.content_type == 'text':
+        if post.content_type in TEXT_MESSAGE_TYPES:
             await bot.send_message(
                 chat_id=chat_id,
                 text=message.text,
@@ -524,7 +521,7 @@ async def add_digest_callback(callback: CallbackQuery):
         _, post_id_str = data_parts
         post_id = int(post_id_str)
 
-        post = await get_post_by_id(post_id)
+        post = await get_post_meta(post_id)
         if not post:
             await callback.answer("❌ Пост не найден в базе данных", show_alert=True)
             return
@@ -627,6 +624,27 @@ async def publish_callback(callback: CallbackQuery, state: FSMContext):
         await callback.answer("❌ Произошла ошибка", show_alert=True)
 
 
+def _album_media(post: Post, text: str = None) -> list:
+    """Собрать медиагруппу поста с текстом в подписи первого элемента"""
+    return build_album([(part["type"], part["file_id"]) for part in post.media or []], caption=text)
+
+
+async def _send_album(chat_id, post: Post, text: str):
+    """
+    Отправить медиагруппу поста
+
+    Текст идет в подпись первого элемента, а если он длиннее
+    CAPTION_MAX_LENGTH (длина считается с разметкой, с запасом) -
+    отдельным сообщением после альбома: иначе Telegram отклонит альбом.
+    """
+    if len(text) <= CAPTION_MAX_LENGTH:
+        await bot.send_media_group(chat_id=chat_id, media=_album_media(post, text))
+        return
+
+    await bot.send_media_group(chat_id=chat_id, media=_album_media(post))
+    await bot.send_message(chat_id=chat_id, text=text)
+
+
 async def _send_preview_post(chat_id: int, post: Post, text: str):
     """Отправить пост для предварительного просмотра"""
     try:
@@ -665,6 +683,8 @@ async def _send_preview_post(chat_id: int, post: Post, text: str):
                 voice=post.file_id,
                 caption=text
             )
+        elif post.content_type == 'media_group':
+            await _send_album(chat_id, post, text)
     except Exception as e:
         logger.error(f"Ошибка при отправке предпросмотра: {e}")
         raise
@@ -741,6 +761,8 @@ async def confirm_publish_callback(callback: CallbackQuery, state: FSMContext):
                     voice=post.file_id,
                     caption=text
                 )
+            elif post.content_type == 'media_group':
+                await _send_album(CHANEL_ID, post, text)
 
             await callback.answer("✅ Пост успешно опубликован!", show_alert=True)
             await callback.message.answer("📢 Пост успешно опубликован в канале!")
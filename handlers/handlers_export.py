@@ -10,17 +10,27 @@ import asyncio
 
 from config import ADMIN_IDS
 from logger import logger
-from db.posts import get_posts
+from db.models import Post
+from db.posts import iter_posts
+from db.stats import get_post_stats
+from metrics import collect, report_lines
 
 export_router = Router()
 
 
-async def create_excel_file() -> str:
+# Колонки Post для экспорта (без media и edit_text)
+EXPORT_COLUMNS = (
+    Post.id, Post.chat_id, Post.chat_title, Post.chat_type, Post.message_id, Post.content_type,
+    Post.text, Post.file_id, Post.digest, Post.ai_gen, Post.original_date, Post.received_at, Post.processed_at
+)
+
+
+async def create_excel_file() -> tuple[str, int]:
     """
     Создает Excel файл со всеми записями из таблицы Post
+
+    Возвращает путь к файлу и число выгруженных постов.
     """
-    # Получаем все посты из базы данных
-    posts = await get_posts(limit=10000)
 
     # Создаем новую рабочую книгу Excel
     wb = Workbook()
@@ -30,7 +40,7 @@ async def create_excel_file() -> str:
     # Заголовки столбцов
     headers = [
         "ID", "Chat ID", "Chat Title", "Chat Type", "Message ID",
-        "Content Type", "Text", "Telegram File IDs", "Digest", "AI Generated",
+        "Content Type", "Text", "Telegram File ID", "Digest", "AI Generated",
         "Original Date", "Received At", "Processed At"
     ]
 
@@ -46,10 +56,10 @@ async def create_excel_file() -> str:
         cell.fill = header_fill
         cell.alignment = header_alignment
 
-    # Записываем данные
-    for row_num, post in enumerate(posts, 2):
-        # Преобразуем JSON поля в строки
-        telegram_file_ids = str(post.telegram_file_ids) if post.telegram_file_ids else ""
+    # Записываем данные, читая посты из базы страницами
+    row_num = 1
+    async for post in iter_posts(*EXPORT_COLUMNS):
+        row_num += 1
 
         # Преобразуем даты в строки
         original_date = post.original_date.strftime("%Y-%m-%d %H:%M:%S") if post.original_date else ""
@@ -71,7 +81,7 @@ async def create_excel_file() -> str:
         ws.cell(row=row_num, column=5, value=post.message_id)
         ws.cell(row=row_num, column=6, value=post.content_type)
         ws.cell(row=row_num, column=7, value=text)  # Используем очищенный текст
-        ws.cell(row=row_num, column=8, value=telegram_file_ids)
+        ws.cell(row=row_num, column=8, value=post.file_id or "")
         ws.cell(row=row_num, column=9, value="Да" if post.digest else "Нет")
         ws.cell(row=row_num, column=10, value=post.ai_gen)
         ws.cell(row=row_num, column=11, value=original_date)
@@ -105,7 +115,7 @@ async def create_excel_file() -> str:
     # Сохраняем файл
     wb.save(filepath)
 
-    return filepath
+    return filepath, row_num - 1
 
 
 @export_router.message(Command("export_posts"))
@@ -124,7 +134,7 @@ async def export_posts_command(message: Message, state: FSMContext):
         processing_msg = await message.answer("⏳ Начинаю экспорт данных... Это может занять некоторое время.")
 
         # Создаем Excel файл
-        filepath = await create_excel_file()
+        filepath, total_posts = await create_excel_file()
 
         # Отправляем файл пользователю
         file = FSInputFile(filepath, filename=f"posts_export_{datetime.now().strftime('%Y%m%d_%H%M%S')}.xlsx")
@@ -132,7 +142,7 @@ async def export_posts_command(message: Message, state: FSMContext):
         await message.answer_document(
             document=file,
             caption=f"✅ Экспорт завершен!\n"
-                    f"📊 Всего записей: {len(await get_posts(limit=10000))}\n"
+                    f"📊 Всего записей: {total_posts}\n"
                     f"📅 Дата экспорта: {datetime.now().strftime('%Y-%m-%d %H:%M:%S')}"
         )
 
@@ -167,50 +177,47 @@ async def show_stats_command(message: Message, state: FSMContext):
     try:
         await state.clear()
 
-        # Получаем все посты
-        posts = await get_posts(limit=10000)
+        # Статистика из сводок, которые ведут триггеры на posts
+        stats = await get_post_stats()
+        total_posts = stats['total']
 
-        if not posts:
+        if not total_posts:
             await message.answer("📭 В базе данных нет записей")
             return
 
-        # Подсчитываем статистику
-        total_posts = len(posts)
-
-        # Статистика по типам контента
-        content_types = {}
-        for post in posts:
-            content_type = post.content_type or "unknown"
-            content_types[content_type] = content_types.get(content_type, 0) + 1
-
-        # Статистика по чатам
-        chats = {}
-        for post in posts:
-            chat_title = post.chat_title or f"ID: {post.chat_id}"
-            chats[chat_title] = chats.get(chat_title, 0) + 1
-
-        # Количество постов в дайджесте
-        in_digest = sum(1 for post in posts if post.digest)
-
         # Формируем сообщение
         stats_message = (
             f"📊 Статистика по постам:\n"
             f"━━━━━━━━━━━━━━━━━━━━━━\n"
             f"📂 Всего постов: {total_posts}\n"
-            f"📋 В дайджесте: {in_digest}\n\n"
+            f"📋 В дайджесте: {stats['in_digest']}\n\n"
             f"📈 Типы контента:\n"
         )
 
-        for content_type, count in sorted(content_types.items(), key=lambda x: x[1], reverse=True)[:5]:
+        for content_type, count in stats['content_types']:
             percentage = (count / total_posts) * 100
             stats_message += f"  • {content_type}: {count} ({percentage:.1f}%)\n"
 
         stats_message += f"\n📁 Топ чатов:\n"
-        for chat_title, count in sorted(chats.items(), key=lambda x: x[1], reverse=True)[:5]:
+        for chat_title, count in stats['chats']:
             percentage = (count / total_posts) * 100
             stats_message += f"  • {chat_title}: {count} ({percentage:.1f}%)\n"
 
+        stats_message += (
+            f"\n⏱ Поступление постов:\n"
+            f"  • за текущий час: {stats['last_hour']}\n"
+            f"  • за 24 часа: {stats['last_day']} (в среднем {stats['last_day'] / 24:.1f} в час)\n"
+        )
+        busiest = max(stats['hourly'], key=lambda x: x[1], default=None)
+        if busiest:
+            stats_message += f"  • пик за 24 часа: {busiest[1]} в {busiest[0].strftime('%H:00')}\n"
+
+        stats_message += f"\n📅 По дням:\n"
+        for day, count in stats['daily']:
+            stats_message += f"  • {day.strftime('%d.%m')}: {count}\n"
+
         stats_message += f"\n💾 Для полного экспорта используйте /export_posts"
+        stats_message += f"\n🩺 Состояние доставки и подключения: /health"
 
         await message.answer(stats_message)
 
@@ -218,4 +225,32 @@ async def show_stats_command(message: Message, state: FSMContext):
 
     except Exception as e:
         logger.error(f"[{message.from_user.id}] Ошибка при получении статистики: {e}")
-        await message.answer(f"❌ Ошибка при получении статистики: {str(e)}")
\ No newline at end of file
+        await message.answer(f"❌ Ошибка при получении статистики: {str(e)}")
+
+@export_router.message(Command("health"))
+async def show_health_command(message: Message, state: FSMContext):
+    """
+    Команда для показа метрик доставки: очередь, подключение Telethon,
+    outbox, шлюз Bot API, кэш постов и запись в БД
+    """
+    if message.from_user.id not in ADMIN_IDS:
+        await message.answer("Доступ запрещен")
+        return
+
+    try:
+        await state.clear()
+
+        lines = report_lines(await collect())
+        health_message = (
+            f"🩺 Состояние бота:\n"
+            f"━━━━━━━━━━━━━━━━━━━━━━\n"
+        )
+        health_message += "\n".join(f"  • {line}" for line in lines)
+
+        await message.answer(health_message)
+
+        logger.info(f"[{message.from_user.id}] Метрики показаны успешно")
+
+    except Exception as e:
+        logger.error(f"[{message.from_user.id}] Ошибка при получении метрик: {e}")
+        await message.answer(f"❌ Ошибка при получении метрик: {str(e)}")
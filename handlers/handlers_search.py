@@ -0,0 +1,147 @@
+import hashlib
+import html
+from collections import OrderedDict
+from typing import Tuple
+
+from aiogram import Router, F
+from aiogram.filters import Command, CommandObject
+from aiogram.types import CallbackQuery, InlineKeyboardMarkup, InlineKeyboardButton, Message
+
+from config import ADMIN_IDS, SEARCH_PAGE_SIZE
+from db.fts import strip_html
+from db.posts import search_posts
+from logger import logger
+
+search_router = Router()
+
+# Курсоры следующей страницы поиска по короткому ключу: (запрос, rank, id
+# последнего поста). В callback_data (до 64 байт) помещается только ключ и
+# позиция страницы, а rank нужен точный - округленный пропустил бы или
+# повторил посты на границе страниц. Храним последние курсоры, старые вытесняются.
+_search_cursors: "OrderedDict[str, Tuple[str, float, int]]" = OrderedDict()
+_MAX_CURSORS = 100
+
+# Длина фрагмента текста в результатах
+_SNIPPET_LENGTH = 200
+
+
+def _remember_cursor(query: str, rank: float, post_id: int) -> str:
+    """Сохраняет курсор следующей страницы и возвращает его ключ для callback_data"""
+    key = hashlib.md5(f"{query}\0{rank!r}\0{post_id}".encode()).hexdigest()[:8]
+    _search_cursors[key] = (query, rank, post_id)
+    _search_cursors.move_to_end(key)
+    while len(_search_cursors) > _MAX_CURSORS:
+        _search_cursors.popitem(last=False)
+    return key
+
+
+def _snippet(post, query: str) -> str:
+    """Фрагмент текста поста вокруг первого найденного слова запроса"""
+    content = ' '.join((strip_html(post.edit_text or post.text or post.ai_gen) or '').split())
+    lowered = content.lower()
+    positions = [lowered.find(word) for word in query.lower().split()]
+    position = min((p for p in positions if p >= 0), default=0)
+
+    start = max(0, position - _SNIPPET_LENGTH // 4)
+    fragment = content[start:start + _SNIPPET_LENGTH]
+    if start > 0:
+        fragment = '…' + fragment
+    if start + _SNIPPET_LENGTH < len(content):
+        fragment += '…'
+    return html.escape(fragment)
+
+
+def _format_results(query: str, posts: list, offset: int) -> str:
+    """Текст сообщения со страницей результатов (HTML)"""
+    lines = [f"🔎 Результаты по запросу <b>{html.escape(query)}</b>:\n"]
+    for number, post in enumerate(posts, offset + 1):
+        date = post.original_date.strftime('%d.%m.%Y %H:%M') if post.original_date else ''
+        lines.append(
+            f"<b>{number}. {html.escape(post.chat_title or str(post.chat_id))}</b> · {date} · #{post.id}\n"
+            f"{_snippet(post, query)}\n"
+        )
+    return '\n'.join(lines)
+
+
+def _create_more_keyboard(query: str, posts: list, offset: int) -> InlineKeyboardMarkup:
+    """Клавиатура с кнопкой следующей страницы"""
+    last = posts[-1]
+    key = _remember_cursor(query, last.rank, last.id)
+    return InlineKeyboardMarkup(
+        inline_keyboard=[[
+            InlineKeyboardButton(
+                text="Дальше ▶",
+                callback_data=f"search_more:{key}:{offset + len(posts)}"
+            )
+        ]]
+    )
+
+
+async def _search_page(query: str, offset: int, after=None):
+    """Страница результатов: текст сообщения и клавиатура (None, если страниц больше нет)"""
+    # Берем на одну строку больше, чтобы знать, есть ли следующая страница
+    posts = await search_posts(query, limit=SEARCH_PAGE_SIZE + 1, after=after)
+    has_more = len(posts) > SEARCH_PAGE_SIZE
+    posts = posts[:SEARCH_PAGE_SIZE]
+    if not posts:
+        return None, None
+
+    keyboard = _create_more_keyboard(query, posts, offset) if has_more else None
+    return _format_results(query, posts, offset), keyboard
+
+
+@search_router.message(Command("search"))
+async def search_command(message: Message, command: CommandObject):
+    """
+    Команда поиска по архиву постов: /search <запрос>
+    """
+    if message.from_user.id not in ADMIN_IDS:
+        await message.answer("Доступ запрещен")
+        return
+
+    query = (command.args or '').strip()
+    if not query:
+        await message.answer("Использование: /search <слова для поиска>")
+        return
+
+    try:
+        text, keyboard = await _search_page(query, 0)
+        if text is None:
+            await message.answer("📭 Ничего не найдено")
+            return
+
+        await message.answer(text, parse_mode="HTML", reply_markup=keyboard)
+        logger.info(f"[{message.from_user.id}] Поиск по запросу: {query}")
+
+    except Exception as e:
+        logger.error(f"[{message.from_user.id}] Ошибка поиска: {e}")
+        await message.answer(f"❌ Ошибка поиска: {str(e)}")
+
+
+@search_router.callback_query(F.data.startswith("search_more:"))
+async def search_more_callback(callback: CallbackQuery):
+    """Следующая страница результатов поиска"""
+    if callback.from_user.id not in ADMIN_IDS:
+        await callback.answer("🚫 Доступ запрещен", show_alert=True)
+        return
+
+    try:
+        _, key, offset = callback.data.split(":")
+        cursor = _search_cursors.get(key)
+        if cursor is None:
+            await callback.answer("❌ Поиск устарел, повторите /search", show_alert=True)
+            return
+
+        query, rank, post_id = cursor
+        text, keyboard = await _search_page(query, int(offset), after=(rank, post_id))
+        if text is None:
+            await callback.answer("📭 Больше ничего не найдено", show_alert=True)
+            return
+
+        await callback.message.edit_reply_markup(reply_markup=None)
+        await callback.message.answer(text, parse_mode="HTML", reply_markup=keyboard)
+        await callback.answer()
+
+    except Exception as e:
+        logger.error(f"Ошибка при переходе к следующей странице поиска: {e}")
+        await callback.answer("❌ Произошла ошибка", show_alert=True)
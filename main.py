@@ -5,12 +5,16 @@ from aiogram import Dispatcher
 
 from config import API_ID, API_HASH
 from db.models import create_tables
-from handlers import handlers_admin_post, handlers_export, handlers_admin_digest
+from db.writer import writer
+from handlers import handlers_admin_post, handlers_export, handlers_admin_digest, handlers_search
 from bot import bot
 from typing import NoReturn
 
 from logger import logger
-from userbot.TGClient import client, create_client
+from userbot.TGClient import create_client, deliver_post, redeliver_post
+from userbot import outbox, pipeline, supervisor
+from userbot.backfill import run_backfill
+from metrics import start_metrics_log, stop_metrics_log
 
 
 async def main() -> None:
@@ -63,23 +67,41 @@ async def main() -> None:
         dp.include_router(handlers_admin_post.post_router)
         dp.include_router(handlers_admin_digest.digest_router)
         dp.include_router(handlers_export.export_router)
+        dp.include_router(handlers_search.search_router)
         logger.info("Роутеры успешно зарегистрированы")
 
         # Удаление вебхука для очистки ожидающих обновлений
         logger.info("Ожидающие обновления очищены")
 
-        current_client = client()
-        if current_client and not current_client.is_connected():
-            try:
-                await current_client.connect()
-                logger.info('Telethon client reconnected.')
-            except Exception as e:
-                logger.error(f"Ошибка переподключения: {e}")
         await bot.delete_webhook(drop_pending_updates=True)
         logger.info("Ожидающие обновления очищены")
+
+        # Повторная доставка из outbox (в том числе незавершенных до перезапуска)
+        await outbox.start_outbox(redeliver_post)
+
+        # Запуск воркеров доставки сообщений из каналов
+        pipeline.start_workers(deliver_post)
+
+        # Наблюдение за подключением Telethon (переподключение и догрузка после простоя)
+        supervisor.start_supervisor()
+
+        # Периодическая запись метрик в лог (их же показывает /health)
+        start_metrics_log()
+
+        # Догрузка сообщений, пропущенных пока бот был выключен (в фоне, не задерживает polling)
+        backfill_task = asyncio.create_task(run_backfill())
+
         # Запуск бота в режиме long-polling
         logger.info("Запуск бота в режиме long-polling...")
-        await dp.start_polling(bot)
+        try:
+            await dp.start_polling(bot)
+        finally:
+            backfill_task.cancel()
+            await stop_metrics_log()
+            await supervisor.stop_supervisor()
+            await pipeline.stop_workers()
+            await outbox.stop_outbox()
+            await writer.close()
 
 
     except Exception as e:
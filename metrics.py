@@ -0,0 +1,99 @@
+import asyncio
+from typing import Any, Dict, List, Optional
+
+import rate_limiter
+from config import METRICS_LOG_INTERVAL
+from db import post_cache
+from db.outbox import get_outbox_stats
+from db.writer import writer
+from logger import logger
+from userbot import outbox, pipeline, supervisor
+from userbot.dedup import duplicates
+
+_task: Optional[asyncio.Task] = None
+
+# Сколько методов Bot API показывать в отчете (самые частые)
+_TOP_METHODS = 8
+
+
+async def collect() -> Dict[str, Any]:
+    """Собирает счетчики конвейера доставки, подключения Telethon, outbox, шлюза Bot API и БД"""
+    try:
+        outbox_status = await get_outbox_stats()
+    except Exception as e:
+        logger.error(f"Не удалось получить состояние outbox: {e}")
+        outbox_status = {}
+
+    return {
+        "pipeline": pipeline.get_metrics(),
+        "supervisor": supervisor.get_state(),
+        "outbox": outbox.get_metrics(),
+        "outbox_status": outbox_status,
+        "gateway": rate_limiter.get_metrics(),
+        "post_cache": post_cache.get_metrics(),
+        "writer": dict(writer.metrics),
+        "dedup": {**duplicates.metrics, "size": len(duplicates)},
+    }
+
+
+def report_lines(metrics: Dict[str, Any]) -> List[str]:
+    """Строки отчета по счетчикам из collect()"""
+    queue = metrics["pipeline"]
+    state = metrics["supervisor"]
+    sent = metrics["outbox"]
+    status = metrics["outbox_status"]
+    cache = metrics["post_cache"]
+    batches = metrics["writer"]
+    dedup = metrics["dedup"]
+
+    lines = [
+        f"Очередь: {queue['depth']}/{queue['capacity']} (максимум {queue['max_depth']}), "
+        f"воркеров {queue['workers']}, обработано {queue['processed']}, ошибок {queue['failed']}, "
+        f"отброшено {queue['dropped']}, ожидание {queue['last_wait']:.1f} с",
+        f"Telethon: {'подключен' if state['connected'] else 'нет подключения'}, "
+        f"обрывов {state['disconnects']}, переподключений {state['reconnects']}, "
+        f"неудачных попыток {state['failed_attempts']}, простой {state['current_downtime']:.0f} с "
+        f"(всего {state['total_downtime']:.0f} с)",
+        f"Outbox: " + (", ".join(f"{name} {count}" for name, count in sorted(status.items())) or "пусто") +
+        f"; повторно доставлено {sent['sent']}, отложено {sent['retried']}, не доставлено {sent['failed']}",
+        f"Копии постов: уникальных {dedup['unique']}, копий {dedup['duplicates']}, в индексе {dedup['size']}",
+        f"Кэш постов: попаданий {cache['hits']}, промахов {cache['misses']}, размер {cache['size']}",
+        f"Запись в БД: операций {batches['ops']}, транзакций {batches['commits']}, "
+        f"откатов к поштучной записи {batches['fallbacks']}",
+    ]
+
+    methods = sorted(metrics["gateway"].items(), key=lambda item: item[1]["calls"], reverse=True)
+    for name, stats in methods[:_TOP_METHODS]:
+        lines.append(
+            f"Bot API {name}: {stats['calls']:.0f} вызовов, ошибок {stats['errors']:.0f}, "
+            f"повторов {stats['retries']:.0f}, в среднем {stats['avg_time'] * 1000:.0f} мс "
+            f"(максимум {stats['max_time'] * 1000:.0f} мс)"
+        )
+    return lines
+
+
+async def _log_loop():
+    """Раз в METRICS_LOG_INTERVAL секунд пишет отчет в лог"""
+    while True:
+        await asyncio.sleep(METRICS_LOG_INTERVAL)
+        try:
+            logger.info("Метрики: " + " | ".join(report_lines(await collect())))
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            logger.error(f"Ошибка при сборе метрик: {e}")
+
+
+def start_metrics_log():
+    """Запускает периодическую запись метрик в лог (METRICS_LOG_INTERVAL <= 0 - выключена)"""
+    global _task
+    if METRICS_LOG_INTERVAL <= 0 or (_task and not _task.done()):
+        return
+    _task = asyncio.create_task(_log_loop(), name="metrics-log")
+
+
+async def stop_metrics_log():
+    """Останавливает запись метрик в лог"""
+    if _task:
+        _task.cancel()
+        await asyncio.gather(_task, return_exceptions=True)
@@ -0,0 +1,189 @@
+import asyncio
+import time
+from typing import Any, Dict
+
+from aiogram.client.session.middlewares.base import BaseRequestMiddleware
+from aiogram.exceptions import TelegramNetworkError, TelegramRetryAfter, TelegramServerError
+from aiogram.methods import GetUpdates, TelegramMethod
+
+from config import BOT_GLOBAL_RATE, BOT_CHAT_RATE, BOT_CHAT_BURST, BOT_SEND_RETRIES, BOT_RETRY_DELAY
+from logger import logger
+
+# Сколько корзин отдельных чатов держать в памяти до очистки неактивных
+_MAX_CHAT_BUCKETS = 10000
+
+# Методы, которые можно безопасно повторить после ошибки сети: при таймауте
+# Telegram мог уже выполнить запрос, и повтор send_* прислал бы пост дважды
+_IDEMPOTENT_PREFIXES = ("edit", "get")
+_IDEMPOTENT_METHODS = {"answerCallbackQuery"}
+
+# Методы, которые после паузы RetryAfter бессмысленно повторять:
+# callback query к тому времени уже истечет
+_NO_WAIT_METHODS = {"answerCallbackQuery"}
+
+
+def _is_idempotent(name: str) -> bool:
+    """Можно ли повторить метод Bot API, не зная, выполнил ли его Telegram"""
+    return name.startswith(_IDEMPOTENT_PREFIXES) or name in _IDEMPOTENT_METHODS
+
+
+class TokenBucket:
+    """Алгоритм token bucket: rate токенов в секунду, не больше capacity в запасе"""
+
+    def __init__(self, rate: float, capacity: float):
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = capacity
+        self.updated = time.monotonic()
+        self._lock = asyncio.Lock()
+
+    def _refill(self):
+        now = time.monotonic()
+        if now <= self.updated:
+            # Корзина на паузе (pause): токены не копятся до ее окончания
+            return
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def pause(self, seconds: float):
+        """Опустошает корзину и не выдает токены seconds секунд (после TelegramRetryAfter)"""
+        self.tokens = 0
+        self.updated = max(self.updated, time.monotonic() + seconds)
+
+    def is_idle(self) -> bool:
+        """Корзина полная - ее можно удалить без потери состояния"""
+        self._refill()
+        return self.tokens >= self.capacity
+
+    async def acquire(self):
+        """Ждет, пока в корзине появится токен, и забирает его"""
+        async with self._lock:
+            while True:
+                self._refill()
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return
+                pause = max(self.updated - time.monotonic(), 0)
+                await asyncio.sleep(pause + (1 - self.tokens) / self.rate)
+
+
+class RateLimiter:
+    """Общий лимит Bot API плюс отдельный лимит на каждый чат"""
+
+    def __init__(self, global_rate: float, chat_rate: float, chat_burst: int):
+        self.global_bucket = TokenBucket(global_rate, global_rate)
+        self.chat_rate = chat_rate
+        self.chat_burst = chat_burst
+        self._chat_buckets: Dict[Any, TokenBucket] = {}
+
+    def _chat_bucket(self, chat_id) -> TokenBucket:
+        bucket = self._chat_buckets.get(chat_id)
+        if bucket is None:
+            if len(self._chat_buckets) >= _MAX_CHAT_BUCKETS:
+                # Удаляем корзины чатов, в которые давно ничего не отправляли
+                for key in [k for k, b in self._chat_buckets.items() if b.is_idle()]:
+                    del self._chat_buckets[key]
+            bucket = TokenBucket(self.chat_rate, self.chat_burst)
+            self._chat_buckets[chat_id] = bucket
+        return bucket
+
+    async def acquire(self, chat_id):
+        """Ждет разрешения на отправку в чат chat_id (None - только общий лимит)"""
+        if chat_id is not None:
+            await self._chat_bucket(chat_id).acquire()
+        await self.global_bucket.acquire()
+
+    def pause(self, chat_id, seconds: float):
+        """
+        Приостанавливает отправку в чат chat_id (None - все запросы) на seconds секунд.
+
+        Иначе после TelegramRetryAfter остальные воркеры продолжили бы получать
+        токены и упирались бы в то же ограничение Telegram.
+        """
+        if chat_id is not None:
+            self._chat_bucket(chat_id).pause(seconds)
+        else:
+            self.global_bucket.pause(seconds)
+
+
+class SendGateway(BaseRequestMiddleware):
+    """
+    Общий шлюз всех запросов к Bot API (request middleware сессии бота).
+
+    Через него проходят и рассылка админам, и ответы в обработчиках
+    (message.answer, callback.answer, edit_message_*), поэтому:
+    - каждый запрос ждет токен общего лимита, запросы с chat_id - еще и
+      лимита чата, и всплеск превращается в очередь, а не в ошибки 429;
+    - при TelegramRetryAfter корзина чата (без chat_id - общая) ставится на
+      паузу на указанное Telegram время, а запрос повторяется после нее
+      (кроме answerCallbackQuery); при 5xx и ошибках сети - с растущей паузой,
+      не больше BOT_SEND_RETRIES раз и только для идемпотентных методов
+      (edit*, get*, answerCallbackQuery): после таймаута или 5xx Telegram мог
+      уже принять запрос, и повтор send_* прислал бы пост дважды;
+    - для каждого метода считаются число вызовов, ошибок и время ответа.
+    """
+
+    def __init__(self, rate_limiter: RateLimiter):
+        self.limiter = rate_limiter
+        self.metrics: Dict[str, Dict[str, float]] = {}
+
+    def _record(self, name: str, elapsed: float, ok: bool):
+        stats = self.metrics.get(name)
+        if stats is None:
+            stats = self.metrics[name] = {"calls": 0, "errors": 0, "retries": 0, "total_time": 0.0, "max_time": 0.0}
+        stats["calls"] += 1
+        stats["errors"] += not ok
+        stats["total_time"] += elapsed
+        stats["max_time"] = max(stats["max_time"], elapsed)
+
+    async def __call__(self, make_request, bot, method: TelegramMethod):
+        # Long polling не ограничиваем и не учитываем в задержках
+        if isinstance(method, GetUpdates):
+            return await make_request(bot, method)
+
+        name = method.__api_method__
+        chat_id = getattr(method, "chat_id", None)
+        attempt = 0
+        while True:
+            await self.limiter.acquire(chat_id)
+
+            started = time.monotonic()
+            try:
+                response = await make_request(bot, method)
+            except (TelegramRetryAfter, TelegramNetworkError, TelegramServerError) as e:
+                self._record(name, time.monotonic() - started, ok=False)
+                attempt += 1
+                if isinstance(e, TelegramRetryAfter):
+                    self.limiter.pause(chat_id, e.retry_after)
+                if attempt > BOT_SEND_RETRIES:
+                    raise
+                if not isinstance(e, TelegramRetryAfter) and not _is_idempotent(name):
+                    raise
+                if isinstance(e, TelegramRetryAfter) and name in _NO_WAIT_METHODS:
+                    raise
+                self.metrics[name]["retries"] += 1
+                delay = e.retry_after if isinstance(e, TelegramRetryAfter) else BOT_RETRY_DELAY * 2 ** (attempt - 1)
+                logger.warning(f"{name} для чата {chat_id}: {e.__class__.__name__}, "
+                               f"повтор через {delay} сек (попытка {attempt})")
+                if not isinstance(e, TelegramRetryAfter):
+                    # После RetryAfter повтор сам дождется конца паузы корзины в acquire
+                    await asyncio.sleep(delay)
+                continue
+            except Exception:
+                self._record(name, time.monotonic() - started, ok=False)
+                raise
+
+            self._record(name, time.monotonic() - started, ok=True)
+            return response
+
+
+limiter = RateLimiter(BOT_GLOBAL_RATE, BOT_CHAT_RATE, BOT_CHAT_BURST)
+gateway = SendGateway(limiter)
+
+
+def get_metrics() -> Dict[str, Dict[str, float]]:
+    """Возвращает счетчики шлюза по методам Bot API со средним временем ответа"""
+    return {
+        name: {**stats, "avg_time": stats["total_time"] / stats["calls"] if stats["calls"] else 0.0}
+        for name, stats in gateway.metrics.items()
+    }
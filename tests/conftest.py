@@ -0,0 +1,68 @@
+"""
+Общие настройки тестов.
+
+Запуск из корня проекта:
+    python -m pytest -q tests
+"""
+import asyncio
+import os
+import sys
+
+import pytest
+
+# config.py и ai_gen.py читают переменные окружения при импорте
+os.environ.setdefault("API_ID", "1")
+os.environ.setdefault("API_HASH", "test")
+os.environ.setdefault("TG_TOKEN", "1:test")
+os.environ.setdefault("PROXY_API_KEY", "test")
+
+# Корень проекта - в sys.path, чтобы импортировать db, userbot и т.д.
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+
+@pytest.fixture
+def run_db(tmp_path, monkeypatch):
+    """
+    Запуск корутины с пустой БД во временном каталоге.
+
+    SQLAlchemy переводит путь db/database.db в абсолютный при создании
+    движка, поэтому фабрика сессий db.models на время теста привязывается
+    к отдельному движку с теми же обработчиками соединения. Кэши каналов
+    и постов очищаются, после корутины дописываются операции db.writer
+    и закрываются соединения, чтобы следующий тест (и новый event loop)
+    начал с чистого состояния.
+    """
+    monkeypatch.chdir(tmp_path)
+
+    from sqlalchemy import event
+    from sqlalchemy.ext.asyncio import create_async_engine
+
+    from db import channels, models, post_cache
+    from db.fts import register_functions
+    from db.writer import writer
+
+    engine = create_async_engine(f"sqlite+aiosqlite:///{tmp_path / 'database.db'}")
+    event.listen(engine.sync_engine, "connect", models.apply_pragmas)
+    event.listen(engine.sync_engine, "connect", register_functions)
+    monkeypatch.setattr(models, "engine", engine)
+    monkeypatch.setitem(models.Session.kw, "bind", engine)
+
+    def reset_caches():
+        channels._known.clear()
+        for post_id in list(post_cache._cache):
+            post_cache.invalidate(post_id)
+
+    def run(coro_factory):
+        async def main():
+            reset_caches()
+            await models.create_tables()
+            try:
+                return await coro_factory()
+            finally:
+                await writer.close()
+                await engine.dispose()
+                reset_caches()
+
+        return asyncio.run(main())
+
+    return run
@@ -0,0 +1,102 @@
+"""
+Поиск копий постов userbot.dedup.DuplicateIndex.
+
+Проверяются похожие тексты из разных каналов, совпадение медиа по ID
+файла, повтор того же сообщения, окно и предел размера индекса, а также
+то, что поиск по полосам SimHash находит все отпечатки не дальше
+max_distance бит (сверка с полным перебором).
+"""
+import random
+
+import pytest
+
+from userbot import dedup
+from userbot.dedup import DuplicateIndex, simhash, _shingles
+
+TEXT = ("Министерство финансов сообщило, что с первого июля ставка налога на прибыль "
+        "для малого бизнеса будет снижена до пятнадцати процентов")
+
+
+def test_reposted_text_is_a_duplicate():
+    index = DuplicateIndex(window=3600, max_entries=100, max_distance=7, min_words=8)
+    index.add(1, "Канал А", 10, TEXT)
+
+    # Тот же текст с другой пунктуацией, ссылкой и упоминанием канала
+    copy = index.check(2, "Канал Б", 20, TEXT.upper().replace(",", "") + " https://t.me/b/20 @kanal_b")
+    other = index.check(3, "Канал В", 30, "Сборная по футболу проведет товарищеский матч в Казани "
+                                          "в субботу вечером на новом стадионе")
+
+    assert (copy.chat_id, copy.message_id, copy.also_in) == (1, 10, ["Канал Б"])
+    assert other is None
+    assert index.metrics == {"unique": 1, "duplicates": 1}
+
+
+def test_same_message_is_not_a_duplicate_of_itself():
+    index = DuplicateIndex(window=3600, max_entries=100, max_distance=7, min_words=8)
+    index.add(1, "Канал А", 10, TEXT)
+    index.add(1, "Канал А", 10, TEXT)
+
+    assert index.check(1, "Канал А", 10, TEXT) is None
+    assert len(index) == 1
+
+
+def test_short_text_is_ignored_but_media_matches():
+    index = DuplicateIndex(window=3600, max_entries=100, max_distance=7, min_words=8)
+    index.add(1, "Канал А", 10, "Срочно!")
+    index.add(1, "Канал А", 11, "Фото дня", media=[555])
+
+    assert index.check(2, "Канал Б", 20, "Срочно!") is None
+    assert index.check(2, "Канал Б", 21, None, media=[777, 555]).message_id == 11
+    assert len(index) == 1
+
+
+def test_old_and_excess_entries_are_evicted(monkeypatch):
+    now = [1000.0]
+    monkeypatch.setattr(dedup.time, "monotonic", lambda: now[0])
+    index = DuplicateIndex(window=60, max_entries=2, max_distance=7, min_words=0)
+
+    index.add(1, "А", 1, "первый пост", media=[1])
+    index.add(1, "А", 2, "второй пост совсем о другом")
+    index.add(1, "А", 3, "третий текст про иное", media=[3])
+    assert len(index) == 2
+    assert index.check(2, "Б", 1, "первый пост", media=[1]) is None
+
+    now[0] += 61
+    assert index.check(2, "Б", 3, None, media=[3]) is None
+    assert len(index) == 0
+    assert index._bands == {} and index._media == {}
+
+
+@pytest.mark.parametrize("max_distance", [1, 3, 7])
+def test_band_lookup_matches_brute_force(max_distance):
+    rng = random.Random(max_distance)
+    index = DuplicateIndex(window=3600, max_entries=1000, max_distance=max_distance, min_words=0)
+    fingerprints = {}
+    index._fingerprint = fingerprints.get
+
+    stored = [rng.getrandbits(64) for _ in range(200)]
+    for message_id, fingerprint in enumerate(stored):
+        fingerprints[f"stored {message_id}"] = fingerprint
+        index.add(1, "А", message_id, f"stored {message_id}")
+
+    for probe in range(500):
+        base = rng.choice(stored)
+        flips = rng.sample(range(64), rng.randint(0, max_distance + 2))
+        fingerprint = base
+        for bit in flips:
+            fingerprint ^= 1 << bit
+        fingerprints[f"probe {probe}"] = fingerprint
+
+        found = index.check(2, "Б", probe, f"probe {probe}")
+        expected = any(bin(fingerprint ^ other).count("1") <= max_distance for other in stored)
+        assert (found is not None) == expected
+        if found is not None:
+            assert bin(found.fingerprint ^ fingerprint).count("1") <= max_distance
+
+
+def test_simhash_is_stable_and_close_for_similar_texts():
+    edited = TEXT.replace("пятнадцати", "шестнадцати")
+
+    assert simhash(_shingles(TEXT)) == simhash(_shingles(TEXT))
+    assert bin(simhash(_shingles(TEXT)) ^ simhash(_shingles(edited))).count("1") <= 7
+    assert simhash([]) == 0
@@ -0,0 +1,174 @@
+"""
+Проверка userbot.entities.entities_to_html.
+
+Новый рендер сравнивается с прежним _apply_entities_to_html (сохранен в
+benchmarks/bench_entities.py) на корпусе бенчмарка. Строки у них отличаются
+(BeautifulSoup по-своему расставляет кавычки атрибутов и оставляет пустые
+теги), поэтому сравнивается нормализованная форма: для каждого символа
+текста - множество тегов с атрибутами, внутри которых он выводится.
+
+Прежний рендер при пересекающихся сущностях и сущностях с общим началом
+и разной длиной терял разметку (BeautifulSoup закрывал внешний тег вместе
+с внутренним), поэтому с ним сравниваются только корпуса без таких пар.
+Полные корпуса с пересечениями сверяются с разметкой, посчитанной прямо
+по entities.
+"""
+from html.parser import HTMLParser
+
+import pytest
+
+pytest.importorskip("telethon")
+pytest.importorskip("bs4")
+
+from telethon.tl.types import (
+    MessageEntityBold, MessageEntityItalic, MessageEntityCode, MessageEntityPre,
+    MessageEntityTextUrl, MessageEntityUrl, MessageEntityMention, MessageEntityStrike
+)
+
+from benchmarks.bench_entities import _apply_entities_to_html, _make_post
+from userbot.entities import entities_to_html
+
+# Корпус бенчмарка: (абзацев, seed)
+_CORPUS = [(paragraphs, seed) for paragraphs in (1, 2, 5, 20) for seed in range(10)]
+
+
+class _Coverage(HTMLParser):
+    """Разбирает HTML в список (символ, множество открытых тегов) и проверяет вложенность"""
+
+    def __init__(self):
+        super().__init__(convert_charrefs=True)
+        self.stack = []
+        self.chars = []
+        self.balanced = True
+
+    def handle_starttag(self, tag, attrs):
+        self.stack.append((tag, tuple(sorted(attrs))))
+
+    def handle_endtag(self, tag):
+        if not self.stack or self.stack[-1][0] != tag:
+            self.balanced = False
+        for index in range(len(self.stack) - 1, -1, -1):
+            if self.stack[index][0] == tag:
+                del self.stack[index]
+                break
+
+    def handle_data(self, data):
+        self.chars.extend((char, frozenset(self.stack)) for char in data)
+
+
+def _coverage(html_text: str) -> _Coverage:
+    parser = _Coverage()
+    parser.feed(html_text)
+    parser.close()
+    return parser
+
+
+def _expected_coverage(text: str, entities) -> list:
+    """Разметка по символам, посчитанная прямо по entities (offset в UTF-16)"""
+    index_of = {}
+    offset = 0
+    for index, char in enumerate(text):
+        index_of[offset] = index
+        offset += 2 if ord(char) > 0xFFFF else 1
+    index_of[offset] = len(text)
+
+    tags = [set() for _ in text]
+    for entity in entities:
+        start, end = index_of[entity.offset], index_of[entity.offset + entity.length]
+        entity_text = text[start:end]
+        if isinstance(entity, MessageEntityTextUrl):
+            tag = ('a', (('href', entity.url),))
+        elif isinstance(entity, MessageEntityUrl):
+            tag = ('a', (('href', entity_text),))
+        elif isinstance(entity, MessageEntityMention):
+            tag = ('a', (('href', f"https://t.me/{entity_text[1:]}"),))
+        elif isinstance(entity, MessageEntityPre):
+            tag = ('pre', (('language', entity.language),) if entity.language else ())
+        else:
+            tag = ({MessageEntityBold: 'b', MessageEntityItalic: 'i', MessageEntityStrike: 's',
+                    MessageEntityCode: 'code'}[type(entity)], ())
+        for index in range(start, end):
+            tags[index].add(tag)
+    return [(char, frozenset(char_tags)) for char, char_tags in zip(text, tags)]
+
+
+def _nested_only(entities) -> list:
+    """Оставляет сущности, которые прежний рендер выводил без потерь: без пересечений и без общего начала"""
+    kept = []
+    for entity in entities:
+        start, end = entity.offset, entity.offset + entity.length
+        if all(
+            end <= other.offset or start >= other.offset + other.length
+            or (start, end) == (other.offset, other.offset + other.length)
+            or (other.offset < start and end <= other.offset + other.length)
+            or (start < other.offset and other.offset + other.length <= end)
+            for other in kept
+        ):
+            kept.append(entity)
+    return kept
+
+
+@pytest.mark.parametrize("paragraphs, seed", _CORPUS)
+def test_matches_legacy_renderer_on_nested_corpus(paragraphs, seed):
+    text, entities = _make_post(paragraphs, seed)
+    entities = _nested_only(entities)
+
+    legacy = _coverage(_apply_entities_to_html(text, entities))
+    current = _coverage(entities_to_html(text, entities))
+
+    assert current.chars == legacy.chars
+
+
+@pytest.mark.parametrize("paragraphs, seed", _CORPUS)
+def test_overlapping_corpus_keeps_every_entity(paragraphs, seed):
+    text, entities = _make_post(paragraphs, seed)
+
+    current = _coverage(entities_to_html(text, entities))
+
+    assert current.balanced
+    assert not current.stack
+    assert current.chars == _expected_coverage(text, entities)
+
+
+def test_overlap_is_split_into_nested_tags():
+    assert entities_to_html("abcd", [
+        MessageEntityBold(offset=0, length=3), MessageEntityItalic(offset=1, length=3)
+    ]) == "<b>a<i>bc</i></b><i>d</i>"
+
+
+def test_surrogate_pairs_use_utf16_offsets():
+    # 😀 занимает две кодовые единицы UTF-16: offset 2..4
+    text = "ab😀cd"
+    entities = [MessageEntityBold(offset=2, length=2), MessageEntityItalic(offset=4, length=2)]
+
+    assert entities_to_html(text, entities) == "ab<b>😀</b><i>cd</i>"
+    assert _coverage(entities_to_html(text, entities)).chars == _expected_coverage(text, entities)
+
+
+def test_pre_language_and_urls_are_escaped():
+    text = 'x<y & "z"'
+    entities = [
+        MessageEntityPre(offset=0, length=len(text), language='py"'),
+        MessageEntityTextUrl(offset=0, length=1, url='https://a/?q="1"&b=<2>'),
+    ]
+
+    assert entities_to_html(text, entities) == (
+        '<pre language="py&quot;"><a href="https://a/?q=&quot;1&quot;&amp;b=&lt;2&gt;">x</a>'
+        '&lt;y &amp; &quot;z&quot;</pre>'
+    )
+
+
+def test_url_and_mention_become_links():
+    text = "see https://t.me/x @chan"
+    entities = [MessageEntityUrl(offset=4, length=14), MessageEntityMention(offset=19, length=5)]
+
+    assert entities_to_html(text, entities) == (
+        'see <a href="https://t.me/x">https://t.me/x</a> <a href="https://t.me/chan">@chan</a>'
+    )
+
+
+def test_invalid_entities_are_skipped():
+    entities = [MessageEntityBold(offset=10, length=2), MessageEntityItalic(offset=1, length=0)]
+
+    assert entities_to_html("a<b", entities) == "a&lt;b"
+    assert entities_to_html("", entities) == ""
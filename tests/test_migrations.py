@@ -0,0 +1,139 @@
+"""
+Миграции db.migrations на базе старой схемы.
+
+Старая база создается через sqlite3 в том виде, в котором ее оставляли
+прежние версии бота (chat_title и chat_type в posts, дубли сообщений без
+уникального индекса, digests.post_ids в JSON), затем create_tables
+приводит ее к моделям. Перенос каналов проверяется в обеих ветках:
+ALTER TABLE DROP COLUMN и пересоздание таблицы для SQLite старше 3.35.
+"""
+import json
+import sqlite3
+from datetime import datetime
+
+import pytest
+
+from db import migrations
+from db.models import create_tables
+from db.posts import get_post_by_id, save_post, search_posts
+from db.stats import get_post_stats
+
+_OLD_POSTS = """
+CREATE TABLE posts (id INTEGER PRIMARY KEY, chat_id BIGINT NOT NULL, chat_title VARCHAR, chat_type VARCHAR,
+    message_id BIGINT NOT NULL, content_type VARCHAR, text TEXT, original_date DATETIME, received_at DATETIME,
+    digest BOOLEAN);
+INSERT INTO posts (id, chat_id, chat_title, chat_type, message_id, content_type, text, original_date, received_at, digest)
+VALUES (1, 1, 'Old A', 'channel', 1, 'text', 'привет мир', '2025-01-01 10:00:00.000000', '2025-01-01 10:00:00.000000', 0),
+       (2, 1, 'New A', 'channel', 2, 'text', '<b>кот</b>', '2025-01-02 10:00:00.000000', '2025-01-02 10:00:00.000000', 1),
+       (5, 2, 'B', 'group', 1, 'photo', 'собака', '2025-01-03 10:00:00.000000', '2025-01-03 11:00:00.000000', 0);
+"""
+
+
+def _old_database(path, script: str):
+    connection = sqlite3.connect(path)
+    connection.executescript(script)
+    connection.commit()
+    connection.close()
+
+
+def _query(path, sql: str) -> list:
+    connection = sqlite3.connect(path)
+    try:
+        return connection.execute(sql).fetchall()
+    finally:
+        connection.close()
+
+
+@pytest.fixture
+def database(tmp_path):
+    return tmp_path / "database.db"
+
+
+@pytest.mark.parametrize("sqlite_version", [(3, 40, 0), (3, 34, 1)], ids=["drop-column", "rebuild"])
+def test_chat_columns_move_to_channels(run_db, database, monkeypatch, sqlite_version):
+    monkeypatch.setattr(migrations.sqlite3, "sqlite_version_info", sqlite_version)
+    _old_database(database, _OLD_POSTS)
+
+    async def scenario():
+        migrated = await get_post_by_id(2)
+        saved = await save_post(
+            chat_id=1, chat_title="New A", chat_type="channel", message_id=3,
+            content_type="text", text="кот и пес", original_date=datetime.now()
+        )
+        found = await search_posts("кот", limit=10)
+        return migrated, saved, found, await get_post_stats()
+
+    migrated, saved, found, stats = run_db(scenario)
+
+    assert (migrated.chat_title, migrated.chat_type) == ("New A", "channel")
+    assert (saved.id, saved.chat_title) == (6, "New A")
+    assert sorted(post.id for post in found) == [2, 6]
+    assert (stats["total"], stats["in_digest"]) == (4, 1)
+    assert dict(stats["chats"]) == {"New A": 3, "B": 1}
+
+    # last_seen чата 1 обновил save_post после миграции
+    assert _query(database, "SELECT chat_id, title, type, first_seen FROM channels ORDER BY chat_id") == [
+        (1, "New A", "channel", "2025-01-01 10:00:00.000000"),
+        (2, "B", "group", "2025-01-03 11:00:00.000000"),
+    ]
+    assert _query(database, "SELECT last_seen FROM channels WHERE chat_id = 2") == [("2025-01-03 11:00:00.000000",)]
+    columns = [row[1] for row in _query(database, "PRAGMA table_info(posts)")]
+    assert "chat_title" not in columns and "chat_type" not in columns
+    assert [row[0] for row in _query(database, "SELECT id FROM posts ORDER BY id")] == [1, 2, 5, 6]
+    indexes = {row[0] for row in _query(database, "SELECT name FROM sqlite_master WHERE tbl_name = 'posts'")}
+    assert {"ux_posts_chat_message", "ix_posts_digest_received", "posts_stats_insert", "posts_fts_insert"} <= indexes
+    assert _query(database, "PRAGMA integrity_check") == [("ok",)]
+
+
+def test_migrations_are_idempotent(run_db, database):
+    _old_database(database, _OLD_POSTS)
+
+    def snapshot():
+        return (
+            _query(database, "SELECT type, name, sql FROM sqlite_master ORDER BY name"),
+            _query(database, "SELECT * FROM post_counters ORDER BY chat_id, content_type"),
+            _query(database, "SELECT * FROM post_hourly ORDER BY hour"),
+            _query(database, "SELECT rowid FROM posts_fts ORDER BY rowid"),
+        )
+
+    run_db(lambda: create_tables())
+    first = snapshot()
+    run_db(lambda: create_tables())
+
+    assert snapshot() == first
+    assert first[1] == [(1, "text", 2, 1), (2, "photo", 1, 0)]
+
+
+def test_duplicate_posts_are_removed_before_unique_index(run_db, database):
+    _old_database(database, """
+        CREATE TABLE posts (id INTEGER PRIMARY KEY, chat_id BIGINT NOT NULL, message_id BIGINT NOT NULL,
+            content_type VARCHAR, text TEXT, original_date DATETIME);
+        INSERT INTO posts (id, chat_id, message_id, content_type, text, original_date)
+        VALUES (1, 1, 7, 'text', 'первый', '2025-01-01 10:00:00.000000'),
+               (2, 1, 7, 'text', 'дубль', '2025-01-01 10:00:00.000000'),
+               (3, 1, 8, 'text', 'другой', '2025-01-01 10:00:00.000000');
+    """)
+
+    run_db(lambda: create_tables())
+
+    assert _query(database, "SELECT id, text FROM posts ORDER BY id") == [(1, "первый"), (3, "другой")]
+    columns = {row[1] for row in _query(database, "PRAGMA table_info(posts)")}
+    assert {"grouped_id", "file_id", "media", "ai_gen", "edit_text", "processed_at"} <= columns
+
+
+def test_digest_post_ids_move_to_digest_posts(run_db, database):
+    _old_database(database, _OLD_POSTS + f"""
+        CREATE TABLE digests (id INTEGER PRIMARY KEY, digest_hash VARCHAR(32) NOT NULL UNIQUE, text TEXT NOT NULL,
+            edit_text TEXT, created_at DATETIME, published_at DATETIME, post_ids JSON);
+        INSERT INTO digests (id, digest_hash, text, post_ids)
+        VALUES (1, 'a', 'дайджест', '{json.dumps([1, 2, 99])}'),
+               (2, 'b', 'дайджест', '{json.dumps(json.dumps([5]))}'),
+               (3, 'c', 'дайджест', 'не json');
+    """)
+
+    run_db(lambda: create_tables())
+
+    assert _query(database, "SELECT digest_id, post_id FROM digest_posts ORDER BY digest_id, post_id") == [
+        (1, 1), (1, 2), (2, 5)
+    ]
+    assert _query(database, "SELECT count(*) FROM digests WHERE post_ids IS NOT NULL") == [(0,)]
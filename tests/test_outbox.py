@@ -0,0 +1,142 @@
+"""
+Очередь доставки постов админам (db.outbox, userbot.outbox).
+
+Проверяются переходы статусов pending -> sending -> sent/failed, растущая
+пауза между попытками, метка захвата attempts (устаревший захват ничего
+не меняет) и возврат зависших доставок при старте.
+"""
+from datetime import datetime, timedelta
+
+from sqlalchemy import select, update
+
+from db import outbox as db_outbox
+from db.models import Session, Delivery
+from db.outbox import (claim_deliveries, complete_deliveries, release_claims, renew_claim,
+                       save_post_with_deliveries)
+from userbot import outbox
+
+POST = dict(chat_id=100, chat_title="Канал", chat_type="channel", message_id=1, content_type="text", text="пост")
+
+
+async def _deliveries() -> dict:
+    """admin_id -> (status, attempts, next_attempt_at, last_error)"""
+    async with Session() as session:
+        rows = await session.execute(select(
+            Delivery.admin_id, Delivery.status, Delivery.attempts, Delivery.next_attempt_at, Delivery.last_error
+        ))
+        return {row.admin_id: tuple(row[1:]) for row in rows}
+
+
+async def _make_due():
+    """Переносит срок всех доставок в прошлое, как будто пауза или захват истекли"""
+    async with Session() as session:
+        await session.execute(update(Delivery).values(next_attempt_at=datetime.now() - timedelta(seconds=1)))
+        await session.commit()
+
+
+def test_retry_delay_doubles_up_to_limit(monkeypatch):
+    monkeypatch.setattr(db_outbox, "OUTBOX_BASE_DELAY", 30)
+    monkeypatch.setattr(db_outbox, "OUTBOX_MAX_DELAY", 200)
+
+    assert [db_outbox._retry_delay(attempts).total_seconds() for attempts in range(1, 6)] == [30, 60, 120, 200, 200]
+
+
+def test_failed_delivery_is_retried_with_backoff(run_db, monkeypatch):
+    monkeypatch.setattr(db_outbox, "OUTBOX_BASE_DELAY", 30)
+
+    async def scenario():
+        post, claims = await save_post_with_deliveries([1, 2], **POST)
+        _, repeated = await save_post_with_deliveries([1, 2], **POST)
+        started = datetime.now()
+        await complete_deliveries(post.id, claims, {2: "Forbidden"})
+        after_first = await _deliveries()
+        not_due = await claim_deliveries(10)
+
+        await _make_due()
+        rows = await claim_deliveries(10)
+        started_second = datetime.now()
+        await complete_deliveries(post.id, {row.admin_id: row.attempts for row in rows}, {2: "Forbidden"})
+        return claims, repeated, started, after_first, not_due, rows, started_second, await _deliveries()
+
+    claims, repeated, started, after_first, not_due, rows, started_second, after_second = run_db(scenario)
+
+    assert claims == {1: 1, 2: 1}
+    assert repeated == {}
+    assert after_first[1][:2] == ("sent", 1)
+    assert after_first[2][:2] == ("pending", 1) and after_first[2][3] == "Forbidden"
+    assert timedelta(seconds=29) < after_first[2][2] - started <= timedelta(seconds=31)
+    assert not_due == []
+    assert [(row.admin_id, row.attempts) for row in rows] == [(2, 2)]
+    assert after_second[2][:2] == ("pending", 2)
+    assert timedelta(seconds=59) < after_second[2][2] - started_second <= timedelta(seconds=61)
+
+
+def test_delivery_fails_after_max_attempts(run_db, monkeypatch):
+    monkeypatch.setattr(db_outbox, "OUTBOX_MAX_ATTEMPTS", 2)
+
+    async def scenario():
+        post, claims = await save_post_with_deliveries([1], **POST)
+        first = await complete_deliveries(post.id, claims, {1: "timeout"})
+        await _make_due()
+        rows = await claim_deliveries(10)
+        second = await complete_deliveries(post.id, {row.admin_id: row.attempts for row in rows}, {1: "timeout"})
+        await _make_due()
+        return first, second, await claim_deliveries(10), await _deliveries()
+
+    first, second, claimed_after, deliveries = run_db(scenario)
+
+    assert (first, second) == (0, 1)
+    assert claimed_after == []
+    assert deliveries[1][:2] == ("failed", 2)
+
+
+def test_stale_claim_cannot_send_or_complete(run_db):
+    async def scenario():
+        post, claims = await save_post_with_deliveries([1], **POST)
+        # Захват истек во время долгой рассылки, доставку забрал outbox
+        await _make_due()
+        rows = await claim_deliveries(10)
+        stale_renewed = await renew_claim(post.id, 1, claims[1])
+        await complete_deliveries(post.id, claims, {1: "устаревший результат"})
+        after_stale = await _deliveries()
+        renewed = await renew_claim(post.id, 1, rows[0].attempts)
+        await complete_deliveries(post.id, {1: rows[0].attempts}, {})
+        return rows, stale_renewed, after_stale, renewed, await _deliveries()
+
+    rows, stale_renewed, after_stale, renewed, deliveries = run_db(scenario)
+
+    assert [(row.admin_id, row.attempts) for row in rows] == [(1, 2)]
+    assert stale_renewed is False
+    assert after_stale[1][0] == "sending" and after_stale[1][3] is None
+    assert renewed is True
+    assert deliveries[1][:2] == ("sent", 2)
+
+
+def test_release_claims_returns_sending_to_queue(run_db):
+    async def scenario():
+        await save_post_with_deliveries([1, 2], **POST)
+        released = await release_claims()
+        return released, await claim_deliveries(10)
+
+    released, rows = run_db(scenario)
+
+    assert released == 2
+    assert sorted((row.admin_id, row.attempts) for row in rows) == [(1, 2), (2, 2)]
+
+
+def test_handler_error_postpones_every_admin(run_db, monkeypatch):
+    monkeypatch.setattr(outbox, "_metrics", dict.fromkeys(outbox._metrics, 0))
+
+    async def handler(post_id, claims):
+        raise ConnectionError()
+
+    async def scenario():
+        post, claims = await save_post_with_deliveries([1, 2], **POST)
+        await outbox._process_post(handler, post.id, claims)
+        return await _deliveries()
+
+    deliveries = run_db(scenario)
+
+    assert {admin_id: row[0] for admin_id, row in deliveries.items()} == {1: "pending", 2: "pending"}
+    assert deliveries[1][3] == "ConnectionError"
+    assert outbox.get_metrics() == {"claimed": 0, "sent": 0, "retried": 2, "failed": 0}
@@ -0,0 +1,209 @@
+"""
+Чтение отложенных текстов поста (группа POST_CONTENT с raiseload).
+
+text, ai_gen и edit_text не читаются select(Post), а обращение к
+незагруженному полю - ошибка. Тесты прогоняют обработчики, которые
+показывают и публикуют тексты (предпросмотр, публикация, переключение
+разметки, генерация AI, экспорт, дайджест, поиск), на настоящей сессии
+SQLite: если какой-то путь забудет загрузить тексты, обработчик
+ответит ошибкой вместо текста поста.
+"""
+from datetime import datetime, timedelta
+from types import SimpleNamespace
+
+import pytest
+from sqlalchemy.exc import SQLAlchemyError
+
+pytest.importorskip("telethon")
+pytest.importorskip("openai")
+
+from db import posts as db_posts
+from db.digests import get_posts_for_digest
+from db.posts import get_posts, save_post, update_post_ai_gen, update_post_edit_text
+
+ADMIN_ID = 42
+CHANNEL = "@test_channel"
+
+
+class FakeBot:
+    """Записывает вызовы Bot API вместо отправки"""
+
+    def __init__(self):
+        self.calls = []
+
+    def __getattr__(self, name):
+        async def method(*args, **kwargs):
+            self.calls.append((name, kwargs))
+            if name == "send_media_group":
+                return []
+            return SimpleNamespace(message_id=len(self.calls))
+        return method
+
+    def sent(self, name: str, field: str) -> list:
+        return [kwargs.get(field) for method, kwargs in self.calls if method == name]
+
+
+class FakeState:
+    """FSMContext в памяти"""
+
+    def __init__(self):
+        self.data = {}
+
+    async def update_data(self, **kwargs):
+        self.data.update(kwargs)
+
+    async def get_data(self):
+        return dict(self.data)
+
+    async def set_state(self, state):
+        pass
+
+    async def clear(self):
+        self.data = {}
+
+
+def _callback(data: str, answers: list):
+    async def answer(text=None, **kwargs):
+        answers.append(text)
+
+    async def message_answer(text=None, **kwargs):
+        return SimpleNamespace(message_id=2)
+
+    message = SimpleNamespace(message_id=1, reply_markup=None, answer=message_answer)
+    return SimpleNamespace(data=data, from_user=SimpleNamespace(id=ADMIN_ID), message=message, answer=answer)
+
+
+@pytest.fixture
+def admin_post(monkeypatch):
+    from handlers import handlers_admin_post
+
+    bot = FakeBot()
+    monkeypatch.setattr(handlers_admin_post, "bot", bot)
+    monkeypatch.setattr(handlers_admin_post, "ADMIN_IDS", [ADMIN_ID])
+    monkeypatch.setattr(handlers_admin_post, "CHANEL_ID", CHANNEL)
+    return handlers_admin_post, bot
+
+
+async def _save(content_type: str = "text", **fields) -> int:
+    post = await save_post(
+        chat_id=100, chat_title="Канал", chat_type="channel", message_id=fields.pop("message_id", 1),
+        content_type=content_type, text=fields.pop("text", "<b>оригинал</b>"),
+        file_id=fields.pop("file_id", None), original_date=datetime.now()
+    )
+    await update_post_ai_gen(post.id, "текст AI")
+    await update_post_edit_text(post.id, "текст админа")
+    return post.id
+
+
+@pytest.mark.parametrize("text_type, expected", [
+    ("original", "<b>оригинал</b>"), ("ai", "текст AI"), ("edit", "текст админа"),
+])
+def test_preview_and_publish_read_post_texts(run_db, admin_post, text_type, expected):
+    handlers, bot = admin_post
+    answers = []
+
+    async def scenario():
+        post_id = await _save()
+        state = FakeState()
+        await handlers.publish_callback(_callback(f"publish_{text_type}:{post_id}", answers), state)
+        await handlers.confirm_publish_callback(_callback(f"confirm_publish:{post_id}:{text_type}", answers), state)
+
+    run_db(scenario)
+
+    assert bot.sent("send_message", "text") == [expected, expected]
+    assert bot.sent("send_message", "chat_id") == [ADMIN_ID, CHANNEL]
+    assert "❌ Произошла ошибка" not in answers
+
+
+def test_publish_media_post_uses_caption(run_db, admin_post):
+    handlers, bot = admin_post
+    answers = []
+
+    async def scenario():
+        post_id = await _save("photo", file_id="PHOTO")
+        await handlers.confirm_publish_callback(_callback(f"confirm_publish:{post_id}:ai", answers), FakeState())
+
+    run_db(scenario)
+
+    assert bot.sent("send_photo", "caption") == ["текст AI"]
+    assert bot.sent("send_photo", "photo") == ["PHOTO"]
+
+
+@pytest.mark.parametrize("parse_type, expected", [
+    ("toggle_parse_original", "<b>оригинал</b>"), ("toggle_parse_ai", "текст AI"), ("toggle_parse_edit", "текст админа"),
+])
+def test_toggle_parse_reads_post_texts(run_db, admin_post, parse_type, expected):
+    handlers, bot = admin_post
+    answers = []
+
+    async def scenario():
+        post_id = await _save()
+        await handlers.toggle_parse_callback(_callback(f"{parse_type}:{post_id}", answers))
+
+    run_db(scenario)
+
+    assert bot.sent("edit_message_text", "text") == [expected]
+    assert "❌ Произошла ошибка" not in answers
+
+
+def test_ai_generate_reads_original_text(run_db, admin_post, monkeypatch):
+    handlers, bot = admin_post
+    sources = []
+
+    async def post_gen(text):
+        sources.append(text)
+        return "новый текст AI"
+
+    monkeypatch.setattr(handlers, "post_gen", post_gen)
+
+    async def scenario():
+        post_id = await _save()
+        await handlers.ai_generate_callback(_callback(f"ai_generate:{post_id}", []))
+        return (await db_posts.get_post_by_id(post_id)).ai_gen
+
+    assert run_db(scenario) == "новый текст AI"
+    assert sources == ["<b>оригинал</b>"]
+
+
+def test_export_reads_text_and_ai_gen(run_db, tmp_path):
+    openpyxl = pytest.importorskip("openpyxl")
+    from handlers.handlers_export import create_excel_file
+
+    async def scenario():
+        await _save()
+        return await create_excel_file()
+
+    filepath, count = run_db(scenario)
+
+    sheet = openpyxl.load_workbook(tmp_path / filepath).active
+    assert count == 1
+    assert sheet.cell(row=2, column=7).value == "оригинал"
+    assert sheet.cell(row=2, column=10).value == "текст AI"
+
+
+def test_digest_and_search_read_post_text(run_db):
+    from handlers.handlers_search import _search_page
+
+    async def scenario():
+        await _save(text="важное заявление министра")
+        digest_posts = await get_posts_for_digest(datetime.now() - timedelta(days=1))
+        search_text, _ = await _search_page("заявление", 0)
+        return digest_posts, search_text
+
+    digest_posts, search_text = run_db(scenario)
+
+    assert [post.text for post in digest_posts] == []
+    assert "текст админа" in search_text
+
+
+def test_texts_are_loaded_only_on_request(run_db):
+    async def scenario():
+        await _save()
+        return await get_posts(), await get_posts(content=True)
+
+    without_content, with_content = run_db(scenario)
+
+    with pytest.raises(SQLAlchemyError):
+        without_content[0].text
+    assert with_content[0].text == "<b>оригинал</b>"
+    assert with_content[0].edit_text == "текст админа"
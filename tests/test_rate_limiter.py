@@ -0,0 +1,189 @@
+"""
+Лимиты и повторы запросов Bot API (rate_limiter).
+
+Время подменяется: time.monotonic читает часы теста, а asyncio.sleep
+в rate_limiter сдвигает их, поэтому проверки не зависят от скорости
+машины и проходят мгновенно.
+"""
+import asyncio
+from types import SimpleNamespace
+
+import pytest
+from aiogram.exceptions import TelegramNetworkError, TelegramRetryAfter, TelegramServerError
+from aiogram.methods import AnswerCallbackQuery, EditMessageText, GetMe, GetUpdates, SendMessage
+
+import rate_limiter
+from rate_limiter import RateLimiter, SendGateway, TokenBucket
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    """Часы теста: clock.now - текущее время, sleep сдвигает его"""
+    clock = SimpleNamespace(now=1000.0)
+
+    async def sleep(seconds):
+        # Как у настоящего таймера, время сдвигается не меньше чем на микросекунду
+        clock.now += max(seconds, 1e-6)
+        await asyncio.sleep(0)
+
+    monkeypatch.setattr(rate_limiter, "time", SimpleNamespace(monotonic=lambda: clock.now))
+    monkeypatch.setattr(rate_limiter, "asyncio", SimpleNamespace(Lock=asyncio.Lock, sleep=sleep))
+    return clock
+
+
+def _acquire_times(clock, acquire, count: int) -> list:
+    async def main():
+        times = []
+        for _ in range(count):
+            await acquire()
+            times.append(round(clock.now - 1000, 3))
+        return times
+
+    return asyncio.run(main())
+
+
+def test_bucket_allows_burst_then_rate(clock):
+    bucket = TokenBucket(rate=2, capacity=3)
+
+    assert _acquire_times(clock, bucket.acquire, 6) == [0, 0, 0, 0.5, 1.0, 1.5]
+
+
+def test_paused_bucket_waits_out_the_pause(clock):
+    bucket = TokenBucket(rate=2, capacity=3)
+    bucket.pause(10)
+
+    assert not bucket.is_idle()
+    assert _acquire_times(clock, bucket.acquire, 2) == [10.5, 11.0]
+
+
+def test_chat_buckets_are_separate_and_global_is_shared(clock):
+    limiter = RateLimiter(global_rate=10, chat_rate=1, chat_burst=1)
+
+    async def main():
+        times = []
+        for chat_id in (1, 2, 1, None):
+            await limiter.acquire(chat_id)
+            times.append((chat_id, round(clock.now - 1000, 3)))
+        return times
+
+    assert asyncio.run(main()) == [(1, 0), (2, 0), (1, 1.0), (None, 1.0)]
+    assert set(limiter._chat_buckets) == {1, 2}
+
+
+def test_pause_without_chat_stops_every_request(clock):
+    limiter = RateLimiter(global_rate=10, chat_rate=1, chat_burst=1)
+    limiter.pause(None, 5)
+
+    assert _acquire_times(clock, lambda: limiter.acquire(1), 1) == [5.1]
+
+
+class _Telegram:
+    """make_request сессии бота: выдает ошибки из списка, затем успешный ответ"""
+
+    def __init__(self, clock, *errors):
+        self.clock = clock
+        self.errors = list(errors)
+        self.calls = []
+
+    async def __call__(self, bot, method):
+        self.calls.append((method.__api_method__, getattr(method, "chat_id", None), self.clock.now - 1000))
+        if self.errors:
+            raise self.errors.pop(0)(method)
+        return "ok"
+
+
+def _retry_after(seconds):
+    return lambda method: TelegramRetryAfter(method, "Flood control", seconds)
+
+
+def _server_error(method):
+    return TelegramServerError(method, "Bad Gateway")
+
+
+def _network_error(method):
+    return TelegramNetworkError(method, "timeout")
+
+
+@pytest.fixture
+def gateway(clock, monkeypatch):
+    monkeypatch.setattr(rate_limiter, "BOT_SEND_RETRIES", 3)
+    monkeypatch.setattr(rate_limiter, "BOT_RETRY_DELAY", 1)
+    return SendGateway(RateLimiter(global_rate=100, chat_rate=100, chat_burst=100))
+
+
+def test_send_is_not_retried_after_server_or_network_error(clock, gateway):
+    for error in (_server_error, _network_error):
+        telegram = _Telegram(clock, error)
+
+        with pytest.raises((TelegramServerError, TelegramNetworkError)):
+            asyncio.run(gateway(telegram, None, SendMessage(chat_id=1, text="пост")))
+        assert len(telegram.calls) == 1
+
+
+def test_edit_is_retried_with_growing_delay(clock, gateway):
+    telegram = _Telegram(clock, _server_error, _network_error, _server_error)
+
+    result = asyncio.run(gateway(telegram, None, EditMessageText(chat_id=1, message_id=1, text="пост")))
+
+    assert result == "ok"
+    assert [round(at, 2) for _, _, at in telegram.calls] == [0, 1.0, 3.0, 7.0]
+    assert gateway.metrics["editMessageText"]["retries"] == 3
+    assert gateway.metrics["editMessageText"]["errors"] == 3
+
+
+def test_edit_gives_up_after_retries(clock, gateway):
+    telegram = _Telegram(clock, *[_server_error] * 4)
+
+    with pytest.raises(TelegramServerError):
+        asyncio.run(gateway(telegram, None, EditMessageText(chat_id=1, message_id=1, text="пост")))
+    assert len(telegram.calls) == 4
+
+
+def test_retry_after_waits_out_the_pause(clock, gateway):
+    telegram = _Telegram(clock, _retry_after(30))
+
+    result = asyncio.run(gateway(telegram, None, SendMessage(chat_id=1, text="пост")))
+
+    assert result == "ok"
+    assert [round(at, 2) for _, _, at in telegram.calls] == [0, 30.01]
+    assert gateway.metrics["sendMessage"]["retries"] == 1
+
+
+def test_retry_after_pauses_only_that_chat(clock, gateway, monkeypatch):
+    monkeypatch.setattr(rate_limiter, "BOT_SEND_RETRIES", 0)
+    telegram = _Telegram(clock, _retry_after(30))
+
+    async def main():
+        with pytest.raises(TelegramRetryAfter):
+            await gateway(telegram, None, SendMessage(chat_id=1, text="пост"))
+        await gateway(telegram, None, SendMessage(chat_id=2, text="пост"))
+        await gateway(telegram, None, SendMessage(chat_id=1, text="пост"))
+
+    asyncio.run(main())
+
+    assert [(chat_id, round(at, 2)) for _, chat_id, at in telegram.calls] == [(1, 0), (2, 0), (1, 30.01)]
+
+
+def test_callback_answer_is_not_retried_after_retry_after(clock, gateway):
+    telegram = _Telegram(clock, _retry_after(30))
+
+    with pytest.raises(TelegramRetryAfter):
+        asyncio.run(gateway(telegram, None, AnswerCallbackQuery(callback_query_id="1")))
+    assert len(telegram.calls) == 1
+
+
+def test_every_request_waits_for_global_limit(clock):
+    gateway = SendGateway(RateLimiter(global_rate=1, chat_rate=100, chat_burst=100))
+    telegram = _Telegram(clock)
+
+    async def main():
+        await gateway(telegram, None, GetMe())
+        await gateway(telegram, None, SendMessage(chat_id=1, text="пост"))
+        await gateway(telegram, None, GetUpdates())
+
+    asyncio.run(main())
+
+    assert [(name, round(at, 2)) for name, _, at in telegram.calls] == [
+        ("getMe", 0), ("sendMessage", 1.0), ("getUpdates", 1.0)
+    ]
+    assert "getUpdates" not in gateway.metrics
@@ -2,26 +2,31 @@ import asyncio
 from pprint import pprint
 
 from telethon import TelegramClient, events
+from telethon.events.chataction import ChatAction
 from telethon.events.newmessage import NewMessage
-from telethon.types import Channel, Chat
-from telethon.tl.types import (
-    MessageEntityBold, MessageEntityItalic, MessageEntityCode, MessageEntityPre,
-    MessageEntityTextUrl, MessageEntityUrl, MessageEntityMention,
-    MessageEntityHashtag, MessageEntityStrike, MessageEntityBlockquote
-)
-from aiogram.types import FSInputFile, InlineKeyboardMarkup, InlineKeyboardButton
+from aiogram.types import BufferedInputFile, FSInputFile, InputFile, InlineKeyboardMarkup, InlineKeyboardButton
 from aiogram.enums import ParseMode
+from aiogram.exceptions import TelegramBadRequest
 import tempfile
 import os
 import html
-from typing import List, Tuple, Optional
-from html import escape
-from bs4 import BeautifulSoup
+from dataclasses import dataclass, field
+from typing import Any, Awaitable, Callable, Dict, List, Tuple, Optional
 
 from logger import logger
-from config import ADMIN_IDS
+from config import ADMIN_IDS, MEDIA_MEMORY_LIMIT
 from bot import bot
-from db.posts import save_post
+from db.models import Post
+from db.outbox import save_post_with_deliveries, complete_deliveries, renew_claim
+from db.posts import get_post_by_id, update_post_file_id
+from userbot.pipeline import IncomingPost, enqueue
+from userbot.albums import ALBUM_MAX_PARTS, ALBUM_MEDIA_TYPES, AlbumAggregator, build_album
+from userbot.entities import entities_to_html
+from userbot import chat_cache
+from userbot.chat_cache import ChatMeta
+from userbot.filters import source_filter
+from userbot.dedup import duplicates
+from userbot import watermarks
 
 _client = None
 
@@ -80,10 +85,15 @@ def create_client(api_id: int, api_hash: str, phone: str = None):
         system_version='1.0',
         app_version='1.0',
         lang_code='en',
-        system_lang_code='en'
+        system_lang_code='en',
+        # Переподключением занимается userbot.supervisor: встроенное
+        # автопереподключение Telethon гонялось бы с ним за один sender
+        auto_reconnect=False
     )
     # Регистрируем обработчик для всех входящих сообщений
     _client.on(events.NewMessage(incoming=True))(channel_event)
+    # Сбрасываем кэш метаданных чата при смене названия
+    _client.on(events.ChatAction())(chat_action_event)
 
     return _client
 
@@ -94,428 +104,679 @@ def client():
     return _client
 
 
-def _utf16_len(text: str) -> int:
-    """Возвращает длину строки в UTF-16 кодовых единицах"""
-    return len(text.encode('utf-16-le')) // 2
-
-
-def _utf16_offset_to_unicode(text: str, utf16_offset: int) -> int:
-    """
-    Преобразует UTF-16 offset в позицию в Unicode строке Python
-    """
-    if utf16_offset == 0:
-        return 0
-
-    utf16_bytes = text.encode('utf-16-le')
-
-    # Если offset выходит за пределы
-    if utf16_offset * 2 > len(utf16_bytes):
-        return len(text)
-
-    # Декодируем байты до указанного offset
-    decoded = utf16_bytes[:utf16_offset * 2].decode('utf-16-le')
-    return len(decoded)
-
-
-def _apply_entities_to_html(text: str, entities) -> str:
-    """
-    Применяет HTML разметку к тексту на основе entities от Telegram
-    с корректной обработкой вложенных сущностей
-    """
-    if not text:
-        return ""
-
-    # Если нет сущностей, просто экранируем текст
-    if not entities:
-        return escape(text)
-
-    # Создаем список для хранения тегов
-    tags: List[Tuple[int, str, Optional[dict]]] = []
-
-    # Преобразуем сущности в теги
-    for entity in entities:
-        start = _utf16_offset_to_unicode(text, entity.offset)
-        end = _utf16_offset_to_unicode(text, entity.offset + entity.length)
-
-        # Проверяем корректность позиций
-        if start >= len(text) or end > len(text) or start < 0 or end <= start:
-            continue
-
-        entity_text = text[start:end]
-
-        # Определяем HTML тег в зависимости от типа сущности
-        if isinstance(entity, MessageEntityBold):
-            tags.append((start, 'open', {'tag': 'b'}))
-            tags.append((end, 'close', {'tag': 'b'}))
-        elif isinstance(entity, MessageEntityItalic):
-            tags.append((start, 'open', {'tag': 'i'}))
-            tags.append((end, 'close', {'tag': 'i'}))
-        elif isinstance(entity, MessageEntityCode):
-            tags.append((start, 'open', {'tag': 'code'}))
-            tags.append((end, 'close', {'tag': 'code'}))
-        elif isinstance(entity, MessageEntityPre):
-            language = getattr(entity, 'language', '')
-            if language:
-                tags.append((start, 'open', {'tag': 'pre', 'attrs': f' language="{escape(language)}"'}))
-            else:
-                tags.append((start, 'open', {'tag': 'pre'}))
-            tags.append((end, 'close', {'tag': 'pre'}))
-        elif isinstance(entity, MessageEntityTextUrl):
-            url = entity.url
-            if url:
-                url_escaped = escape(url)
-                tags.append((start, 'open', {'tag': 'a', 'attrs': f' href="{url_escaped}"'}))
-                tags.append((end, 'close', {'tag': 'a'}))
-        elif isinstance(entity, MessageEntityUrl):
-            url_escaped = escape(entity_text)
-            tags.append((start, 'open', {'tag': 'a', 'attrs': f' href="{url_escaped}"'}))
-            tags.append((end, 'close', {'tag': 'a'}))
-        elif isinstance(entity, MessageEntityMention):
-            if entity_text.startswith('@'):
-                username = entity_text[1:] if len(entity_text) > 1 else ''
-                if username:
-                    tags.append((start, 'open', {'tag': 'a', 'attrs': f' href="https://t.me/{username}"'}))
-                    tags.append((end, 'close', {'tag': 'a'}))
-        elif isinstance(entity, MessageEntityStrike):
-            tags.append((start, 'open', {'tag': 's'}))
-            tags.append((end, 'close', {'tag': 's'}))
-        elif isinstance(entity, MessageEntityBlockquote):
-            tags.append((start, 'open', {'tag': 'blockquote'}))
-            tags.append((end, 'close', {'tag': 'blockquote'}))
-
-    # Сортируем теги по позиции, закрывающие теги перед открывающими на той же позиции
-    tags.sort(key=lambda x: (x[0], 0 if x[1] == 'close' else 1))
-
-    # Собираем результат с тегами
-    result_parts = []
-    last_pos = 0
-
-    for pos, tag_type, tag_info in tags:
-        # Добавляем текст между тегами
-        if pos > last_pos:
-            result_parts.append(escape(text[last_pos:pos]))
-
-        # Добавляем тег
-        if tag_type == 'open':
-            attrs = tag_info.get('attrs', '')
-            result_parts.append(f'<{tag_info["tag"]}{attrs}>')
-        else:  # 'close'
-            result_parts.append(f'</{tag_info["tag"]}>')
-
-        last_pos = pos
-
-    # Добавляем оставшийся текст после последнего тега
-    if last_pos < len(text):
-        result_parts.append(escape(text[last_pos:]))
-
-    # Преобразуем в строку
-    html_with_tags = ''.join(result_parts)
-
-    # Используем BeautifulSoup для исправления порядка закрывающих тегов
+async def _save_post_to_db(item: IncomingPost) -> Tuple[Optional[Post], Dict[int, Optional[int]]]:
+    """
+    Сохраняет пост в базу данных вместе с доставками админам (outbox)
+
+    Возвращает пост и захваты доставок админам, которым его нужно отправить
+    (admin_id -> attempts). Если БД недоступна, пост все равно уходит всем
+    админам, но без отслеживания (захваты None).
+    """
     try:
-        soup = BeautifulSoup(html_with_tags, 'html.parser')
-        # Получаем отформатированный HTML
-        fixed_html = str(soup)
+        # Сохраняем пост в БД
+        post, claims = await save_post_with_deliveries(
+            ADMIN_IDS,
+            chat_id=item.chat_id,
+            chat_title=item.chat_title,
+            chat_type=item.chat_type,
+            message_id=item.message_id,
+            content_type=item.content_type,
+            text=item.text,
+            original_date=item.original_date,
+            grouped_id=item.grouped_id
+        )
 
-        # Убираем лишние теги, которые добавляет BeautifulSoup (html, body)
-        if fixed_html.startswith('<html><body>') and fixed_html.endswith('</body></html>'):
-            fixed_html = fixed_html[12:-14]
-        elif fixed_html.startswith('<body>') and fixed_html.endswith('</body>'):
-            fixed_html = fixed_html[6:-7]
+        logger.info(f"Пост сохранен в БД с ID: {post.id}")
+        return post, claims
 
-        return fixed_html
     except Exception as e:
-        logger.error(f"Ошибка при исправлении HTML с помощью BeautifulSoup: {e}")
-        # В случае ошибки возвращаем исходный вариант
-        return html_with_tags
-
-
-def _get_html_tag(entity_info, entity_text):
-    """Возвращает HTML теги для сущности"""
-    entity = entity_info['entity']
-    entity_type = entity_info['type']
-
-    if isinstance(entity, MessageEntityBold):
-        return {'open': '<b>', 'close': '</b>'}
-    elif isinstance(entity, MessageEntityItalic):
-        return {'open': '<i>', 'close': '</i>'}
-    elif isinstance(entity, MessageEntityCode):
-        return {'open': '<code>', 'close': '</code>'}
-    elif isinstance(entity, MessageEntityPre):
-        language = getattr(entity, 'language', '')
-        if language:
-            return {'open': f'<pre language="{html.escape(language)}">', 'close': '</pre>'}
+        logger.error(f"Ошибка при сохранении поста в БД: {e}")
+        logger.exception(f"Полная трассировка ошибки: ")
+        return None, {admin_id: None for admin_id in ADMIN_IDS}
+
+
+def _content_type(message) -> str:
+    """Определяет тип контента сообщения"""
+    content_type = 'text'
+    if message.media:
+        if message.photo:
+            content_type = 'photo'
+        elif message.video:
+            content_type = 'video'
+        elif message.document:
+            content_type = 'document'
+        elif message.audio:
+            content_type = 'audio'
+        elif message.voice:
+            content_type = 'voice'
+    return content_type
+
+
+def _media_ids(message) -> Tuple[int, ...]:
+    """ID файла Telegram (фото или документа), одинаковый у пересланных копий"""
+    media = message.photo or message.document
+    return (media.id,) if media else ()
+
+
+def _is_duplicate(meta: ChatMeta, message_id: int, text: Optional[str], media: Tuple[int, ...]) -> bool:
+    """
+    Проверяет, не приходил ли недавно такой же пост из другого канала
+
+    В индекс копий пост попадает только после постановки в очередь (_enqueue_tracked).
+    """
+    original = duplicates.check(meta.chat_id, meta.title, message_id, text, media)
+    if original is None:
+        return False
+    logger.info(f"Пост {message_id} из {meta.title} повторяет пост {original.message_id} "
+                f"из {original.chat_title} (также в: {', '.join(original.also_in)}), пропускаем")
+    return True
+
+
+def _normalize_message(meta: ChatMeta, message) -> IncomingPost:
+    """Приводит сообщение Telethon к виду, пригодному для очереди доставки"""
+    # Получаем текст сообщения с сохранением форматирования
+    message_text = ""
+    if message.message:
+        message_text = message.message
+
+        # Применяем HTML разметку на основе entities
+        if hasattr(message, 'entities') and message.entities:
+            try:
+                message_text = entities_to_html(message_text, message.entities)
+            except Exception as e:
+                logger.error(f"Ошибка при применении HTML разметки: {e}")
+                # В случае ошибки просто экранируем текст
+                message_text = html.escape(message_text)
         else:
-            return {'open': '<pre>', 'close': '</pre>'}
-    elif isinstance(entity, MessageEntityTextUrl):
-        url = entity.url
-        if url:
-            url_escaped = html.escape(url)
-            text_escaped = html.escape(entity_text)
-            return {'open': f'<a href="{url_escaped}">', 'close': '</a>'}
-    elif isinstance(entity, MessageEntityUrl):
-        url_escaped = html.escape(entity_text)
-        text_escaped = html.escape(entity_text)
-        return {'open': f'<a href="{url_escaped}">', 'close': '</a>'}
-    elif isinstance(entity, MessageEntityMention):
-        if entity_text.startswith('@'):
-            username = entity_text[1:] if len(entity_text) > 1 else ''
-            if username:
-                return {'open': f'<a href="https://t.me/{username}">', 'close': '</a>'}
-    elif isinstance(entity, MessageEntityHashtag):
-        # Хэштеги не оборачиваем в ссылки
-        return None
-    elif isinstance(entity, MessageEntityStrike):
-        return {'open': '<s>', 'close': '</s>'}
-    elif isinstance(entity, MessageEntityBlockquote):
-        return {'open': '<blockquote>', 'close': '</blockquote>'}
+            # Если entities нет, просто экранируем HTML
+            message_text = html.escape(message_text)
+
+    return IncomingPost(
+        chat_id=meta.chat_id,
+        chat_title=meta.title,
+        chat_type=meta.chat_type,
+        header=meta.header,
+        message_id=message.id,
+        content_type=_content_type(message),
+        text=message_text,
+        original_date=message.date,
+        message=message
+    )
+
+
+def _normalize_album(meta: ChatMeta, messages: list) -> IncomingPost:
+    """Приводит части медиагруппы к одному сообщению для очереди доставки"""
+    # Подпись альбома обычно стоит только у одной из частей
+    captioned = next((message for message in messages if message.message), messages[0])
+    item = _normalize_message(meta, captioned)
 
-    return None
+    first = messages[0]
+    item.message_id = first.id
+    item.original_date = first.date
+    item.message = first
+    item.content_type = 'media_group'
+    item.grouped_id = first.grouped_id
+    # В медиагруппу можно отправить только фото, видео, документы и аудио
+    item.album = [message for message in messages if _content_type(message) in ALBUM_MEDIA_TYPES]
+    return item
 
 
-async def _save_post_to_db(chat, event, content_type, text, file_id=None):
-    """Сохраняет пост в базу данных"""
+async def _enqueue_tracked(meta: ChatMeta, item: IncomingPost, text: Optional[str], media: Tuple[int, ...]) -> bool:
+    """
+    Ставит сообщение в очередь доставки
+
+    Пока сообщение не сохранено (deliver_post), оно держит отметку
+    отсеянных сообщений чата (userbot.watermarks). В индекс копий
+    сообщение попадает, только если очередь его приняла: иначе все
+    его копии тоже были бы отброшены.
+    """
+    watermarks.started(item.chat_id, item.message_id)
+    if not await enqueue(item):
+        await watermarks.finished(item.chat_id, item.message_id)
+        return False
+    duplicates.add(meta.chat_id, meta.title, item.message_id, text, media)
+    return True
+
+
+async def _accept_album(meta: ChatMeta, messages: list) -> bool:
+    """Проверяет собранную медиагруппу и ставит ее в очередь доставки"""
+    # Ключевые слова проверяем по подписи альбома, она есть только у одной из частей
+    caption = next((message.message for message in messages if message.message), None)
+    media = tuple(media_id for message in messages for media_id in _media_ids(message))
+    if not source_filter.message_allowed(caption, 'media_group') or \
+            _is_duplicate(meta, messages[0].id, caption, media):
+        await watermarks.skipped(meta, max(message.id for message in messages))
+        return False
+
+    item = _normalize_album(meta, messages)
+    if not item.album:
+        logger.info(f"В медиагруппе {item.grouped_id} нет частей, которые можно переслать")
+        await watermarks.skipped(meta, max(message.id for message in messages))
+        return False
+    logger.info(f"Собрана медиагруппа {item.grouped_id} из {len(item.album)} частей ({meta.title})")
+    return await _enqueue_tracked(meta, item, caption, media)
+
+
+async def _enqueue_album(meta: ChatMeta, messages: list):
+    """
+    Ставит собранную медиагруппу в очередь доставки
+
+    Части альбома отмечены в userbot.watermarks с момента поступления
+    (ingest_message). Дальше альбом представляет первая часть, остальные
+    отпускаются; если альбом не принят, отпускаются все.
+    """
+    accepted = False
     try:
-        # Сохраняем пост в БД
-        post = await save_post(
-            chat_id=chat.id,
-            chat_title=chat.title,
-            chat_type='channel' if isinstance(chat, Channel) and chat.broadcast else 'group',
-            message_id=event.message.id,
-            content_type=content_type,
-            text=text,
-            file_id=file_id,
-            original_date=event.message.date
-        )
+        accepted = await _accept_album(meta, messages)
+    finally:
+        for message in (messages[1:] if accepted else messages):
+            await watermarks.finished(meta.chat_id, message.id)
 
-        logger.info(f"Пост сохранен в БД с ID: {post.id}")
-        return post
 
-    except Exception as e:
-        logger.error(f"Ошибка при сохранении поста в БД: {e}")
-        logger.exception(f"Полная трассировка ошибки: ")
-        return None
+_albums = AlbumAggregator(_enqueue_album)
+
+
+async def ingest_message(meta: ChatMeta, message) -> bool:
+    """
+    Передает сообщение канала в конвейер доставки.
+
+    Части медиагруппы уходят в сборщик альбомов, остальные сообщения
+    сразу ставятся в очередь, если проходят source_filter и не повторяют
+    недавний пост другого канала (проверки идут по исходному тексту,
+    до рендеринга HTML). Отсеянные сообщения отмечаются в channels,
+    чтобы догрузка не перечитывала их. Используется и обработчиком новых сообщений,
+    и догрузкой пропущенных при старте (userbot.backfill).
+    Возвращает False, если сообщение отсеяно или не принято в очередь.
+    """
+    # Части медиагруппы собираем вместе и отправляем одним постом
+    if getattr(message, 'grouped_id', None):
+        watermarks.started(meta.chat_id, message.id)
+        _albums.add(meta, message)
+        return True
+
+    media = _media_ids(message)
+    if not source_filter.message_allowed(message.message, _content_type(message)) or \
+            _is_duplicate(meta, message.id, message.message, media):
+        # Отсеянные сообщения и копии не сохраняются, догрузка пропустит их по channels.last_message_id
+        await watermarks.skipped(meta, message.id)
+        return False
+
+    return await _enqueue_tracked(meta, _normalize_message(meta, message), message.message, media)
+
+
+async def chat_action_event(event: ChatAction.Event):
+    """Обработчик служебных событий чатов: сбрасывает кэш при смене названия"""
+    if event.new_title:
+        logger.info(f"Чат {event.chat_id} переименован в {event.new_title}")
+        chat_cache.invalidate(event.chat_id)
 
 
 async def channel_event(event: NewMessage.Event):
-    """Обработчик сообщений из каналов и групп"""
+    """
+    Обработчик сообщений из каналов и групп.
+
+    Только нормализует сообщение и ставит его в очередь доставки,
+    отправкой админам и сохранением в БД занимаются воркеры (deliver_post).
+    """
     try:
         # Пропускаем исходящие сообщения (которые мы сами отправили)
         if event.out:
             return
 
-        # Получаем информацию о чате
-        chat = await event.get_chat()
+        # Получаем информацию о чате (из кэша, get_chat только для новых чатов)
+        meta = await chat_cache.resolve(event)
 
-        # Проверяем, что это канал (broadcast) или супергруппа
-        if not isinstance(chat, (Channel, Chat)):
+        # Пересылаем только каналы (broadcast)
+        if not meta.allowed:
             return
 
-        # Проверяем, что это именно канал (broadcast)
-        if isinstance(chat, Channel) and not chat.broadcast:
-            return
+        logger.info(f"Получено сообщение из чата {meta.title} (ID: {meta.chat_id})")
 
-        # Пропускаем медиагруппы
-        grouped_id = getattr(event.message, 'grouped_id', None)
-        if grouped_id:
-            logger.info(f"Пропускаем медиагруппу (grouped_id: {grouped_id})")
-            return
+        await ingest_message(meta, event.message)
+
+    except Exception as e:
+        logger.error(f'Ошибка в обработчике каналов: {e}')
+        logger.exception(f'Полная трассировка ошибки в обработчике каналов: ')
+
+
+# Метод Bot API и имя параметра с файлом для каждого типа медиа
+_MEDIA_METHODS = {
+    'photo': ('send_photo', 'photo'),
+    'video': ('send_video', 'video'),
+    'document': ('send_document', 'document'),
+    'audio': ('send_audio', 'audio'),
+    'voice': ('send_voice', 'voice'),
+}
+
+
+def _media_suffix(message) -> str:
+    """Определяет расширение файла в зависимости от типа медиа"""
+    suffix = '.jpg'
+    if message.video:
+        suffix = '.mp4'
+    elif message.document:
+        if hasattr(message.document, 'attributes'):
+            for attr in message.document.attributes:
+                if hasattr(attr, 'file_name'):
+                    file_name = attr.file_name
+                    suffix = os.path.splitext(file_name)[1] if '.' in file_name else '.bin'
+                    break
+    elif message.audio:
+        suffix = '.mp3'
+    elif message.voice:
+        suffix = '.ogg'
+    return suffix
+
+
+def _sent_file_id(sent_message, content_type: str) -> Optional[str]:
+    """Достает file_id загруженного файла из ответа Bot API"""
+    if not sent_message:
+        return None
+    if content_type == 'photo':
+        return sent_message.photo[-1].file_id if sent_message.photo else None
+    media = getattr(sent_message, content_type, None)
+    return media.file_id if media else None
+
+
+async def deliver_post(item: IncomingPost):
+    """
+    Сохраняет сообщение из очереди в БД (один раз, до рассылки)
+    и отправляет его всем администраторам.
+
+    Доставки записываются в outbox в той же транзакции, что и пост, и после
+    рассылки отмечаются как отправленные или откладываются для повтора
+    (их дорабатывает userbot.outbox, в том числе после перезапуска).
+    Повторно сохраненное сообщение админам, которые его уже получали, не отправляется.
+    Результат записывается в outbox, даже если рассылка прервалась: админы,
+    до которых пост не дошел, получают ошибку и попадают в повтор.
+    """
+    post, claims = await _save_post_to_db(item)
+    await watermarks.finished(item.chat_id, item.message_id)
+    if not claims:
+        logger.info(f"Пост {item.chat_id}/{item.message_id} уже доставлялся админам, пропускаем")
+        return
+
+    run = _Fanout(post.id if post else None, claims)
+    try:
+        await _fan_out(item, post, run)
+    finally:
+        if post:
+            await complete_deliveries(post.id, claims, run.errors)
 
-        logger.info(f"Получено сообщение из чата {chat.title} (ID: {chat.id}, тип: {type(chat).__name__})")
 
-        # Формируем текст сообщения с информацией о чате
-        if isinstance(chat, Channel) and chat.broadcast:
-            chat_type = "📢 Канал"
+async def redeliver_post(post_id: int, claims: Dict[int, int]) -> Dict[int, str]:
+    """
+    Повторно отправляет сохраненный пост по захватам доставок claims
+    (admin_id -> attempts, для outbox).
+
+    Уже загруженные в Telegram файлы отправляются по file_id, если файла
+    еще нет, исходное сообщение заново получается через Telethon.
+    Возвращает ошибки по админам.
+    """
+    post = await get_post_by_id(post_id)
+    if post is None:
+        return {admin_id: "Пост не найден" for admin_id in claims}
+
+    item = IncomingPost(
+        chat_id=post.chat_id,
+        chat_title=post.chat_title,
+        chat_type=post.chat_type,
+        header=chat_cache.build_header(post.chat_title, post.chat_type == 'channel'),
+        message_id=post.message_id,
+        content_type=post.content_type,
+        text=post.text or "",
+        original_date=post.original_date,
+        grouped_id=post.grouped_id,
+        file_id=post.file_id,
+        media=post.media
+    )
+
+    uploaded = item.media if item.content_type == 'media_group' else item.file_id
+    if item.content_type != 'text' and not uploaded:
+        try:
+            await _load_source_messages(item)
+        except Exception as e:
+            logger.error(f"Не удалось получить исходное сообщение поста {post_id}: {e}")
+            return {admin_id: f"Не удалось получить исходное сообщение: {e}" for admin_id in claims}
+
+    return await _fan_out(item, post, _Fanout(post_id, claims))
+
+
+async def _load_source_messages(item: IncomingPost):
+    """Заново получает сообщение (или части медиагруппы) из канала через Telethon"""
+    if not _client or not _client.is_connected():
+        raise RuntimeError("Telethon не подключен")
+
+    peer = chat_cache.peer(item.chat_id, item.chat_type)
+    if item.content_type == 'media_group':
+        # Части альбома идут подряд, начиная с первой (ее message_id хранится в посте)
+        ids = list(range(item.message_id, item.message_id + ALBUM_MAX_PARTS))
+        messages = await _client.get_messages(peer, ids=ids)
+        item.album = [
+            message for message in messages
+            if message and message.grouped_id == item.grouped_id and _content_type(message) in ALBUM_MEDIA_TYPES
+        ]
+        if not item.album:
+            raise RuntimeError("части медиагруппы не найдены")
+    else:
+        item.message = await _client.get_messages(peer, ids=item.message_id)
+        if item.message is None or not item.message.media:
+            raise RuntimeError("сообщение с медиа не найдено")
+
+
+# Ошибка доставки для админов, до отправки которым рассылка не дошла
+_NOT_SENT = "Рассылка прервана до отправки"
+
+# Ошибка доставки, захват которой истек и которую забрал другой обработчик outbox
+_CLAIM_LOST = "Доставку забрал другой обработчик"
+
+
+@dataclass
+class _Fanout:
+    """
+    Рассылка одного поста админам
+
+    claims - захваты доставок в outbox: admin_id -> attempts (None - без
+    outbox, если пост не удалось сохранить). errors - ошибки по админам:
+    пока отправка не удалась, пост считается не доставленным (_NOT_SENT),
+    успешная отправка убирает админа из errors (_attempt), поэтому при
+    неожиданной ошибке рассылки все, кому пост не отправлен, остаются в errors.
+    """
+    post_id: Optional[int]
+    claims: Dict[int, Optional[int]]
+    errors: Dict[int, str] = field(init=False)
+
+    def __post_init__(self):
+        self.errors = {admin_id: _NOT_SENT for admin_id in self.claims}
+
+
+async def _fan_out(item: IncomingPost, post, run: _Fanout) -> Dict[int, str]:
+    """
+    Отправляет пост админам из run.claims, возвращает ошибки по админам.
+
+    Отправка админам идет параллельно, темп отправки ограничивает шлюз
+    Bot API (rate_limiter.gateway), поэтому число админов не задерживает
+    первую доставку.
+    Медиа скачивается и загружается в Telegram один раз (_relay_media, _relay_album).
+    """
+    # Создаем клавиатуру для поста с post_id
+    keyboard = _create_post_keyboard(post.id) if post else None
+
+    try:
+        if item.content_type == 'text':
+            logger.info(f'Отправляем текст пост админам')
+            await asyncio.gather(*(
+                _attempt(run, admin_id, _deliver_to_admin, item, admin_id, keyboard) for admin_id in run.claims
+            ))
+        elif item.content_type == 'media_group':
+            logger.info(f'Это медиагруппа')
+            await _relay_album(item, post, keyboard, run)
         else:
-            chat_type = "👥 Группа"
-
-        # Экранируем название чата
-        chat_title_escaped = html.escape(chat.title)
-        text_chanel = f"{chat_type}: <b>{chat_title_escaped}</b>\n\n"
-
-        # Получаем текст сообщения с сохранением форматирования
-        message_text = ""
-        if event.message.message:
-            message_text = event.message.message
-
-            # Применяем HTML разметку на основе entities
-            if hasattr(event.message, 'entities') and event.message.entities:
-                try:
-                    message_text = _apply_entities_to_html(message_text, event.message.entities)
-                except Exception as e:
-                    logger.error(f"Ошибка при применении HTML разметки: {e}")
-                    # В случае ошибки просто экранируем текст
-                    message_text = html.escape(message_text)
-            else:
-                # Если entities нет, просто экранируем HTML
-                message_text = html.escape(message_text)
+            logger.info(f'Это медиа пост')
+            await _relay_media(item, post, keyboard, run)
+    except Exception as e:
+        logger.error(f"Ошибка при рассылке поста {item.chat_id}/{item.message_id}: {e}")
+        logger.exception(f"Полная трассировка ошибки: ")
+        for admin_id, error in run.errors.items():
+            if error == _NOT_SENT:
+                run.errors[admin_id] = f"{_NOT_SENT}: {e}"
+
+    return run.errors
+
+
+async def _save_file_id(post, file_id: str, media: list = None):
+    """
+    Записывает file_id загруженного медиа в пост
+
+    Ошибка записи (например, занятая база) только логируется: остальным
+    админам пост все равно отправляется по file_id, а без него повторная
+    доставка просто скачает медиа заново.
+    """
+    if not post:
+        return
+    try:
+        await update_post_file_id(post.id, file_id, media=media)
+    except Exception as e:
+        logger.error(f"Не удалось сохранить file_id поста {post.id}: {e}")
+
+
+async def _renew_claim(run: _Fanout, admin_id: int) -> bool:
+    """
+    Продлевает захват доставки админу перед отправкой (db.outbox.renew_claim)
+
+    Возвращает False, если доставку уже забрал другой обработчик outbox.
+    Если БД недоступна, отправка идет по старому захвату: без БД его никто
+    другой забрать не сможет.
+    """
+    attempts = run.claims.get(admin_id)
+    if run.post_id is None or attempts is None:
+        return True
+    try:
+        return await renew_claim(run.post_id, admin_id, attempts)
+    except Exception as e:
+        logger.error(f"Не удалось продлить захват доставки поста {run.post_id} админу {admin_id}: {e}")
+        return True
+
+
+async def _attempt(run: _Fanout, admin_id: int, send: Callable[..., Awaitable[Any]], *args) -> Any:
+    """
+    Вызывает отправку одному админу и возвращает ее результат
+
+    Перед отправкой продлевается захват доставки в outbox: если захват истек
+    и доставку забрал другой обработчик, пост не отправляется (иначе админ
+    получил бы его дважды). При успехе админ убирается из run.errors,
+    при ошибке она записывается в run.errors, а результатом будет None.
+    """
+    if not await _renew_claim(run, admin_id):
+        logger.warning(f"Доставку поста {run.post_id} админу {admin_id} забрал другой обработчик, пропускаем")
+        run.errors[admin_id] = _CLAIM_LOST
+        return None
 
-        # Определяем тип контента
-        content_type = 'text'
-        if event.message.media:
-            if event.message.photo:
-                content_type = 'photo'
-            elif event.message.video:
-                content_type = 'video'
-            elif event.message.document:
-                content_type = 'document'
-            elif event.message.audio:
-                content_type = 'audio'
-            elif event.message.voice:
-                content_type = 'voice'
-
-        # Отправляем администраторам и сохраняем в БД
-        for admin_id in ADMIN_IDS:
+    try:
+        result = await send(*args)
+        run.errors.pop(admin_id, None)
+        return result
+    except Exception as e:
+        run.errors[admin_id] = str(e) or type(e).__name__
+        logger.error(f"Ошибка при отправке сообщения администратору {admin_id}: {e}")
+        logger.exception(f"Полная трассировка ошибки: ")
+        return None
+
+
+async def _download_media(message, content_type: str, temp_paths: List[str]) -> InputFile:
+    """
+    Скачивает медиа сообщения для загрузки в Bot API.
+
+    Файлы до MEDIA_MEMORY_LIMIT байт держатся в памяти, более крупные
+    пишутся во временный файл, путь к которому добавляется в temp_paths.
+    """
+    suffix = _media_suffix(message)
+    size = message.file.size if message.file else None
+
+    if size is not None and size <= MEDIA_MEMORY_LIMIT:
+        # Скачиваем медиа в память
+        data = await message.download_media(file=bytes)
+        file_name = (message.file.name if message.file else None) or f"{content_type}{suffix}"
+        return BufferedInputFile(data, filename=file_name)
+
+    # Создаем временный файл для медиа
+    with tempfile.NamedTemporaryFile(delete=False, suffix=suffix) as tmp_file:
+        file_path = tmp_file.name
+    temp_paths.append(file_path)
+
+    # Скачиваем медиа
+    await message.download_media(file=file_path)
+    return FSInputFile(file_path)
+
+
+def _remove_temp_files(temp_paths: List[str]):
+    """Удаляет временные файлы медиа"""
+    for file_path in temp_paths:
+        if os.path.exists(file_path):
+            os.unlink(file_path)
+
+
+async def _relay_media(item: IncomingPost, post, keyboard: Optional[InlineKeyboardMarkup],
+                       run: _Fanout):
+    """
+    Рассылает медиа пост админам с одной загрузкой файла.
+
+    Файл скачивается из Telethon один раз и загружается первому админу,
+    остальным админам пост отправляется по полученному file_id.
+    Временный файл (если он понадобился) живет до первой успешной загрузки.
+    Если файл уже загружен (item.file_id), он сразу отправляется всем.
+    """
+    pending = list(run.claims)
+    telegram_file_id = item.file_id
+
+    if telegram_file_id is None:
+        temp_paths: List[str] = []
+        try:
             try:
-                await bot.send_message(admin_id, text_chanel, parse_mode=ParseMode.HTML)
-
-                telegram_file_id = None
-
-                # Если есть медиа
-                if content_type != 'text':
-                    logger.info(f'Это медиа пост')
-
-                    # Определяем расширение файла в зависимости от типа медиа
-                    suffix = '.jpg'
-                    if event.message.video:
-                        suffix = '.mp4'
-                    elif event.message.document:
-                        if hasattr(event.message.document, 'attributes'):
-                            for attr in event.message.document.attributes:
-                                if hasattr(attr, 'file_name'):
-                                    file_name = attr.file_name
-                                    suffix = os.path.splitext(file_name)[1] if '.' in file_name else '.bin'
-                                    break
-                    elif event.message.audio:
-                        suffix = '.mp3'
-                    elif event.message.voice:
-                        suffix = '.ogg'
-
-                    # Создаем временный файл для медиа
-                    with tempfile.NamedTemporaryFile(delete=False, suffix=suffix) as tmp_file:
-                        file_path = tmp_file.name
-
-                    try:
-                        # Скачиваем медиа
-                        await event.message.download_media(file=file_path)
-
-                        # Используем FSInputFile для отправки файла по пути
-                        media_file = FSInputFile(file_path)
-
-                        # Сохраняем пост в БД и получаем его ID
-                        post = await _save_post_to_db(
-                            chat, event, content_type, message_text
-                        )
-
-                        # Создаем клавиатуру для поста с post_id
-                        keyboard = _create_post_keyboard(post.id) if post else None
-                        telegram_file_id = sent_message = None
-                        if event.message.photo:
-                            try:
-                                logger.info(f'Отправляем фото пост админам')
-                                sent_message = await bot.send_photo(
-                                    chat_id=admin_id,
-                                    photo=media_file,
-                                    caption=message_text,
-                                    parse_mode=ParseMode.HTML,
-                                    reply_markup=keyboard
-                                )
-                            except Exception as photo_error:
-                                logger.warning(f"Не удалось отправить фото с HTML-подписью: {photo_error}")
-                                sent_message = await bot.send_photo(
-                                    chat_id=admin_id,
-                                    photo=media_file,
-                                    caption=html.escape(message_text),
-                                    parse_mode=None,
-                                    reply_markup=keyboard
-                                )
-
-                            if sent_message and sent_message.photo:
-                                telegram_file_id = sent_message.photo[-1].file_id
-
-                        elif event.message.video:
-                            logger.info(f'Отправляем видео пост админам')
-                            sent_message = await bot.send_video(
-                                chat_id=admin_id,
-                                video=media_file,
-                                caption=message_text,
-                                parse_mode=ParseMode.HTML,
-                                reply_markup=keyboard
-                            )
-                            if sent_message and sent_message.video:
-                                telegram_file_id = sent_message.video.file_id
-
-                        elif event.message.document:
-                            logger.info(f'Отправляем документ пост админам')
-                            sent_message = await bot.send_document(
-                                chat_id=admin_id,
-                                document=media_file,
-                                caption=message_text,
-                                parse_mode=ParseMode.HTML,
-                                reply_markup=keyboard
-                            )
-                            if sent_message and sent_message.document:
-                                telegram_file_id = sent_message.document.file_id
-
-                        elif event.message.audio:
-                            logger.info(f'Отправляем фудио пост админам')
-                            sent_message = await bot.send_audio(
-                                chat_id=admin_id,
-                                audio=media_file,
-                                caption=message_text,
-                                parse_mode=ParseMode.HTML,
-                                reply_markup=keyboard
-                            )
-                            if sent_message and sent_message.audio:
-                                telegram_file_id = sent_message.audio.file_id
-
-                        elif event.message.voice:
-                            logger.info(f'Отправляем войс пост админам')
-                            sent_message = await bot.send_voice(
-                                chat_id=admin_id,
-                                voice=media_file,
-                                caption=message_text,
-                                parse_mode=ParseMode.HTML,
-                                reply_markup=keyboard
-                            )
-                            if sent_message and sent_message.voice:
-                                telegram_file_id = sent_message.voice.file_id
-                        post = await _save_post_to_db(
-                            chat, event, content_type, message_text, file_id=telegram_file_id
-                        )
-
-                    finally:
-                        # Удаляем временный файл
-                        if os.path.exists(file_path):
-                            os.unlink(file_path)
-
-                else:
-                    logger.info(f'Отправляем текст пост админам')
-                    # Сохраняем пост в БД и получаем его ID
-                    post = await _save_post_to_db(chat, event, content_type, message_text)
-
-                    # Отправляем только текст с клавиатурой
-                    keyboard = _create_post_keyboard(post.id) if post else None
-
-                    sent_message = await bot.send_message(
-                        chat_id=admin_id,
-                        text=message_text,
-                        parse_mode=ParseMode.HTML,
-                        reply_markup=keyboard
-                    )
-
-                await asyncio.sleep(0.3)
+                input_file = await _download_media(item.message, item.content_type, temp_paths)
+            except Exception as e:
+                logger.error(f"Ошибка при скачивании медиа {item.chat_id}/{item.message_id}: {e}")
+                run.errors.update({admin_id: f"Не удалось скачать медиа: {e}" for admin_id in pending})
+                return
+
+            # Загружаем файл, пока какой-нибудь админ его не примет
+            while pending and telegram_file_id is None:
+                admin_id = pending.pop(0)
+                telegram_file_id = await _attempt(run, admin_id, _deliver_to_admin, item, admin_id, keyboard,
+                                                  input_file)
+        finally:
+            _remove_temp_files(temp_paths)
+
+        if telegram_file_id is None:
+            return
+
+        await _save_file_id(post, telegram_file_id)
 
+    # Остальным админам отправляем уже загруженный файл
+    await asyncio.gather(*(
+        _attempt(run, admin_id, _deliver_to_admin, item, admin_id, keyboard, telegram_file_id)
+        for admin_id in pending
+    ))
+
+
+async def _relay_album(item: IncomingPost, post, keyboard: Optional[InlineKeyboardMarkup],
+                       run: _Fanout):
+    """
+    Рассылает медиагруппу админам с одной загрузкой каждой части.
+
+    Части скачиваются один раз и загружаются первому админу одним
+    send_media_group, остальным админам альбом отправляется по file_id.
+    Если части уже загружены (item.media), альбом сразу отправляется всем.
+    """
+    pending = list(run.claims)
+    media = item.media
+
+    if media is None:
+        temp_paths: List[str] = []
+        try:
+            parts = []
+            try:
+                for message in item.album:
+                    content_type = _content_type(message)
+                    parts.append((content_type, await _download_media(message, content_type, temp_paths)))
             except Exception as e:
-                logger.error(f"Ошибка при отправке сообщения администратору {admin_id}: {e}")
-                logger.exception(f"Полная трассировка ошибки: ")
+                logger.error(f"Ошибка при скачивании медиагруппы {item.grouped_id}: {e}")
+                run.errors.update({admin_id: f"Не удалось скачать медиагруппу: {e}" for admin_id in pending})
+                return
+
+            # Загружаем альбом, пока какой-нибудь админ его не примет
+            while pending and media is None:
+                admin_id = pending.pop(0)
+                media = await _attempt(run, admin_id, _deliver_album_to_admin, item, admin_id, keyboard, parts)
+        finally:
+            _remove_temp_files(temp_paths)
+
+        if media is None:
+            return
+
+        await _save_file_id(post, media[0]["file_id"], media=media)
+
+    # Остальным админам отправляем уже загруженные файлы
+    uploaded = [(part["type"], part["file_id"]) for part in media]
+    await asyncio.gather(*(
+        _attempt(run, admin_id, _deliver_album_to_admin, item, admin_id, keyboard, uploaded)
+        for admin_id in pending
+    ))
+
+
+async def _deliver_album_to_admin(item: IncomingPost, admin_id: int, keyboard: Optional[InlineKeyboardMarkup],
+                                  parts: list) -> Optional[List[dict]]:
+    """
+    Отправляет медиагруппу одному администратору.
+
+    У медиагруппы не может быть клавиатуры, поэтому текст поста с кнопками
+    отправляется отдельным сообщением после альбома.
+    Возвращает состав альбома с file_id загруженных файлов,
+    при ошибке отправки альбома выбрасывает исключение.
+    """
+    await bot.send_message(admin_id, item.header, parse_mode=ParseMode.HTML)
 
+    sent_messages = await bot.send_media_group(
+        chat_id=admin_id,
+        media=build_album(parts)
+    )
+    media = [
+        {"type": content_type, "file_id": _sent_file_id(sent_message, content_type)}
+        for (content_type, _), sent_message in zip(parts, sent_messages)
+    ]
+
+    try:
+        await bot.send_message(
+            chat_id=admin_id,
+            text=item.text or "🖼 Медиагруппа без подписи",
+            parse_mode=ParseMode.HTML,
+            reply_markup=keyboard
+        )
     except Exception as e:
-        logger.error(f'Ошибка в обработчике каналов: {e}')
-        logger.exception(f'Полная трассировка ошибки в обработчике каналов: ')
-        if _client and not _client.is_connected():
-            logger.info(f'Tg client был отключен. Пытаемся переподключить')
-            try:
-                await _client.connect()
-            except Exception as reconnect_error:
-                logger.error(f'Ошибка переподключения: {reconnect_error}')
+        logger.error(f"Ошибка при отправке подписи медиагруппы администратору {admin_id}: {e}")
+
+    return media
+
+
+async def _deliver_to_admin(item: IncomingPost, admin_id: int, keyboard: Optional[InlineKeyboardMarkup],
+                            media=None) -> Optional[str]:
+    """
+    Отправляет сообщение одному администратору.
+
+    media - файл (InputFile) или file_id для медиа постов.
+    Возвращает file_id отправленного медиа, если он есть,
+    при ошибке отправки выбрасывает исключение.
+    """
+    await bot.send_message(admin_id, item.header, parse_mode=ParseMode.HTML)
+
+    if item.content_type == 'text':
+        # Отправляем только текст с клавиатурой
+        await bot.send_message(
+            chat_id=admin_id,
+            text=item.text,
+            parse_mode=ParseMode.HTML,
+            reply_markup=keyboard
+        )
+        return None
+
+    method_name, media_field = _MEDIA_METHODS[item.content_type]
+    method = getattr(bot, method_name)
+    try:
+        sent_message = await method(
+            chat_id=admin_id,
+            caption=item.text,
+            parse_mode=ParseMode.HTML,
+            reply_markup=keyboard,
+            **{media_field: media}
+        )
+    except TelegramBadRequest as caption_error:
+        logger.warning(f"Не удалось отправить {item.content_type} с HTML-подписью: {caption_error}")
+        sent_message = await method(
+            chat_id=admin_id,
+            caption=html.escape(item.text),
+            parse_mode=None,
+            reply_markup=keyboard,
+            **{media_field: media}
+        )
+
+    return _sent_file_id(sent_message, item.content_type)
@@ -0,0 +1,111 @@
+import asyncio
+import time
+from typing import Any, Awaitable, Callable, Dict, List, Optional, Set, Tuple
+
+from aiogram.types import InputMediaAudio, InputMediaDocument, InputMediaPhoto, InputMediaVideo
+
+from config import ALBUM_QUIET_PERIOD, ALBUM_MAX_AGE, ALBUM_MAX_GROUPS
+from logger import logger
+
+# Максимальное число элементов в медиагруппе Telegram
+ALBUM_MAX_PARTS = 10
+
+# Максимальная длина подписи медиа в Telegram (символов после разбора разметки)
+CAPTION_MAX_LENGTH = 1024
+
+# Класс InputMedia для каждого типа контента, допустимого в медиагруппе
+ALBUM_MEDIA_TYPES = {
+    'photo': InputMediaPhoto,
+    'video': InputMediaVideo,
+    'document': InputMediaDocument,
+    'audio': InputMediaAudio,
+}
+
+
+def build_album(parts: List[Tuple[str, Any]], caption: Optional[str] = None) -> list:
+    """
+    Собирает список InputMedia для send_media_group.
+
+    parts - пары (тип контента, файл или file_id), caption ставится на первый элемент
+    и размечается режимом парсинга бота по умолчанию.
+    """
+    media = []
+    for index, (content_type, file) in enumerate(parts):
+        input_media = ALBUM_MEDIA_TYPES[content_type]
+        if index == 0 and caption:
+            media.append(input_media(media=file, caption=caption))
+        else:
+            media.append(input_media(media=file))
+    return media
+
+
+class AlbumAggregator:
+    """
+    Собирает части медиагрупп по grouped_id.
+
+    Группа отдается в on_flush, когда после последней части прошло
+    quiet_period секунд, набралось ALBUM_MAX_PARTS частей или с первой части
+    прошло max_age секунд. В памяти хранится не больше max_groups групп:
+    при переполнении самая старая группа отдается досрочно.
+    """
+
+    def __init__(self, on_flush: Callable[[Any, List[Any]], Awaitable[None]],
+                 quiet_period: float = ALBUM_QUIET_PERIOD,
+                 max_age: float = ALBUM_MAX_AGE,
+                 max_groups: int = ALBUM_MAX_GROUPS):
+        self._on_flush = on_flush
+        self.quiet_period = quiet_period
+        self.max_age = max_age
+        self.max_groups = max_groups
+        self._groups: Dict[int, Dict] = {}
+        self._tasks: Set[asyncio.Task] = set()
+
+    def add(self, chat, message):
+        """Добавляет часть медиагруппы"""
+        grouped_id = message.grouped_id
+        group = self._groups.get(grouped_id)
+
+        if group is None:
+            if len(self._groups) >= self.max_groups:
+                oldest = min(self._groups, key=lambda key: self._groups[key]["started"])
+                logger.warning(f"Слишком много незавершенных медиагрупп, отправляем {oldest} досрочно")
+                self._flush(oldest)
+            group = {"chat": chat, "messages": {}, "started": time.monotonic(), "timer": None}
+            self._groups[grouped_id] = group
+
+        # Одна и та же часть может прийти повторно (например, при догрузке пропущенных)
+        group["messages"][message.id] = message
+
+        if group["timer"]:
+            group["timer"].cancel()
+
+        if len(group["messages"]) >= ALBUM_MAX_PARTS:
+            self._flush(grouped_id)
+            return
+
+        remaining = group["started"] + self.max_age - time.monotonic()
+        delay = max(0.0, min(self.quiet_period, remaining))
+        group["timer"] = asyncio.get_running_loop().call_later(delay, self._flush, grouped_id)
+
+    def _flush(self, grouped_id: int):
+        group = self._groups.pop(grouped_id, None)
+        if group is None:
+            return
+        if group["timer"]:
+            group["timer"].cancel()
+
+        messages = [group["messages"][key] for key in sorted(group["messages"])]
+        task = asyncio.create_task(self._run_flush(grouped_id, group["chat"], messages))
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+
+    async def _run_flush(self, grouped_id: int, chat, messages: List[Any]):
+        try:
+            await self._on_flush(chat, messages)
+        except Exception as e:
+            logger.error(f"Ошибка при обработке медиагруппы {grouped_id}: {e}")
+            logger.exception(f"Полная трассировка ошибки: ")
+
+    def pending(self) -> int:
+        """Количество собираемых сейчас медиагрупп"""
+        return len(self._groups)
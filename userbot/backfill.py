@@ -0,0 +1,114 @@
+import asyncio
+from datetime import datetime, timezone
+
+from telethon import utils
+
+from config import BACKFILL_LIMIT, BACKFILL_SCAN_LIMIT, BACKFILL_BATCH_SIZE, BACKFILL_CONCURRENCY, BACKFILL_RATE
+from db.posts import get_last_message_ids
+from logger import logger
+from rate_limiter import TokenBucket
+from userbot import chat_cache
+from userbot.TGClient import client, ingest_message
+
+# Не даем запустить две догрузки одновременно (старт и переподключение)
+_lock = asyncio.Lock()
+
+
+async def _backfill_chat(tg_client, row, started_at: datetime, pace: TokenBucket) -> int:
+    """
+    Догружает пропущенные сообщения одного чата начиная с последнего
+    сохраненного или отсеянного message_id. Возвращает число поставленных
+    в очередь сообщений.
+
+    В очередь ставится не больше BACKFILL_LIMIT сообщений, а просматривается
+    не больше BACKFILL_SCAN_LIMIT: иначе чат, где все отсеивается фильтром
+    или оказывается копиями, просматривался бы до конца пропуска и держал
+    место в семафоре догрузки. Отсеянные сообщения отмечаются
+    (watermarks.skipped), поэтому следующая догрузка продолжит с них.
+    """
+    peer = chat_cache.peer(row.chat_id, row.chat_type)
+    entity = await tg_client.get_entity(peer)
+
+    meta = chat_cache.build_meta(entity)
+    chat_cache.put(utils.get_peer_id(peer), meta)
+    if not meta.allowed:
+        return 0
+
+    cursor = row.message_id
+    count = 0
+    scanned = 0
+    while count < BACKFILL_LIMIT and scanned < BACKFILL_SCAN_LIMIT:
+        batch_size = min(BACKFILL_BATCH_SIZE, BACKFILL_LIMIT - count, BACKFILL_SCAN_LIMIT - scanned)
+        batch = [
+            message async for message in
+            tg_client.iter_messages(entity, min_id=cursor, reverse=True, limit=batch_size)
+        ]
+        if not batch:
+            break
+        scanned += len(batch)
+
+        for message in batch:
+            # Все, что пришло после старта догрузки, доставит обработчик новых сообщений
+            if message.date and message.date >= started_at:
+                return count
+            # Служебные сообщения и остаток уже сохраненной медиагруппы пропускаем
+            if getattr(message, 'action', None) or message.out:
+                continue
+            if row.grouped_id and message.grouped_id == row.grouped_id:
+                continue
+
+            await pace.acquire()
+            if await ingest_message(meta, message):
+                count += 1
+
+        cursor = batch[-1].id
+        if len(batch) < batch_size:
+            break
+    else:
+        if scanned >= BACKFILL_SCAN_LIMIT:
+            logger.info(f"Догрузка чата {row.chat_id} остановлена: просмотрено {scanned} сообщений, "
+                        f"поставлено в очередь {count}")
+
+    return count
+
+
+async def run_backfill(tg_client=None) -> int:
+    """
+    Догружает сообщения, опубликованные в каналах, пока бот был выключен.
+
+    Для каждого чата берется последний сохраненный или отсеянный фильтром
+    (либо признанный копией) message_id, см. get_last_message_ids, пропуск выбирается через iter_messages пачками, одновременно
+    обрабатывается не больше BACKFILL_CONCURRENCY чатов. Сообщения идут в
+    тот же конвейер, что и новые, не чаще BACKFILL_RATE в секунду.
+    """
+    tg_client = tg_client or client()
+    if BACKFILL_LIMIT <= 0 or not tg_client or not tg_client.is_connected():
+        return 0
+
+    if _lock.locked():
+        logger.info("Догрузка пропущенных сообщений уже выполняется")
+        return 0
+
+    async with _lock:
+        started_at = datetime.now(timezone.utc)
+        rows = await get_last_message_ids()
+        if not rows:
+            return 0
+
+        logger.info(f"Догрузка пропущенных сообщений для {len(rows)} чатов")
+        semaphore = asyncio.Semaphore(BACKFILL_CONCURRENCY)
+        pace = TokenBucket(BACKFILL_RATE, BACKFILL_RATE)
+
+        async def backfill_one(row) -> int:
+            async with semaphore:
+                try:
+                    return await _backfill_chat(tg_client, row, started_at, pace)
+                except Exception as e:
+                    logger.error(f"Ошибка догрузки сообщений чата {row.chat_id}: {e}")
+                    logger.exception(f"Полная трассировка ошибки: ")
+                    return 0
+
+        counts = await asyncio.gather(*(backfill_one(row) for row in rows))
+        total = sum(counts)
+        logger.info(f"Догрузка завершена, поставлено в очередь сообщений: {total}")
+        return total
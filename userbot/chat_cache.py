@@ -0,0 +1,89 @@
+import html
+from collections import OrderedDict
+from dataclasses import dataclass
+from typing import Optional
+
+from telethon.types import Channel, Chat, PeerChannel, PeerChat
+
+from config import CHAT_CACHE_SIZE
+from userbot.filters import source_filter
+
+
+@dataclass
+class ChatMeta:
+    """Данные чата, которые нужны для обработки каждого сообщения"""
+    chat_id: int  # ID чата без префикса -100 (как в chat.id)
+    title: str
+    broadcast: bool  # Канал (broadcast), а не группа
+    chat_type: str  # 'channel' или 'group'
+    header: str  # Заголовок для админов с экранированным названием (HTML)
+    allowed: bool  # Пересылать ли сообщения из этого чата
+
+
+# Кэш по event.chat_id (с префиксом -100 для каналов), вытеснение по LRU
+_cache: "OrderedDict[int, ChatMeta]" = OrderedDict()
+
+
+def build_header(title: str, broadcast: bool) -> str:
+    """Заголовок поста для админов с экранированным названием чата (HTML)"""
+    chat_type = "📢 Канал" if broadcast else "👥 Группа"
+    return f"{chat_type}: <b>{html.escape(title)}</b>\n\n"
+
+
+def peer(chat_id: int, chat_type: str):
+    """Peer чата по chat_id без префикса -100 и типу из таблицы posts"""
+    return PeerChannel(chat_id) if chat_type == 'channel' else PeerChat(chat_id)
+
+
+def build_meta(chat) -> ChatMeta:
+    """Вычисляет метаданные чата по сущности Telethon"""
+    broadcast = isinstance(chat, Channel) and bool(chat.broadcast)
+    title = getattr(chat, 'title', None) or ''
+
+    # Пересылаем только каналы (broadcast): супергруппы, личные чаты и боты пропускаем
+    allowed = isinstance(chat, (Channel, Chat)) and not (isinstance(chat, Channel) and not broadcast)
+    # Списки разрешенных и запрещенных чатов проверяем один раз, результат живет в кэше
+    allowed = allowed and source_filter.chat_allowed(chat.id)
+
+    return ChatMeta(
+        chat_id=chat.id,
+        title=title,
+        broadcast=broadcast,
+        chat_type='channel' if broadcast else 'group',
+        header=build_header(title, broadcast),
+        allowed=allowed,
+    )
+
+
+def get(chat_id: int) -> Optional[ChatMeta]:
+    """Возвращает метаданные чата из кэша"""
+    meta = _cache.get(chat_id)
+    if meta is not None:
+        _cache.move_to_end(chat_id)
+    return meta
+
+
+def put(chat_id: int, meta: ChatMeta):
+    """Кладет метаданные чата в кэш"""
+    _cache[chat_id] = meta
+    _cache.move_to_end(chat_id)
+    while len(_cache) > CHAT_CACHE_SIZE:
+        _cache.popitem(last=False)
+
+
+def invalidate(chat_id: int):
+    """Удаляет чат из кэша (например, после смены названия)"""
+    _cache.pop(chat_id, None)
+
+
+async def resolve(event) -> ChatMeta:
+    """
+    Возвращает метаданные чата события.
+
+    get_chat вызывается только для чатов, которых еще нет в кэше.
+    """
+    meta = get(event.chat_id)
+    if meta is None:
+        meta = build_meta(await event.get_chat())
+        put(event.chat_id, meta)
+    return meta
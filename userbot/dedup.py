@@ -0,0 +1,201 @@
+import hashlib
+import re
+import time
+from collections import OrderedDict
+from dataclasses import dataclass, field
+from typing import Dict, Iterable, List, Optional, Set, Tuple
+
+from config import DEDUP_WINDOW, DEDUP_MAX_ENTRIES, DEDUP_MAX_DISTANCE, DEDUP_MIN_WORDS
+
+_BITS = 64
+
+# Ссылки и упоминания обычно у каждого канала свои, в отпечаток их не берем
+_NOISE_RE = re.compile(r'https?://\S+|t\.me/\S+|@\w+')
+_WORD_RE = re.compile(r'\w+')
+
+
+def _shingles(text: str) -> Set[str]:
+    """
+    Признаки текста для SimHash: тройки символов нормализованного текста
+    (нижний регистр, без ссылок, упоминаний и пунктуации).
+
+    Посты короткие, и на словах отпечаток слишком сильно меняется от одного
+    добавленного слова, а символьные n-граммы сглаживают такие правки.
+    """
+    normalized = ' '.join(_WORD_RE.findall(_NOISE_RE.sub(' ', text.lower())))
+    return {normalized[index:index + 3] for index in range(len(normalized) - 2)}
+
+
+def simhash(features: Iterable[str]) -> int:
+    """
+    64-битный SimHash: у похожих текстов отпечатки отличаются в небольшом числе бит.
+
+    Вместо 64 счетчиков на каждый признак считаем, сколько раз встретилось
+    каждое значение каждого байта хэша, и раскладываем по битам в конце.
+    """
+    counts = [[0] * 256 for _ in range(_BITS // 8)]
+    total = 0
+    for feature in features:
+        # hash() для строк меняется между запусками, blake2b - нет
+        digest = hashlib.blake2b(feature.encode(), digest_size=8).digest()
+        for position, byte in enumerate(digest):
+            counts[position][byte] += 1
+        total += 1
+
+    result = 0
+    for position, column in enumerate(counts):
+        weights = [0] * 8
+        for byte, count in enumerate(column):
+            if count:
+                for bit in range(8):
+                    if byte >> bit & 1:
+                        weights[bit] += count
+        for bit, ones in enumerate(weights):
+            if ones * 2 > total:
+                result |= 1 << (position * 8 + bit)
+    return result
+
+
+@dataclass
+class _Entry:
+    chat_id: int
+    chat_title: str
+    message_id: int
+    added: float
+    fingerprint: Optional[int]
+    media: Tuple[int, ...]
+    also_in: List[str] = field(default_factory=list)  # Каналы, из которых пришли копии
+
+
+class DuplicateIndex:
+    """
+    Скользящий индекс недавних постов для поиска почти одинаковых копий.
+
+    Текст сравнивается по SimHash: отпечаток делится на max_distance + 1
+    полос, и по принципу Дирихле у отпечатков, отличающихся не больше чем
+    в max_distance битах, хотя бы одна полоса совпадает точно. Поэтому поиск -
+    это несколько обращений к словарю полос и проверка немногих кандидатов.
+    Медиа сравнивается по ID файла Telegram. В индексе не больше max_entries
+    постов не старше window секунд.
+    """
+
+    def __init__(self, window: float = DEDUP_WINDOW, max_entries: int = DEDUP_MAX_ENTRIES,
+                 max_distance: int = DEDUP_MAX_DISTANCE, min_words: int = DEDUP_MIN_WORDS):
+        self.window = window
+        self.max_entries = max_entries
+        self.max_distance = max(0, min(max_distance, 7))
+        self.min_words = min_words
+        self._entries: "OrderedDict[int, _Entry]" = OrderedDict()
+        self._bands: Dict[Tuple[int, int], Set[int]] = {}
+        self._media: Dict[int, int] = {}
+        self._next_key = 0
+        self._last_text: Optional[Tuple[Optional[str], Optional[int]]] = None
+        self.metrics: Dict[str, int] = {"unique": 0, "duplicates": 0}
+
+        bands = self.max_distance + 1
+        width = _BITS // bands
+        self._band_shifts = [(index * width, width if index < bands - 1 else _BITS - index * width)
+                             for index in range(bands)]
+
+    def _band_keys(self, fingerprint: int) -> List[Tuple[int, int]]:
+        return [(index, fingerprint >> shift & ((1 << width) - 1))
+                for index, (shift, width) in enumerate(self._band_shifts)]
+
+    def _evict(self, now: float):
+        """Удаляет устаревшие посты и самые старые при переполнении"""
+        while self._entries:
+            key, entry = next(iter(self._entries.items()))
+            if len(self._entries) <= self.max_entries and now - entry.added <= self.window:
+                break
+            self._entries.popitem(last=False)
+            if entry.fingerprint is not None:
+                for band_key in self._band_keys(entry.fingerprint):
+                    bucket = self._bands.get(band_key)
+                    if bucket is not None:
+                        bucket.discard(key)
+                        if not bucket:
+                            del self._bands[band_key]
+            for media_id in entry.media:
+                if self._media.get(media_id) == key:
+                    del self._media[media_id]
+
+    def _find(self, fingerprint: Optional[int], media: Tuple[int, ...]) -> Optional[_Entry]:
+        for media_id in media:
+            key = self._media.get(media_id)
+            if key is not None:
+                return self._entries[key]
+
+        if fingerprint is None:
+            return None
+        for band_key in self._band_keys(fingerprint):
+            for key in self._bands.get(band_key, ()):
+                entry = self._entries[key]
+                if bin(entry.fingerprint ^ fingerprint).count('1') <= self.max_distance:
+                    return entry
+        return None
+
+    def _fingerprint(self, text: Optional[str]) -> Optional[int]:
+        """SimHash текста или None, если текст слишком короткий (последний результат запоминается)"""
+        if self._last_text is not None and self._last_text[0] == text:
+            return self._last_text[1]
+        words = len(_WORD_RE.findall(text)) if text else 0
+        fingerprint = simhash(_shingles(text)) if text and self.max_distance and words >= self.min_words else None
+        self._last_text = (text, fingerprint)
+        return fingerprint
+
+    def check(self, chat_id: int, chat_title: str, message_id: int,
+              text: Optional[str], media: Iterable[int] = ()) -> Optional[_Entry]:
+        """
+        Ищет недавний пост с тем же содержанием.
+
+        Если копия найдена, возвращает запись оригинала (с дописанным
+        каналом в also_in), иначе None. Сам пост не запоминается: это делает
+        add, когда пост принят к доставке. Повтор того же сообщения
+        (например, при догрузке) дублем не считается.
+        """
+        self._evict(time.monotonic())
+
+        media = tuple(media)
+        fingerprint = self._fingerprint(text)
+        if fingerprint is None and not media:
+            return None
+
+        original = self._find(fingerprint, media)
+        if original is None or (original.chat_id, original.message_id) == (chat_id, message_id):
+            return None
+        if chat_title not in original.also_in:
+            original.also_in.append(chat_title)
+        self.metrics["duplicates"] += 1
+        return original
+
+    def add(self, chat_id: int, chat_title: str, message_id: int,
+            text: Optional[str], media: Iterable[int] = ()):
+        """Запоминает пост, принятый к доставке, чтобы находить его копии"""
+        now = time.monotonic()
+        self._evict(now)
+
+        media = tuple(media)
+        fingerprint = self._fingerprint(text)
+        if fingerprint is None and not media:
+            return
+
+        original = self._find(fingerprint, media)
+        if original is not None and (original.chat_id, original.message_id) == (chat_id, message_id):
+            return
+
+        key = self._next_key
+        self._next_key += 1
+        self._entries[key] = _Entry(chat_id, chat_title, message_id, now, fingerprint, media)
+        if fingerprint is not None:
+            for band_key in self._band_keys(fingerprint):
+                self._bands.setdefault(band_key, set()).add(key)
+        for media_id in media:
+            self._media.setdefault(media_id, key)
+        self.metrics["unique"] += 1
+        self._evict(now)
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+
+duplicates = DuplicateIndex()
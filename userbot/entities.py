@@ -0,0 +1,150 @@
+from html import escape
+from typing import Callable, List, Optional, Tuple
+
+from telethon.tl.types import (
+    MessageEntityBold, MessageEntityItalic, MessageEntityCode, MessageEntityPre,
+    MessageEntityTextUrl, MessageEntityUrl, MessageEntityMention,
+    MessageEntityStrike, MessageEntityBlockquote
+)
+
+# Сущность, готовая к выводу: (начало, конец, порядковый номер, открывающий тег, имя тега)
+_Span = Tuple[int, int, int, str, str]
+
+
+def _utf16_index(text: str) -> Callable[[int], int]:
+    """
+    Возвращает функцию перевода UTF-16 offset (как в entities Telegram)
+    в индекс символа строки Python.
+
+    Таблица соответствия строится один раз на весь текст. Если в тексте нет
+    символов вне BMP (эмодзи и т.п.), offset совпадает с индексом.
+    """
+    utf16_length = len(text.encode('utf-16-le')) // 2
+    if utf16_length == len(text):
+        return lambda offset: offset
+
+    # table[k] - индекс символа, с которого начинается k-я кодовая единица UTF-16
+    table: List[int] = []
+    for index, char in enumerate(text):
+        table.append(index)
+        if ord(char) > 0xFFFF:
+            # Вторая половина суррогатной пары указывает на следующий символ
+            table.append(index + 1)
+    table.append(len(text))
+
+    def to_index(offset: int) -> int:
+        if offset < 0:
+            return offset
+        if offset >= len(table):
+            return len(text)
+        return table[offset]
+
+    return to_index
+
+
+def _entity_tag(entity, entity_text: str) -> Optional[Tuple[str, str]]:
+    """Возвращает открывающий тег и имя тега для сущности или None, если сущность не размечаем"""
+    if isinstance(entity, MessageEntityBold):
+        return '<b>', 'b'
+    elif isinstance(entity, MessageEntityItalic):
+        return '<i>', 'i'
+    elif isinstance(entity, MessageEntityCode):
+        return '<code>', 'code'
+    elif isinstance(entity, MessageEntityPre):
+        language = getattr(entity, 'language', '')
+        if language:
+            return f'<pre language="{escape(language)}">', 'pre'
+        return '<pre>', 'pre'
+    elif isinstance(entity, MessageEntityTextUrl):
+        if entity.url:
+            return f'<a href="{escape(entity.url)}">', 'a'
+    elif isinstance(entity, MessageEntityUrl):
+        return f'<a href="{escape(entity_text)}">', 'a'
+    elif isinstance(entity, MessageEntityMention):
+        if entity_text.startswith('@') and len(entity_text) > 1:
+            return f'<a href="https://t.me/{entity_text[1:]}">', 'a'
+    elif isinstance(entity, MessageEntityStrike):
+        return '<s>', 's'
+    elif isinstance(entity, MessageEntityBlockquote):
+        return '<blockquote>', 'blockquote'
+
+    return None
+
+
+def entities_to_html(text: str, entities) -> str:
+    """
+    Применяет HTML разметку к тексту на основе entities от Telegram.
+
+    Теги выводятся за один проход по границам сущностей со стеком открытых
+    тегов: если сущность заканчивается внутри другой, вложенные теги
+    закрываются и открываются заново, поэтому результат всегда корректно
+    вложен и не требует исправления HTML парсером.
+    """
+    if not text:
+        return ""
+
+    # Если нет сущностей, просто экранируем текст
+    if not entities:
+        return escape(text)
+
+    to_index = _utf16_index(text)
+    length = len(text)
+
+    spans: List[_Span] = []
+    for order, entity in enumerate(entities):
+        start = to_index(entity.offset)
+        end = to_index(entity.offset + entity.length)
+
+        # Проверяем корректность позиций
+        if start >= length or end > length or start < 0 or end <= start:
+            continue
+
+        tag = _entity_tag(entity, text[start:end])
+        if tag:
+            spans.append((start, end, order, tag[0], tag[1]))
+
+    if not spans:
+        return escape(text)
+
+    # На одной позиции первой открывается более длинная сущность - она будет внешней
+    spans.sort(key=lambda span: (span[0], -span[1], span[2]))
+    boundaries = sorted({span[0] for span in spans} | {span[1] for span in spans})
+
+    result_parts: List[str] = []
+    stack: List[_Span] = []
+    next_span = 0
+    last_pos = 0
+
+    for pos in boundaries:
+        # Добавляем текст между границами
+        if pos > last_pos:
+            result_parts.append(escape(text[last_pos:pos]))
+            last_pos = pos
+
+        # Закрываем сущности, которые заканчиваются здесь. Если над ними в стеке
+        # есть более длинные сущности, закрываем и их, а потом открываем заново
+        closing = sum(1 for span in stack if span[1] == pos)
+        reopen: List[_Span] = []
+        while closing:
+            span = stack.pop()
+            result_parts.append(f'</{span[4]}>')
+            if span[1] == pos:
+                closing -= 1
+            else:
+                reopen.append(span)
+        for span in reversed(reopen):
+            result_parts.append(span[3])
+            stack.append(span)
+
+        # Открываем сущности, которые начинаются здесь
+        while next_span < len(spans) and spans[next_span][0] == pos:
+            span = spans[next_span]
+            result_parts.append(span[3])
+            stack.append(span)
+            next_span += 1
+
+    # Добавляем оставшийся текст после последнего тега
+    if last_pos < length:
+        result_parts.append(escape(text[last_pos:]))
+
+    return ''.join(result_parts)
@@ -0,0 +1,82 @@
+import re
+from typing import Dict, Iterable, Optional, Pattern
+
+from telethon import utils
+
+from config import (FILTER_ALLOW_CHATS, FILTER_DENY_CHATS, FILTER_INCLUDE_WORDS,
+                    FILTER_EXCLUDE_WORDS, FILTER_CONTENT_TYPES)
+
+
+def _chat_ids(values: Iterable[int]) -> frozenset:
+    """Приводит ID чатов к виду chat.id (без префикса -100)"""
+    return frozenset(utils.resolve_id(value)[0] if value < 0 else value for value in values)
+
+
+def _compile_words(words: Iterable[str]) -> Optional[Pattern]:
+    """
+    Собирает ключевые слова в одно регулярное выражение.
+
+    Длинные слова идут первыми, чтобы альтернатива не останавливалась
+    на более коротком префиксе. Поиск по подстроке без учета регистра,
+    поэтому "выбор" найдет и "выборы", и "Выборах".
+    """
+    words = sorted({word.lower() for word in words}, key=len, reverse=True)
+    if not words:
+        return None
+    return re.compile("|".join(re.escape(word) for word in words), re.IGNORECASE)
+
+
+class SourceFilter:
+    """
+    Правила отбора сообщений из каналов.
+
+    Проверка чата выполняется один раз при построении ChatMeta (результат
+    кэшируется вместе с метаданными), проверка сообщения - до рендеринга
+    HTML, скачивания медиа и записи в БД.
+    """
+
+    def __init__(self, allow_chats: Iterable[int] = (), deny_chats: Iterable[int] = (),
+                 include_words: Iterable[str] = (), exclude_words: Iterable[str] = (),
+                 content_types: Iterable[str] = ()):
+        self.allow_chats = _chat_ids(allow_chats)
+        self.deny_chats = _chat_ids(deny_chats)
+        self.include = _compile_words(include_words)
+        self.exclude = _compile_words(exclude_words)
+        self.content_types = frozenset(content_types)
+        self.metrics: Dict[str, int] = {
+            "chat_denied": 0,  # Чаты, отсеянные по списку
+            "content_type": 0,  # Сообщения с неразрешенным типом контента
+            "keywords": 0,  # Сообщения, отсеянные по ключевым словам
+        }
+
+    def chat_allowed(self, chat_id: int) -> bool:
+        """Проверяет чат по спискам разрешенных и запрещенных (chat_id без префикса -100)"""
+        allowed = chat_id not in self.deny_chats and (not self.allow_chats or chat_id in self.allow_chats)
+        if not allowed:
+            self.metrics["chat_denied"] += 1
+        return allowed
+
+    def message_allowed(self, text: Optional[str], content_type: str) -> bool:
+        """Проверяет сообщение по типу контента и ключевым словам (text - текст без разметки)"""
+        if self.content_types and content_type not in self.content_types:
+            self.metrics["content_type"] += 1
+            return False
+
+        if self.include is None and self.exclude is None:
+            return True
+
+        text = text or ''
+        if (self.include is not None and not self.include.search(text)) or \
+                (self.exclude is not None and self.exclude.search(text)):
+            self.metrics["keywords"] += 1
+            return False
+        return True
+
+
+source_filter = SourceFilter(
+    allow_chats=FILTER_ALLOW_CHATS,
+    deny_chats=FILTER_DENY_CHATS,
+    include_words=FILTER_INCLUDE_WORDS,
+    exclude_words=FILTER_EXCLUDE_WORDS,
+    content_types=FILTER_CONTENT_TYPES,
+)
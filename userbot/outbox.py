@@ -0,0 +1,89 @@
+import asyncio
+from collections import defaultdict
+from typing import Awaitable, Callable, Dict, Optional
+
+from config import OUTBOX_BATCH_SIZE, OUTBOX_POLL_INTERVAL
+from db.outbox import claim_deliveries, complete_deliveries, release_claims
+from logger import logger
+
+# Отправка поста админам: (post_id, захваты admin_id -> attempts) -> ошибки по админам
+Handler = Callable[[int, Dict[int, int]], Awaitable[Dict[int, str]]]
+
+_task: Optional[asyncio.Task] = None
+
+# Метрики обработчика outbox
+_metrics: Dict[str, int] = {
+    "claimed": 0,  # Забрано доставок из outbox
+    "sent": 0,  # Доставлено при повторной отправке
+    "retried": 0,  # Отложено для следующей попытки
+    "failed": 0,  # Окончательно не доставлено
+}
+
+
+async def _process_post(handler: Handler, post_id: int, claims: Dict[int, int]):
+    """Отправляет один пост и записывает результат в outbox"""
+    try:
+        errors = await handler(post_id, claims)
+    except Exception as e:
+        logger.error(f"Ошибка повторной доставки поста {post_id}: {e}")
+        logger.exception(f"Полная трассировка ошибки: ")
+        errors = {admin_id: str(e) or type(e).__name__ for admin_id in claims}
+
+    failed = await complete_deliveries(post_id, claims, errors)
+    _metrics["sent"] += len(claims) - len(errors)
+    _metrics["retried"] += len(errors) - failed
+    _metrics["failed"] += failed
+    if failed:
+        logger.error(f"Пост {post_id} не доставлен {failed} админам после всех попыток")
+
+
+async def _drain(handler: Handler):
+    """Забирает из outbox доставки, которые пора отправить, пачками по OUTBOX_BATCH_SIZE"""
+    while True:
+        try:
+            rows = await claim_deliveries(OUTBOX_BATCH_SIZE)
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            logger.error(f"Ошибка чтения outbox: {e}")
+            rows = []
+
+        if not rows:
+            await asyncio.sleep(OUTBOX_POLL_INTERVAL)
+            continue
+
+        _metrics["claimed"] += len(rows)
+        by_post: Dict[int, Dict[int, int]] = defaultdict(dict)
+        for row in rows:
+            by_post[row.post_id][row.admin_id] = row.attempts
+
+        logger.info(f"Повторная доставка {len(rows)} сообщений ({len(by_post)} постов) из outbox")
+        await asyncio.gather(*(_process_post(handler, post_id, claims) for post_id, claims in by_post.items()))
+
+
+async def start_outbox(handler: Handler):
+    """
+    Запускает обработчик outbox.
+
+    Доставки, оставшиеся в 'sending' от прошлого запуска, возвращаются
+    в очередь, поэтому вызывать нужно до запуска воркеров доставки.
+    """
+    global _task
+    if _task and not _task.done():
+        return
+    released = await release_claims()
+    if released:
+        logger.info(f"Возвращено в очередь незавершенных доставок: {released}")
+    _task = asyncio.create_task(_drain(handler), name="outbox")
+
+
+async def stop_outbox():
+    """Останавливает обработчик outbox"""
+    if _task:
+        _task.cancel()
+        await asyncio.gather(_task, return_exceptions=True)
+
+
+def get_metrics() -> Dict[str, int]:
+    """Возвращает метрики обработчика outbox"""
+    return dict(_metrics)
@@ -0,0 +1,122 @@
+import asyncio
+import time
+from dataclasses import dataclass, field
+from datetime import datetime
+from typing import Any, Awaitable, Callable, Dict, List, Optional
+
+from config import INGEST_QUEUE_SIZE, DELIVERY_WORKERS, INGEST_PUT_TIMEOUT
+from logger import logger
+
+
+@dataclass
+class IncomingPost:
+    """Нормализованное сообщение из канала, готовое к доставке админам"""
+    chat_id: int
+    chat_title: str
+    chat_type: str  # 'channel' или 'group'
+    header: str  # Заголовок с названием канала (HTML)
+    message_id: int
+    content_type: str  # 'text', 'photo', 'video', 'document', 'audio', 'voice', 'media_group'
+    text: str  # Текст сообщения с HTML разметкой
+    original_date: Optional[datetime]
+    message: Any = None  # Исходное сообщение Telethon (нужно для скачивания медиа)
+    grouped_id: Optional[int] = None  # ID медиагруппы
+    album: List[Any] = field(default_factory=list)  # Части медиагруппы (сообщения Telethon)
+    file_id: Optional[str] = None  # Уже загруженный в Telegram файл (повторная доставка)
+    media: Optional[List[dict]] = None  # Уже загруженные части медиагруппы (повторная доставка)
+    enqueued_at: float = field(default_factory=time.monotonic)
+
+
+# Очередь создается лениво внутри работающего event loop
+_queue: Optional[asyncio.Queue] = None
+_workers: List[asyncio.Task] = []
+
+# Метрики конвейера
+_metrics: Dict[str, float] = {
+    "enqueued": 0,  # Поставлено в очередь
+    "processed": 0,  # Успешно обработано воркерами
+    "failed": 0,  # Завершилось ошибкой в воркере
+    "dropped": 0,  # Отброшено из-за переполнения очереди
+    "max_depth": 0,  # Максимальная наблюдавшаяся глубина очереди
+    "last_wait": 0.0,  # Время ожидания в очереди последнего сообщения (сек)
+}
+
+
+def _get_queue() -> asyncio.Queue:
+    global _queue
+    if _queue is None:
+        _queue = asyncio.Queue(maxsize=INGEST_QUEUE_SIZE)
+    return _queue
+
+
+async def enqueue(item: IncomingPost) -> bool:
+    """
+    Ставит сообщение в очередь доставки.
+
+    Если очередь заполнена, ждет свободного места не дольше INGEST_PUT_TIMEOUT
+    секунд (backpressure для обработчика Telethon), после чего сообщение
+    отбрасывается. Возвращает True, если сообщение принято в очередь.
+    """
+    queue = _get_queue()
+    try:
+        await asyncio.wait_for(queue.put(item), timeout=INGEST_PUT_TIMEOUT)
+    except asyncio.TimeoutError:
+        _metrics["dropped"] += 1
+        logger.error(f"Очередь доставки переполнена, сообщение {item.chat_id}/{item.message_id} отброшено")
+        return False
+
+    _metrics["enqueued"] += 1
+    depth = queue.qsize()
+    if depth > _metrics["max_depth"]:
+        _metrics["max_depth"] = depth
+    if depth >= queue.maxsize * 0.8:
+        logger.warning(f"Очередь доставки заполнена на {depth}/{queue.maxsize}")
+    return True
+
+
+async def _worker(name: str, handler: Callable[[IncomingPost], Awaitable[None]]):
+    """Воркер доставки: забирает сообщения из очереди и передает их обработчику"""
+    queue = _get_queue()
+    while True:
+        item = await queue.get()
+        try:
+            _metrics["last_wait"] = time.monotonic() - item.enqueued_at
+            await handler(item)
+            _metrics["processed"] += 1
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            _metrics["failed"] += 1
+            logger.error(f"[{name}] Ошибка доставки сообщения {item.chat_id}/{item.message_id}: {e}")
+            logger.exception(f"Полная трассировка ошибки: ")
+        finally:
+            queue.task_done()
+
+
+def start_workers(handler: Callable[[IncomingPost], Awaitable[None]], count: int = DELIVERY_WORKERS):
+    """Запускает пул воркеров доставки"""
+    if _workers:
+        return
+    for i in range(count):
+        name = f"delivery-{i}"
+        _workers.append(asyncio.create_task(_worker(name, handler), name=name))
+    logger.info(f"Запущено воркеров доставки: {count}")
+
+
+async def stop_workers():
+    """Останавливает пул воркеров доставки"""
+    for task in _workers:
+        task.cancel()
+    await asyncio.gather(*_workers, return_exceptions=True)
+    _workers.clear()
+
+
+def get_metrics() -> Dict[str, float]:
+    """Возвращает метрики конвейера вместе с текущей глубиной очереди"""
+    queue = _get_queue()
+    return {
+        **_metrics,
+        "depth": queue.qsize(),
+        "capacity": queue.maxsize,
+        "workers": len(_workers),
+    }
@@ -0,0 +1,171 @@
+import asyncio
+import random
+import time
+from typing import Any, Dict, Optional
+
+from telethon.tl.functions.updates import GetStateRequest
+
+from config import SUPERVISOR_INTERVAL, SUPERVISOR_PROBE_TIMEOUT, RECONNECT_BASE_DELAY, RECONNECT_MAX_DELAY
+from logger import logger
+from userbot.TGClient import client
+from userbot.backfill import run_backfill
+
+_task: Optional[asyncio.Task] = None
+_backfill_task: Optional[asyncio.Task] = None
+
+# Состояние подключения
+_state: Dict[str, Any] = {
+    "connected": False,  # Последняя проверка прошла успешно
+    "probes": 0,  # Всего проверок
+    "disconnects": 0,  # Сколько раз подключение было потеряно
+    "reconnects": 0,  # Успешные переподключения
+    "failed_attempts": 0,  # Неудачные попытки переподключения
+    "down_since": None,  # time.monotonic() момента потери подключения
+    "last_downtime": 0.0,  # Длительность последнего простоя (сек)
+    "total_downtime": 0.0,  # Суммарное время без подключения (сек)
+}
+
+
+def _backoff(attempt: int) -> float:
+    """Пауза перед попыткой attempt: экспоненциальный рост и случайный разброс (equal jitter)"""
+    delay = min(RECONNECT_MAX_DELAY, RECONNECT_BASE_DELAY * 2 ** attempt)
+    return delay / 2 + random.uniform(0, delay / 2)
+
+
+async def _probe(tg_client) -> bool:
+    """Проверяет, что клиент подключен и сервер отвечает на запрос"""
+    if not tg_client.is_connected():
+        return False
+    try:
+        await asyncio.wait_for(tg_client(GetStateRequest()), timeout=SUPERVISOR_PROBE_TIMEOUT)
+        return True
+    except asyncio.CancelledError:
+        raise
+    except Exception as e:
+        logger.warning(f"Проверка подключения Telethon не прошла: {e}")
+        return False
+
+
+async def _reconnect(tg_client) -> bool:
+    """
+    Переподключает клиент, пока не получится.
+
+    Между попытками пауза растет экспоненциально. Возвращает False,
+    если сессия больше не авторизована и переподключаться бессмысленно.
+    """
+    attempt = 0
+    while True:
+        try:
+            # Соединение могло зависнуть: is_connected() True, а запросы не проходят
+            if tg_client.is_connected():
+                await tg_client.disconnect()
+            await tg_client.connect()
+            if not await tg_client.is_user_authorized():
+                logger.error("Сессия Telethon не авторизована, переподключение остановлено")
+                return False
+            if await _probe(tg_client):
+                return True
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            logger.error(f"Ошибка переподключения: {e}")
+
+        _state["failed_attempts"] += 1
+        delay = _backoff(attempt)
+        attempt += 1
+        logger.info(f"Повторная попытка переподключения Telethon через {delay:.1f} сек (попытка {attempt})")
+        await asyncio.sleep(delay)
+
+
+def _mark_down():
+    if _state["down_since"] is None:
+        _state["down_since"] = time.monotonic()
+        _state["disconnects"] += 1
+    _state["connected"] = False
+
+
+def _mark_up():
+    if _state["down_since"] is not None:
+        downtime = time.monotonic() - _state["down_since"]
+        _state["last_downtime"] = downtime
+        _state["total_downtime"] += downtime
+        _state["down_since"] = None
+    _state["connected"] = True
+
+
+async def _wait_next_probe(tg_client):
+    """
+    Ждет SUPERVISOR_INTERVAL секунд или обрыва соединения, если он наступит раньше
+
+    Автопереподключение Telethon выключено (create_client), поэтому обрыв
+    обрабатывает только наблюдатель - сразу, не дожидаясь следующей проверки.
+    """
+    if tg_client is None or not tg_client.is_connected():
+        await asyncio.sleep(SUPERVISOR_INTERVAL)
+        return
+    try:
+        await asyncio.wait_for(tg_client.disconnected, timeout=SUPERVISOR_INTERVAL)
+    except asyncio.CancelledError:
+        raise
+    except Exception:
+        # Таймаут (соединение живо) или обрыв с ошибкой - дальше решит проверка
+        pass
+
+
+def _start_catch_up(tg_client):
+    """Догружает сообщения, пропущенные за время простоя"""
+    global _backfill_task
+    if _backfill_task and not _backfill_task.done():
+        return
+    _backfill_task = asyncio.create_task(run_backfill(tg_client), name="backfill")
+
+
+async def _supervise():
+    """
+    Периодически проверяет подключение Telethon и восстанавливает его
+
+    Это единственное место переподключения: у клиента auto_reconnect=False.
+    """
+    while True:
+        tg_client = client()
+        if tg_client is not None:
+            _state["probes"] += 1
+            if await _probe(tg_client):
+                _mark_up()
+            else:
+                _mark_down()
+                logger.warning("Подключение Telethon потеряно, переподключаемся")
+                if not await _reconnect(tg_client):
+                    return
+                _mark_up()
+                _state["reconnects"] += 1
+                logger.info(f"Telethon переподключен, простой {_state['last_downtime']:.1f} сек")
+                _start_catch_up(tg_client)
+
+        await _wait_next_probe(tg_client)
+
+
+def start_supervisor():
+    """Запускает фоновое наблюдение за подключением Telethon"""
+    global _task
+    if _task and not _task.done():
+        return
+    _task = asyncio.create_task(_supervise(), name="telethon-supervisor")
+    logger.info("Запущено наблюдение за подключением Telethon")
+
+
+async def stop_supervisor():
+    """Останавливает наблюдение и догрузку после переподключения"""
+    for task in (_task, _backfill_task):
+        if task:
+            task.cancel()
+    await asyncio.gather(*(task for task in (_task, _backfill_task) if task), return_exceptions=True)
+
+
+def get_state() -> Dict[str, Any]:
+    """Возвращает состояние подключения вместе с текущей длительностью простоя"""
+    down_since = _state["down_since"]
+    return {
+        **_state,
+        "current_downtime": time.monotonic() - down_since if down_since is not None else 0.0,
+    }
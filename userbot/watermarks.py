@@ -0,0 +1,59 @@
+from typing import Dict, Set, Tuple
+
+from db.channels import mark_skipped
+from logger import logger
+from userbot.chat_cache import ChatMeta
+
+# Сообщения, принятые к доставке, но еще не сохраненные в posts: chat_id -> {message_id}
+_inflight: Dict[int, Set[int]] = {}
+
+# Отсеянные сообщения, отметку которых задерживают более ранние
+# несохраненные: chat_id -> (название, тип чата, message_id)
+_deferred: Dict[int, Tuple[str, str, int]] = {}
+
+
+def started(chat_id: int, message_id: int):
+    """Отмечает сообщение, принятое к доставке (до постановки в очередь)"""
+    _inflight.setdefault(chat_id, set()).add(message_id)
+
+
+async def finished(chat_id: int, message_id: int):
+    """Отмечает, что сообщение сохранено в posts или так и не попало в очередь"""
+    inflight = _inflight.get(chat_id)
+    if inflight is not None:
+        inflight.discard(message_id)
+        if not inflight:
+            del _inflight[chat_id]
+    await _flush(chat_id)
+
+
+async def skipped(meta: ChatMeta, message_id: int):
+    """
+    Отмечает сообщение, которое не сохраняется в posts (отсеяно или копия)
+
+    Отметка записывается в channels.last_message_id, только когда все более
+    ранние принятые сообщения чата уже сохранены: иначе после падения
+    догрузка начала бы с отсеянного сообщения и потеряла бы их.
+    """
+    deferred = _deferred.get(meta.chat_id)
+    if deferred is None or deferred[2] < message_id:
+        _deferred[meta.chat_id] = (meta.title, meta.chat_type, message_id)
+    await _flush(meta.chat_id)
+
+
+async def _flush(chat_id: int):
+    """Записывает отложенную отметку чата, если ее больше ничто не держит"""
+    deferred = _deferred.get(chat_id)
+    if deferred is None:
+        return
+    inflight = _inflight.get(chat_id)
+    if inflight and min(inflight) < deferred[2]:
+        return
+
+    del _deferred[chat_id]
+    title, chat_type, message_id = deferred
+    try:
+        await mark_skipped(chat_id, title, chat_type, message_id)
+    except Exception as e:
+        # Без отметки догрузка просто перечитает эти сообщения
+        logger.error(f"Не удалось сохранить последнее отсеянное сообщение чата {chat_id}: {e}")